@@ -180,7 +180,8 @@ class GeoModel(models.AbstractModel):
             * geo_touch
             * geo_within
             * geo_contains
-            * geo_intersect"""
+            * geo_intersect
+            * geo_bbox"""
         # First we do a standard search in order to apply security rules
         # and do a search on standard attributes
         # Limit and offset are managed after, we may loose a lot of performance
@@ -190,3 +191,18 @@ class GeoModel(models.AbstractModel):
         return geo_operators.geo_search(
             self, domain=domain, geo_domain=geo_domain,
             offset=offset, limit=limit, order=order)
+
+    @api.model
+    def geo_nearest(self, geo_field, value, domain=None, limit=10,
+                    max_distance=None, bbox=None, srid=None,
+                    with_distance=False):
+        """Return the ids of the records nearest to a geometry, nearest first,
+           using the GiST index of the geo field, optionally with their
+           distances: see `geo_operators.geo_nearest`
+           geo_nearest(
+               'the_point', 'POINT(121.47 31.23)', limit=20, srid=4326,
+               with_distance=True)"""
+        return geo_operators.geo_nearest(
+            self, geo_field, value, domain=domain, limit=limit,
+            max_distance=max_distance, bbox=bbox, srid=srid,
+            with_distance=with_distance)
@@ -43,6 +43,7 @@ def geo_search(model, domain=None, geo_domain=None, offset=0,
      * geo_within
      * geo_contains
      * geo_intersect
+     * geo_bbox
     """
     cr = model._cr
     domain = domain or []
@@ -124,6 +125,76 @@ def geo_search(model, domain=None, geo_domain=None, offset=0,
         return []
 
 
+def geo_nearest(model, geo_field, value, domain=None, limit=10,
+                max_distance=None, bbox=None, srid=None, with_distance=False):
+    """Return the records nearest to a geometry, nearest first, using the
+    GiST index of the geo field (PostGIS <-> ordering), e.g. the 20 shops
+    nearest to a point:
+    geo_nearest(
+        'the_point', 'POINT(121.47 31.23)', domain=[('is_shop', '=', True)],
+        limit=20, srid=4326, with_distance=True)
+
+    :param geo_field: name of the geo field to search on
+    :param value: geometry to search around, as a shapely object, WKT or
+                  GeoJSON
+    :param domain: standard domain the records must match
+    :param limit: maximum number of records
+    :param max_distance: maximum distance to the geometry
+    :param bbox: (xmin, ymin, xmax, ymax) box the records must intersect
+                 (&& operator, bounding boxes only)
+    :param srid: SRID of value and bbox, the SRID of the field by default
+    :param with_distance: also return the distances
+    :return: list of ids, or of (id, distance) with with_distance.
+             Distances are in the units of the SRID of the field (meters
+             of the Web Mercator projection for the default SRID 3857,
+             stretched far from the equator)
+    """
+    field = model._fields[geo_field]
+    if not isinstance(field, GeoField):
+        raise ValueError('Field %s is not a geo field' % (field,))
+    cr = model._cr
+    model.env['ir.model.access'].check(model._name, 'read')
+    query = model._where_calc(domain or [], active_test=True)
+    model._apply_ir_rules(query, 'read')
+    from_clause, where_clause, where_clause_params = query.get_sql()
+
+    column = '"%s"."%s"' % (model._table, geo_field)
+    if srid and srid != field.srid:
+        point_sql = 'ST_Transform(ST_GeomFromText(%%s, %d), %d)' % (
+            srid, field.srid)
+        bbox_sql = 'ST_Transform(ST_MakeEnvelope(%%s, %%s, %%s, %%s, %d), ' \
+                   '%d)' % (srid, field.srid)
+    else:
+        point_sql = 'ST_GeomFromText(%%s, %d)' % (field.srid,)
+        bbox_sql = 'ST_MakeEnvelope(%%s, %%s, %%s, %%s, %d)' % (field.srid,)
+    wkt = field.entry_to_shape(value, same_type=False).wkt
+
+    select_params = []
+    distance_sql = ''
+    if with_distance:
+        distance_sql = ', ST_Distance(%s, %s)' % (column, point_sql)
+        select_params.append(wkt)
+    where_clause_arr = ['%s IS NOT NULL' % column]
+    if where_clause:
+        where_clause_arr.append(where_clause)
+    geo_params = []
+    if bbox:
+        where_clause_arr.append('%s && %s' % (column, bbox_sql))
+        geo_params += list(bbox)
+    if max_distance is not None:
+        where_clause_arr.append(
+            'ST_DWithin(%s, %s, %%s)' % (column, point_sql))
+        geo_params += [wkt, max_distance]
+    sql = 'SELECT "%s".id%s FROM %s WHERE %s ORDER BY %s <-> %s LIMIT %%s' % (
+        model._table, distance_sql, from_clause,
+        ' AND '.join(where_clause_arr), column, point_sql)
+    cr.execute(sql, select_params + where_clause_params + geo_params +
+               [wkt, limit])
+    if with_distance:
+        return cr.fetchall()
+    return [row[0] for row in cr.fetchall()]
+
+
 class GeoOperator(object):
 
     def __init__(self, geo_field):
@@ -223,6 +294,20 @@ class GeoOperator(object):
                                           rel_col, rel_model,
                                           op='ST_Within')
 
+    def get_geo_bbox_sql(self, table, col, value, rel_col=None,
+                         rel_model=None):
+        """Returns raw sql for geo_bbox operator
+        (bounding boxes intersection only, fast prefiltering on the GiST
+        index)
+        """
+        if rel_col and rel_model is not None:
+            compare_to = self.get_rel_field(rel_col, rel_model)
+        else:
+            base = self.geo_field.entry_to_shape(value, same_type=False)
+            srid = self.geo_field.srid
+            compare_to = "ST_GeomFromText('%s',%s)" % (base.wkt, srid)
+        return " %s.%s && %s" % (table, col, compare_to)
+
     def get_geo_contains_sql(self, table, col, value, rel_col=None,
                              rel_model=None):
         """Returns raw sql for geo_contains operator
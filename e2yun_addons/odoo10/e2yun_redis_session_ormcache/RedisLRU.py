@@ -6,65 +6,175 @@
 #    license:'LGPL-3
 #
 ##############################################################################
-__all__ = ['RedisLRU']
+__all__ = ['RedisLRU', 'InvalidationListener']
 
-import types
+import hashlib
+import logging
+import os
 import pickle
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+from odoo.tools.lru import LRU
+
+_logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'ormcache:'
 
-def to_str(obj):
-    if isinstance(obj,tuple) or isinstance(obj,list)or isinstance(obj,frozenset)or isinstance(obj,set) \
-            or isinstance(obj, enumerate) :
-        return '['+",".join(to_str(i) for i in obj)+']'
-    elif isinstance(obj,dict):
-        return '{' + ",".join(to_str(kv) for kv in obj.items()) + '}'
-    else:
-        return str(obj)
 
+def to_bytes(obj):
+    """ Canonical bytes of a cache key, the same in every worker whatever
+        the iteration order of sets and dicts. """
+    if isinstance(obj, (tuple, list)):
+        return b'(' + b','.join(to_bytes(i) for i in obj) + b')'
+    elif isinstance(obj, (set, frozenset)):
+        return b'{' + b','.join(sorted(to_bytes(i) for i in obj)) + b'}'
+    elif isinstance(obj, dict):
+        return b'<' + b','.join(sorted(to_bytes(k) + b':' + to_bytes(v) for k, v in obj.items())) + b'>'
+    res = repr(obj)
+    if not isinstance(res, bytes):
+        res = res.encode('utf-8')
+    return res
 
 
 class RedisLRU(object):
+    """ ormcache stored in Redis, with an in-process LRU (L1) in front of it.
 
-    def __init__(self, redis, namespace):
+        Redis keys are ``<namespace>:<generation>:<sha1 of the key>``. The
+        generation is cached in the process: L1 entries are valid while it
+        does not change, so a L1 hit costs no network round-trip. The
+        generation is read again by sync(), on each request (see
+        registry.py) and at most every ``sync_interval`` seconds otherwise.
+
+        With a listener, new generations and database signaling are pushed
+        on the channel ``ormcache:<namespace>`` and nothing is polled while
+        the listener is subscribed.
+    """
+
+    def __init__(self, redis, namespace, l1_size=8192, ttl=0, sync_interval=1.0, listener=None):
         self.redis = redis
         self.namespace = namespace
+        self.generation_key = namespace + '_generation'
+        self.channel = CHANNEL_PREFIX + namespace
+        self.ttl = int(ttl or 0)
+        self.sync_interval = float(sync_interval or 0)
+        self.l1 = LRU(l1_size) if l1_size else None
+        self._lock = threading.RLock()
+        self._prefix = b''
+        self._synced_at = 0
         self.namespace_generation = 0
-        version = self.redis.execute_command( "eval", "return redis.call('get','" + self.namespace + "_generation')", 0)
-        if not version:
-            self.redis.execute_command( "eval", "return redis.call('incr','" + self.namespace + "_generation')", 0)
+        self._local = threading.local()
+        self.signaled = True
+        self.listener = listener
+
+        self.redis.setnx(self.generation_key, 1)
+        self._set_generation(int(self.redis.get(self.generation_key) or 0))
+        if listener is not None:
+            listener.subscribe(self.channel, self._on_message)
+
+    # Generation
+
+    def _set_generation(self, generation):
+        with self._lock:
+            self._synced_at = time.time()
+            if generation != self.namespace_generation:
+                self.namespace_generation = generation
+                self._prefix = ('%s:%s:' % (self.namespace, generation)).encode('utf-8')
+                if self.l1 is not None:
+                    self.l1.clear()
+
+    def sync(self, force=False):
+        """ Read the generation from Redis, drop L1 if it changed. """
+        if self.listening():
+            return
+        if not force and time.time() - self._synced_at < self.sync_interval:
+            return
+        self._set_generation(int(self.redis.get(self.generation_key) or 0))
+
+    # Push invalidation
+
+    def listening(self):
+        """ True when invalidation is pushed by the listener of this process. """
+        return self.listener is not None and self.listener.ensure()
+
+    def _on_message(self, data):
+        """ Called by the listener thread; data None means messages may have been lost. """
+        if data is None:
+            self._set_generation(int(self.redis.get(self.generation_key) or 0))
+            self.signaled = True
+        elif data.startswith(b'generation:'):
+            self._set_generation(int(data[11:]))
+        elif data == b'signaling':
+            self.signaled = True
+
+    def pop_signaled(self):
+        """ Whether database signaling must be checked, reset the flag. """
+        signaled, self.signaled = self.signaled, False
+        return signaled
+
+    def publish_signaling(self):
+        if self.listener is not None:
+            self.redis.publish(self.channel, b'signaling')
+
+    @contextmanager
+    def local_clear(self):
+        """ clear() only drops this worker's tier: the generation was already
+            bumped by the worker which signaled the invalidation. """
+        self._local.active = True
+        try:
+            yield
+        finally:
+            self._local.active = False
+
+    def _key(self, obj):
+        return self._prefix + hashlib.sha1(to_bytes(obj)).digest()
+
+    # Mapping
 
     def __contains__(self, obj):
-        key = to_str(obj)
-        return self.redis.execute_command( "eval",
-                                          "return redis.call('exists','" + self.namespace + "_'..redis.call('get','" + self.namespace + "_generation')..'" + key + "')",
-                                          0)
+        self.sync()
+        if self.l1 is not None and obj in self.l1:
+            return True
+        return bool(self.redis.exists(self._key(obj)))
 
     def __getitem__(self, obj):
-        key=to_str(obj)
+        self.sync()
+        if self.l1 is not None:
+            try:
+                return self.l1[obj]
+            except KeyError:
+                pass
+
         try:
-            res = self.redis.execute_command( "eval",
-                                          "return redis.call('get','" + self.namespace + "_'..redis.call('get','" + self.namespace + "_generation')..'" + key + "')",
-                                          0)
-            if res:
-                return pickle.loads(res)
-        except Exception, e:
+            res = self.redis.get(self._key(obj))
+            if res is not None:
+                res = pickle.loads(res)
+        except Exception as e:
             raise TypeError(e)
-        raise KeyError("None")
+        if res is None:
+            raise KeyError("None")
+
+        if self.l1 is not None:
+            self.l1[obj] = res
+        return res
 
     def __setitem__(self, obj, val):
         if isinstance(val, types.FunctionType):
             self.__delitem__(obj)
             return
-        key = to_str(obj)
-        jsonval=pickle.dumps(val)
-        self.redis.execute_command( "eval",
-                                    "return redis.call('set','" + self.namespace + "_'..redis.call('get','" + self.namespace + "_generation')..'" + key + "',KEYS[1])",
-                                    1, jsonval)
+        if self.l1 is not None:
+            self.l1[obj] = val
+        self.redis.set(self._key(obj), pickle.dumps(val, pickle.HIGHEST_PROTOCOL), ex=self.ttl or None)
 
     def __delitem__(self, obj):
-        key = to_str(obj)
-        self.redis.execute_command( "eval",
-                                   "return redis.call('del','" + self.namespace + "_'..redis.call('get','" + self.namespace + "_generation')..'" + key + "')",
-                                   0)
+        if self.l1 is not None:
+            try:
+                del self.l1[obj]
+            except KeyError:
+                pass
+        self.redis.delete(self._key(obj))
 
     def get(self, obj):
         return self.__getitem__(obj)
@@ -78,4 +188,106 @@ class RedisLRU(object):
         return res
 
     def clear(self):
-        self.redis.execute_command( "eval", "return redis.call('incr','" + self.namespace + "_generation')", 0)
+        if getattr(self._local, 'active', False):
+            self._set_generation(int(self.redis.get(self.generation_key) or 0))
+            return
+        generation = int(self.redis.incr(self.generation_key))
+        self._set_generation(generation)
+        if self.listener is not None:
+            self.redis.publish(self.channel, ('generation:%s' % generation).encode('utf-8'))
+
+    # Batch
+
+    def get_many(self, objs):
+        """ Values found for objs, L1 first then one MGET for the misses.
+            :return: dict obj: value
+        """
+        self.sync()
+        result = {}
+        missing = []
+        for obj in objs:
+            if self.l1 is not None:
+                try:
+                    result[obj] = self.l1[obj]
+                    continue
+                except KeyError:
+                    pass
+            missing.append(obj)
+
+        if missing:
+            for obj, res in zip(missing, self.redis.mget([self._key(obj) for obj in missing])):
+                if res is not None:
+                    result[obj] = val = pickle.loads(res)
+                    if self.l1 is not None:
+                        self.l1[obj] = val
+        return result
+
+    def set_many(self, values):
+        """ Store a dict obj: value with one pipelined round-trip. """
+        pipe = self.redis.pipeline(transaction=False)
+        for obj, val in values.items():
+            if self.l1 is not None:
+                self.l1[obj] = val
+            pipe.set(self._key(obj), pickle.dumps(val, pickle.HIGHEST_PROTOCOL), ex=self.ttl or None)
+        pipe.execute()
+
+
+class InvalidationListener(object):
+    """ Thread of the worker subscribed to ``ormcache:*``, dispatching the
+        messages to the RedisLRU of each database. Started again after a
+        fork (prefork workers) and resubscribed after a connection error,
+        in the meantime RedisLRU falls back to polling.
+    """
+
+    def __init__(self, redis, retry_delay=5):
+        self.redis = redis
+        self.retry_delay = retry_delay
+        self.callbacks = {}
+        self.subscribed = False
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        """ One callback per channel, the last registry of a database wins. """
+        self.callbacks[channel] = callback
+        self.ensure()
+
+    def ensure(self):
+        """ Start the thread in this process if needed.
+            :return: True when subscribed
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self.subscribed = False
+                    thread = threading.Thread(target=self._run, name='ormcache.invalidation')
+                    thread.daemon = True
+                    thread.start()
+        return self.subscribed
+
+    def _dispatch(self, channel, data):
+        callback = self.callbacks.get(channel)
+        if callback is not None:
+            callback(data)
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                for message in pubsub.listen():
+                    if message['type'] == 'psubscribe':
+                        #Missed messages while not subscribed: resync everything
+                        for channel in list(self.callbacks):
+                            self._dispatch(channel, None)
+                        self.subscribed = True
+                    elif message['type'] == 'pmessage':
+                        channel = message['channel']
+                        if isinstance(channel, bytes):
+                            channel = channel.decode('utf-8')
+                        self._dispatch(channel, message['data'])
+            except Exception:
+                _logger.warning("ormcache invalidation listener disconnected, polling until resubscribed", exc_info=True)
+            self.subscribed = False
+            time.sleep(self.retry_delay)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Compare ormcache backends under multi-worker load.
+
+    python ormcache_benchmark.py [--redis-url URL] [--workers N] [--ops N] [--keys N]
+
+Needs odoo (for odoo.tools.lru) and redis importable. Every worker is a
+process with its own cache object, like an Odoo worker: it fills the
+cache with --keys ormcache-like keys, then does --ops lookups with a
+skewed key distribution (a few hot keys, like ir.model.access checks).
+
+    lru        stock odoo.tools.lru.LRU(8192), one per worker
+    redis-eval previous RedisLRU: one Lua eval per lookup, string keys
+    redis      RedisLRU without L1 (ormcache_l1_size = 0): one GET per lookup
+    tiered     RedisLRU with L1 LRU(8192) in front of Redis
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import time
+
+import redis
+
+from odoo.tools.lru import LRU
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import RedisLRU  # noqa: E402
+
+
+class EvalRedisLRU(object):
+    """ Lookup and store of the RedisLRU before the L1 tier, as baseline. """
+
+    def __init__(self, redis, namespace):
+        self.redis = redis
+        self.namespace = namespace
+        self.redis.setnx(namespace + '_generation', 1)
+
+    def _script(self, command, key, extra=''):
+        return "return redis.call('%s','%s_'..redis.call('get','%s_generation')..'%s'%s)" % (
+            command, self.namespace, self.namespace, key, extra)
+
+    def __getitem__(self, obj):
+        res = self.redis.execute_command("eval", self._script('get', to_str(obj)), 0)
+        if not res:
+            raise KeyError("None")
+        return pickle.loads(res)
+
+    def __setitem__(self, obj, val):
+        self.redis.execute_command("eval", self._script('set', to_str(obj), ',KEYS[1]'), 1, pickle.dumps(val))
+
+
+def to_str(obj):
+    if isinstance(obj, (tuple, list, frozenset, set)):
+        return '[' + ",".join(to_str(i) for i in obj) + ']'
+    return str(obj)
+
+
+def make_cache(backend, url, namespace):
+    if backend == 'lru':
+        return LRU(8192)
+    r = redis.StrictRedis.from_url(url)
+    if backend == 'redis-eval':
+        return EvalRedisLRU(r, namespace)
+    return RedisLRU.RedisLRU(r, namespace, l1_size=8192 if backend == 'tiered' else 0)
+
+
+def make_keys(count):
+    rnd = random.Random(1)
+    models = ['res.partner', 'res.users', 'product.product', 'sale.order', 'account.move', 'stock.move']
+    keys = []
+    for i in range(count):
+        keys.append((rnd.choice(models), 'check', rnd.choice(['read', 'write', 'create', 'unlink']),
+                     frozenset([rnd.randint(1, 50) for x in range(3)]), i))
+    return keys
+
+
+def worker(backend, url, namespace, keys, ops, seed, queue):
+    cache = make_cache(backend, url, namespace)
+    for key in keys:
+        cache[key] = {'groups': [1, 2, 3], 'key': key[1:3]}
+
+    rnd = random.Random(seed)
+    picks = [keys[min(int(rnd.paretovariate(1.2)) - 1, len(keys) - 1)] for x in range(ops)]
+    start = time.time()
+    misses = 0
+    for key in picks:
+        try:
+            cache[key]
+        except KeyError:
+            misses += 1
+    queue.put((time.time() - start, misses))
+
+
+def run(backend, args):
+    namespace = 'ormcache_benchmark_%s' % backend.replace('-', '_')
+    keys = make_keys(args.keys)
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(backend, args.redis_url, namespace, keys, args.ops, n, queue))
+             for n in range(args.workers)]
+    for proc in procs:
+        proc.start()
+    results = [queue.get() for proc in procs]
+    for proc in procs:
+        proc.join()
+
+    elapsed = max(result[0] for result in results)
+    misses = sum(result[1] for result in results)
+    total = args.ops * args.workers
+    print("{:>10}: {:>10.0f} lookups/s, {:>8.1f} us/lookup, {} misses".format(
+        backend, total / elapsed, elapsed * 1e6 / args.ops, misses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=2000)
+    args = parser.parse_args()
+    for backend in ['lru', 'redis-eval', 'redis', 'tiered']:
+        run(backend, args)
+
+
+if __name__ == '__main__':
+    main()
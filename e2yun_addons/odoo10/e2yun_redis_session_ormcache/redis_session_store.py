@@ -23,13 +23,23 @@
 
 
 import cPickle
+import hashlib
+import zlib
+
 import werkzeug.contrib.sessions
 
 from odoo import http, tools
 from odoo.tools.func import lazy_property
+from odoo.tools.lru import LRU
 
 SESSION_TIMEOUT = 60 * 60 * 24 * 7  # 1 weeks in seconds
 
+# Payload = version byte + pickle, compressed when bigger than COMPRESS_MIN_SIZE.
+# Payloads saved before the version byte start with a pickle opcode and are read as is.
+VERSION_PICKLE = b'\x01'
+VERSION_PICKLE_ZLIB = b'\x02'
+COMPRESS_MIN_SIZE = 1024
+
 
 def is_redis_session_store_activated():
     return tools.config.get('enable_redis')
@@ -42,27 +52,70 @@ except ImportError:
         raise ImportError('Please install package python-redis: apt-get install python-redis')
 
 
+def dumps(data):
+    res = cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
+    if len(res) >= COMPRESS_MIN_SIZE:
+        return VERSION_PICKLE_ZLIB + zlib.compress(res, 1)
+    return VERSION_PICKLE + res
+
+
+def loads(data):
+    version = data[:1]
+    if version == VERSION_PICKLE:
+        return cPickle.loads(data[1:])
+    elif version == VERSION_PICKLE_ZLIB:
+        return cPickle.loads(zlib.decompress(data[1:]))
+    return cPickle.loads(data)
+
+
+_pools = {}
+
+
+def connection_pool(url):
+    """ Connection pool of the process for url, shared by all threads,
+        sized by session_redis_max_connections (0 = unlimited). """
+    if url not in _pools:
+        _pools[url] = redis.ConnectionPool.from_url(
+            url,
+            max_connections=int(tools.config.get('session_redis_max_connections', 0)) or None,
+            socket_timeout=float(tools.config.get('session_redis_socket_timeout', 0)) or None)
+    return _pools[url]
+
+
 class RedisSessionStore(werkzeug.contrib.sessions.SessionStore):
+    """ Sessions in Redis. A read is one round-trip (GET + TTL pipelined),
+        the expiry is only pushed back with EXPIRE once half of it is spent,
+        and save() does not write a session identical to the one read. """
 
     def __init__(self, *args, **kwargs):
         super(RedisSessionStore, self).__init__(*args, **kwargs)
         self.expire = kwargs.get('expire', SESSION_TIMEOUT)
         self.key_prefix = kwargs.get('key_prefix', '')
-        self.redis = redis.StrictRedis.from_url(tools.config['session_redis_url'])
+        self.redis = redis.StrictRedis(connection_pool=connection_pool(tools.config['session_redis_url']))
         # self.redis = redis.Redis(host=tools.config.get('redis_host', 'localhost'),
         #                          port=int(tools.config.get('redis_port', 6379)),
         #                          db=int(tools.config.get('redis_dbindex', 1)),
         #                          password=tools.config.get('redis_pass', None))
+        # sid: digest of the payload in Redis, as last read or written by this worker
+        self.digests = LRU(int(tools.config.get('session_redis_digests', 8192)))
         self._is_redis_server_running()
 
     def save(self, session):
         key = self._get_session_key(session.sid)
-        data = cPickle.dumps(dict(session))
+        data = dumps(dict(session))
+        digest = hashlib.sha1(data).digest()
+        if self.digests.get(session.sid) == digest:
+            return
         self.redis.setex(name=key, value=data, time=self.expire)
+        self.digests[session.sid] = digest
 
     def delete(self, session):
         key = self._get_session_key(session.sid)
         self.redis.delete(key)
+        try:
+            del self.digests[session.sid]
+        except KeyError:
+            pass
 
     def _get_session_key(self, sid):
         key = self.key_prefix + sid
@@ -72,11 +125,21 @@ class RedisSessionStore(werkzeug.contrib.sessions.SessionStore):
 
     def get(self, sid):
         key = self._get_session_key(sid)
-        data = self.redis.get(key)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        data, ttl = pipe.execute()
         if data:
-            self.redis.setex(name=key, value=data, time=self.expire)
-            data = cPickle.loads(data)
+            if ttl is not None and 0 <= ttl < self.expire // 2:
+                self.redis.expire(key, self.expire)
+            self.digests[sid] = hashlib.sha1(data).digest()
+            data = loads(data)
         else:
+            # expired or deleted: the next save must write it again
+            try:
+                del self.digests[sid]
+            except KeyError:
+                pass
             data = {}
         return self.session_class(data, sid, False)
 
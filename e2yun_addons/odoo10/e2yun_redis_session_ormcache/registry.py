@@ -28,6 +28,43 @@ except ImportError:
 _logger = logging.getLogger(__name__)
 
 
+_listeners = {}
+
+
+def invalidation_listener(url):
+    """ Invalidation listener of the process for the Redis at url, if ormcache_redis_pubsub. """
+    if not str(config.get('ormcache_redis_pubsub', True)).lower() in ('1', 'true'):
+        return None
+    if url not in _listeners:
+        _listeners[url] = RedisLRU.InvalidationListener(redis.StrictRedis.from_url(url))
+    return _listeners[url]
+
+
+def redis_lru(db_name):
+    """ ormcache of db_name: Redis behind an in-process LRU of ormcache_l1_size entries (0 = no L1). """
+    url = config['ormcache_redis_url']
+    return RedisLRU.RedisLRU(redis.StrictRedis.from_url(url), db_name,
+                             l1_size=int(config.get('ormcache_l1_size', 8192)),
+                             ttl=int(config.get('ormcache_redis_ttl', 0)),
+                             sync_interval=float(config.get('ormcache_redis_sync_interval', 1.0)),
+                             listener=invalidation_listener(url))
+
+
+def signal_publish(method):
+    """ Publish the database signaling of method on the ormcache channel. """
+    def signal(self, *args, **kwargs):
+        sequences = (self.registry_sequence, self.cache_sequence)
+        res = method(self, *args, **kwargs)
+        publish = getattr(self.cache, 'publish_signaling', None)
+        if publish and (self.registry_sequence, self.cache_sequence) != sequences:
+            publish()
+        return res
+    return signal
+
+
+_check_signaling = Registry.check_signaling
+
+
 class RegistryRedis(Mapping):
     #models.BaseModel._param_lock = _param_lock
     def init(self, db_name):
@@ -59,8 +96,7 @@ class RegistryRedis(Mapping):
         self.cache_sequence = None
 
         # self.cache = LRU(8192)
-        r = redis.StrictRedis.from_url(odoo.tools.config['ormcache_redis_url'])
-        self.cache = RedisLRU.RedisLRU(r, db_name)
+        self.cache = redis_lru(db_name)
 
         # Flag indicating if at least one model cache has been cleared.
         # Useful only in a multi-process context.
@@ -75,6 +111,26 @@ class RegistryRedis(Mapping):
 
     Registry.init = init
 
+    def check_signaling(self):
+        """ Validate the ormcache L1 against the Redis generation once per request.
+            With the invalidation listener subscribed, the database sequences are
+            only read after a signaling message. """
+        cache = self.cache
+        if not hasattr(cache, 'listening'):
+            return _check_signaling(self)
+        if cache.listening():
+            if not cache.pop_signaled():
+                return self
+        else:
+            cache.sync(force=True)
+        with cache.local_clear():
+            return _check_signaling(self)
+
+    Registry.check_signaling = check_signaling
+    for name in ('signal_changes', 'signal_registry_change', 'signal_caches_change'):
+        if hasattr(Registry, name):
+            setattr(Registry, name, signal_publish(getattr(Registry, name)))
+
     @classmethod
     def delete(cls, db_name):
         """ Delete the registry linked to a given database. """
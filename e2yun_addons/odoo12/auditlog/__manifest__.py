@@ -3,7 +3,7 @@
 
 {
     'name': "Audit Log",
-    'version': "12.0.1.0.0",
+    'version': "12.0.1.1.0",
     'author': "ABF OSIELL,Odoo Community Association (OCA)",
     'license': "AGPL-3",
     'website': "https://github.com/OCA/server-tools/",
@@ -0,0 +1,60 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+"""Throughput of audited create/write on res.partner, without rule and
+with a 'full' and a 'fast' rule. To be run in an Odoo shell::
+
+    odoo shell -d DB --no-http < auditlog/benchmarks/auditlog_benchmark.py
+
+Run it on two revisions to compare them. Everything is rolled back.
+"""
+import time
+
+SIZES = (100, 1000)
+
+
+def bench(env, log_type, size):
+    partner_model = env['res.partner']
+    rule = env['auditlog.rule']
+    if log_type:
+        rule = rule.create({
+            'name': 'benchmark %s' % log_type,
+            'model_id': env.ref('base.model_res_partner').id,
+            'log_create': True,
+            'log_write': True,
+            'log_unlink': False,
+            'log_type': log_type,
+        })
+        rule.subscribe()
+    categories = env['res.partner.category'].create([
+        {'name': 'benchmark %s' % i} for i in range(3)])
+    try:
+        start = time.time()
+        partners = partner_model.create([{
+            'name': 'Benchmark %s' % i,
+            'email': 'benchmark%s@example.com' % i,
+            'category_id': [(6, 0, categories.ids)],
+        } for i in range(size)])
+        create_time = time.time() - start
+        start = time.time()
+        partners.write({
+            'phone': '+33 1 23 45 67 89',
+            'category_id': [(3, categories[0].id)],
+        })
+        write_time = time.time() - start
+        lines = env['auditlog.log.line'].search_count(
+            [('log_id.res_id', 'in', partners.ids)]) if log_type else 0
+    finally:
+        if log_type:
+            rule.unsubscribe()
+        env.cr.rollback()
+    print("%-5s %6s records: create %8.1f rec/s, write %8.1f rec/s, "
+          "%s log lines" % (log_type or 'none', size, size / create_time,
+                            size / write_time, lines))
+
+
+def main(env):
+    for size in SIZES:
+        for log_type in (None, 'fast', 'full'):
+            bench(env, log_type, size)
+
+
+main(env)  # noqa: F821 (odoo shell)
@@ -5,3 +5,6 @@ from . import http_session
 from . import http_request
 from . import log
 from . import autovacuum
+from . import partition
+from . import queue
+from . import ir_model
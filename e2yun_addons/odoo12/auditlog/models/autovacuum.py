@@ -1,40 +1,130 @@
 # Copyright 2016 ABF OSIELL <https://osiell.com>
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import gzip
+import json
 import logging
+import os
+import threading
+import time
 from datetime import datetime, timedelta
 
 from odoo import models, fields, api
+from odoo.tools import create_index
+
+from .partition import is_partitioned
 
 
 _logger = logging.getLogger(__name__)
 
+# Deleted in this order: logs first, they reference HTTP requests/sessions
+VACUUM_TABLES = (
+    'auditlog_log',
+    'auditlog_http_request',
+    'auditlog_http_session',
+)
+
 
 class AuditlogAutovacuum(models.TransientModel):
     _name = 'auditlog.autovacuum'
     _description = "Auditlog - Delete old logs"
 
+    @api.model_cr
+    def init(self):
+        # Chunks are taken in create_date order
+        for table in VACUUM_TABLES:
+            create_index(
+                self.env.cr, '%s_create_date_index' % table, table,
+                ['create_date'])
+
     @api.model
-    def autovacuum(self, days):
+    def autovacuum(self, days, chunk_size=5000, time_limit=None,
+                   archive_dir=None):
         """Delete all logs older than ``days``. This includes:
             - CRUD logs (create, read, write, unlink)
             - HTTP requests
             - HTTP user sessions
 
+        Records are deleted by SQL, the oldest first, by chunks of
+        ``chunk_size`` committed one by one. Once ``time_limit`` seconds
+        are spent, the next call resumes where this one stopped.
+        With ``archive_dir``, each chunk (and the lines of the logs) is
+        appended to ``<archive_dir>/<table>-<date>.jsonl.gz`` before
+        being deleted.
+        When the logs are partitioned (see `auditlog.partition`), their
+        expired months are dropped as whole partitions, then the expired
+        logs of the default partition are deleted by chunks.
+
         Called from a cron.
         """
         days = (days > 0) and int(days) or 0
         deadline = datetime.now() - timedelta(days=days)
-        data_models = (
-            'auditlog.log',
-            'auditlog.http.request',
-            'auditlog.http.session',
-        )
-        for data_model in data_models:
-            records = self.env[data_model].search(
-                [('create_date', '<=', fields.Datetime.to_string(deadline))])
-            nb_records = len(records)
-            records.unlink()
+        stop_time = time_limit and time.time() + time_limit
+        testing = getattr(threading.currentThread(), 'testing', False)
+        for table in VACUUM_TABLES:
+            nb_records = 0
+            select_table = table
+            if table == 'auditlog_log' and is_partitioned(self.env.cr):
+                # Logs and lines of whole months first
+                nb_records = self.env['auditlog.partition'].drop_partitions(
+                    deadline, archive_dir, stop_time)
+                if not testing:
+                    self.env.cr.commit()
+                select_table = 'auditlog_log_pdefault'
+            while not stop_time or time.time() < stop_time:
+                self.env.cr.execute("""
+                    SELECT id FROM {table}
+                     WHERE create_date <= %s
+                  ORDER BY create_date
+                     LIMIT %s
+                """.format(table=select_table),
+                    (fields.Datetime.to_string(deadline), chunk_size))
+                ids = tuple(row[0] for row in self.env.cr.fetchall())
+                if not ids:
+                    break
+                if archive_dir:
+                    self._archive(archive_dir, table, ids)
+                if select_table != table:
+                    # No foreign key from the partitioned lines to their log
+                    self.env.cr.execute(
+                        "DELETE FROM auditlog_log_line WHERE log_id IN %s",
+                        (ids,))
+                self.env.cr.execute(
+                    "DELETE FROM {table} WHERE id IN %s".format(
+                        table=select_table), (ids,))
+                nb_records += len(ids)
+                if not testing:
+                    self.env.cr.commit()
+                if len(ids) < chunk_size:
+                    break
             _logger.info(
-                "AUTOVACUUM - %s '%s' records deleted",
-                nb_records, data_model)
+                "AUTOVACUUM - %s '%s' records deleted", nb_records, table)
+        self.env.invalidate_all()
+        if stop_time and time.time() >= stop_time:
+            _logger.info("AUTOVACUUM - time limit reached, to be continued")
         return True
+
+    def _archive(self, archive_dir, table, ids):
+        """Append the rows ``ids`` of ``table`` to a gzipped JSON lines
+        file, with the lines of the logs for 'auditlog_log'.
+        """
+        to_archive = [(table, "id IN %s")]
+        if table == 'auditlog_log':
+            to_archive.append(('auditlog_log_line', "log_id IN %s"))
+        for archive_table, where in to_archive:
+            self.env.cr.execute(
+                "SELECT * FROM {table} WHERE {where}".format(
+                    table=archive_table, where=where), (ids,))
+            self._archive_rows(
+                archive_dir, archive_table, self.env.cr.dictfetchall())
+
+    def _archive_rows(self, archive_dir, table, rows):
+        """Append ``rows`` (dicts) of ``table`` to
+        ``<archive_dir>/<table>-<date>.jsonl.gz``.
+        """
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        day = fields.Date.to_string(fields.Date.today())
+        path = os.path.join(archive_dir, '%s-%s.jsonl.gz' % (table, day))
+        with gzip.open(path, 'at', encoding='utf-8') as archive:
+            for row in rows:
+                archive.write(json.dumps(row, default=str) + '\n')
@@ -0,0 +1,30 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import models, api
+
+
+class IrModelFields(models.Model):
+    _inherit = 'ir.model.fields'
+
+    def _auditlog_invalidate_field_cache(self):
+        """Drop the field data cached by auditlog rules, loaded again
+        on demand.
+        """
+        cache = getattr(self.pool, '_auditlog_field_cache', None)
+        if cache:
+            cache.clear()
+
+    @api.model
+    def create(self, vals):
+        self._auditlog_invalidate_field_cache()
+        return super(IrModelFields, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        self._auditlog_invalidate_field_cache()
+        return super(IrModelFields, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        self._auditlog_invalidate_field_cache()
+        return super(IrModelFields, self).unlink()
@@ -1,6 +1,18 @@
 # Copyright 2015 ABF OSIELL <https://osiell.com>
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
-from odoo import models, fields
+from odoo import models, fields, api
+
+from .partition import is_partitioned
+
+
+class LogMany2one(fields.Many2one):
+    """Many2one to the logs, without foreign key once they are partitioned
+    (a partitioned table cannot be referenced by a foreign key)."""
+
+    def update_db_foreign_key(self, model, column):
+        if is_partitioned(model.env.cr):
+            return
+        return super(LogMany2one, self).update_db_foreign_key(model, column)
 
 
 class AuditlogLog(models.Model):
@@ -23,10 +35,18 @@ class AuditlogLog(models.Model):
         'auditlog.http.request', string="HTTP Request")
     log_type = fields.Selection(
         [('full', "Full log"),
+         ('diff', "Diff log"),
          ('fast', "Fast log"),
          ],
         string="Type")
 
+    @api.multi
+    def unlink(self):
+        if is_partitioned(self.env.cr):
+            # No foreign key from the partitioned lines to their log
+            self.mapped('line_ids').unlink()
+        return super(AuditlogLog, self).unlink()
+
 
 class AuditlogLogLine(models.Model):
     _name = 'auditlog.log.line'
@@ -34,7 +54,7 @@ class AuditlogLogLine(models.Model):
 
     field_id = fields.Many2one(
         'ir.model.fields', ondelete='cascade', string="Field", required=True)
-    log_id = fields.Many2one(
+    log_id = LogMany2one(
         'auditlog.log', string="Log", ondelete='cascade', index=True)
     old_value = fields.Text("Old Value")
     new_value = fields.Text("New Value")
@@ -0,0 +1,180 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import logging
+import time
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, api, _
+from odoo.exceptions import UserError
+from odoo.tools import create_index
+
+_logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ('auditlog_log', 'auditlog_log_line')
+# Indexes of the partitioned tables, created on each partition
+PARTITION_INDEXES = {
+    'auditlog_log': [
+        ('auditlog_log_model_id_res_id_index', ['model_id', 'res_id']),
+        ('auditlog_log_create_date_index', ['create_date']),
+    ],
+    'auditlog_log_line': [
+        ('auditlog_log_line_log_id_index', ['log_id']),
+    ],
+}
+
+
+def is_partitioned(cr, table='auditlog_log'):
+    cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", (table,))
+    row = cr.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+class AuditlogPartition(models.TransientModel):
+    _name = 'auditlog.partition'
+    _description = "Auditlog - Monthly partitions of the logs"
+
+    @api.model
+    def convert(self, months_ahead=3):
+        """Convert 'auditlog_log' and 'auditlog_log_line' to tables
+        partitioned by month of create_date (PostgreSQL >= 11), existing
+        logs included. To be called once, during a maintenance, from an
+        Odoo shell, then to be committed.
+
+        The lines can no longer have a foreign key to their log (the
+        primary key of a partitioned table includes the partition key):
+        lines are deleted with their logs by `auditlog.log.unlink()` and
+        with their partitions by the autovacuum.
+        """
+        cr = self.env.cr
+        if cr._cnx.server_version < 110000:
+            raise UserError(_(
+                "Partitioned audit logs require PostgreSQL 11 or later."))
+        if is_partitioned(cr):
+            return False
+
+        cr.execute("""
+            SELECT con.conname FROM pg_constraint con
+              JOIN pg_class c ON c.oid = con.conrelid
+             WHERE c.relname = 'auditlog_log_line' AND con.contype = 'f'
+               AND con.confrelid = 'auditlog_log'::regclass
+        """)
+        for conname, in cr.fetchall():
+            cr.execute('ALTER TABLE auditlog_log_line DROP CONSTRAINT "%s"'
+                       % conname)
+
+        for table in PARTITIONED_TABLES:
+            old = '%s_old' % table
+            cr.execute('UPDATE "{0}" SET create_date = write_date '
+                       'WHERE create_date IS NULL'.format(table))
+            cr.execute('ALTER TABLE "{0}" RENAME TO "{1}"'.format(table, old))
+            cr.execute('ALTER INDEX "{0}_pkey" RENAME TO "{1}_pkey"'
+                       .format(table, old))
+            cr.execute("""
+                CREATE TABLE "{0}" (LIKE "{1}" INCLUDING DEFAULTS)
+                PARTITION BY RANGE (create_date)
+            """.format(table, old))
+            cr.execute('ALTER TABLE "{0}" ADD PRIMARY KEY (id, create_date)'
+                       .format(table))
+            cr.execute('ALTER SEQUENCE "{0}_id_seq" OWNED BY "{0}".id'
+                       .format(table))
+            # foreign keys to other tables (users, models, fields...)
+            cr.execute("""
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                 WHERE conrelid = %s::regclass AND contype = 'f'
+            """, (old,))
+            for conname, definition in cr.fetchall():
+                cr.execute('ALTER TABLE "{0}" ADD CONSTRAINT "{1}" {2}'
+                           .format(table, conname, definition))
+            cr.execute('SELECT min(create_date) FROM "{0}"'.format(old))
+            first_date = cr.fetchone()[0]
+            self._create_partitions(
+                table, first_date and first_date.date() or date.today(),
+                months_ahead)
+            cr.execute('CREATE TABLE "{0}_pdefault" PARTITION OF "{0}" DEFAULT'
+                       .format(table))
+            cr.execute('INSERT INTO "{0}" SELECT * FROM "{1}"'
+                       .format(table, old))
+            cr.execute('DROP TABLE "{0}"'.format(old))
+            for indexname, columns in PARTITION_INDEXES[table]:
+                create_index(cr, indexname, table, columns)
+            _logger.info("AUDITLOG - %s partitioned by month", table)
+        self.env.invalidate_all()
+        return True
+
+    @api.model
+    def create_partitions(self, months_ahead=3):
+        """Create the partitions of the current month and of the next
+        ``months_ahead`` ones, if the logs are partitioned.
+
+        Called from a cron.
+        """
+        if not is_partitioned(self.env.cr):
+            return False
+        for table in PARTITIONED_TABLES:
+            self._create_partitions(table, date.today(), months_ahead)
+        return True
+
+    def _create_partitions(self, table, first_date, months_ahead):
+        month = first_date.replace(day=1)
+        last_month = date.today().replace(day=1) + relativedelta(
+            months=months_ahead)
+        while month <= last_month:
+            next_month = month + relativedelta(months=1)
+            self.env.cr.execute("""
+                CREATE TABLE IF NOT EXISTS "{0}_p{1}" PARTITION OF "{0}"
+                FOR VALUES FROM (%s) TO (%s)
+            """.format(table, month.strftime('%Y%m')),
+                (str(month), str(next_month)))
+            month = next_month
+
+    @api.model
+    def drop_partitions(self, deadline, archive_dir=None, stop_time=None):
+        """Drop the monthly partitions of logs and lines whose whole month
+        is before ``deadline`` (datetime), the oldest first, archived in
+        ``archive_dir`` first if given (see `auditlog.autovacuum`), until
+        the time ``stop_time`` (timestamp) if given.
+        :return: number of logs dropped
+        """
+        cr = self.env.cr
+        partitions = {}
+        for table in PARTITIONED_TABLES:
+            cr.execute("""
+                SELECT c.relname FROM pg_inherits i
+                  JOIN pg_class c ON c.oid = i.inhrelid
+                 WHERE i.inhparent = %s::regclass AND c.relname ~ %s
+            """, (table, '^%s_p[0-9]{6}$' % table))
+            for partition, in cr.fetchall():
+                partitions.setdefault(partition[-6:], []).append(
+                    (table, partition))
+        nb_logs = 0
+        # Logs and lines of a month are dropped together
+        for month_code in sorted(partitions):
+            if stop_time and time.time() >= stop_time:
+                break
+            month = date(int(month_code[:4]), int(month_code[4:]), 1)
+            if month + relativedelta(months=1) > deadline.date():
+                break
+            for table, partition in partitions[month_code]:
+                if table == 'auditlog_log':
+                    cr.execute('SELECT count(*) FROM "%s"' % partition)
+                    nb_logs += cr.fetchone()[0]
+                if archive_dir:
+                    self._archive_partition(archive_dir, table, partition)
+                cr.execute('DROP TABLE "%s"' % partition)
+        return nb_logs
+
+    def _archive_partition(self, archive_dir, table, partition,
+                           chunk_size=10000):
+        """Archive the rows of ``partition`` by chunks of ``chunk_size``."""
+        autovacuum_model = self.env['auditlog.autovacuum']
+        last_id = 0
+        while True:
+            self.env.cr.execute(
+                'SELECT * FROM "{0}" WHERE id > %s ORDER BY id LIMIT %s'
+                .format(partition), (last_id, chunk_size))
+            rows = self.env.cr.dictfetchall()
+            if not rows:
+                break
+            autovacuum_model._archive_rows(archive_dir, table, rows)
+            last_id = rows[-1]['id']
@@ -0,0 +1,117 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import base64
+import logging
+import pickle
+import threading
+
+from psycopg2 import Binary
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class AuditlogQueue(models.Model):
+    _name = 'auditlog.queue'
+    _description = "Auditlog - Logs waiting to be written"
+    _order = 'id'
+
+    user_id = fields.Many2one(
+        'res.users', string="User")
+    res_model = fields.Char("Model")
+    method = fields.Char("Method", size=64)
+    payload = fields.Binary("Payload", attachment=False)
+    error = fields.Text("Error")
+
+    @api.model
+    def enqueue(self, uid, res_model, res_ids, method,
+                old_values=None, new_values=None,
+                additional_log_values=None):
+        """Queue the arguments of `auditlog.rule.create_logs` with one INSERT
+        in the current transaction: the logs are written by `flush` once it
+        is committed, and never if it is rolled back.
+        """
+        log_vals = dict(additional_log_values or {})
+        log_vals['http_request_id'] = \
+            self.env['auditlog.http.request'].current_http_request()
+        log_vals['http_session_id'] = \
+            self.env['auditlog.http.session'].current_http_session()
+        res_names = None
+        if method == 'unlink':
+            # Records will be gone when the queue is flushed
+            res_names = dict(self.env[res_model].browse(res_ids).name_get())
+        payload = pickle.dumps(
+            (list(res_ids), old_values, new_values, log_vals, res_names),
+            pickle.HIGHEST_PROTOCOL)
+        self.env.cr.execute("""
+            INSERT INTO auditlog_queue
+                (user_id, res_model, method, payload,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s,
+                    %s, now() at time zone 'UTC',
+                    %s, now() at time zone 'UTC')
+        """, (uid, res_model, method, Binary(base64.b64encode(payload)),
+              self.env.uid, self.env.uid))
+
+    @api.model
+    def flush(self, limit=500):
+        """Write the queued logs, `limit` entries per transaction.
+        Entries which fail are kept with their error and not retried.
+
+        Called from a cron.
+        """
+        rule_model = self.env['auditlog.rule'].sudo().with_context(
+            auditlog_disabled=True, auditlog_flush=True)
+        testing = getattr(threading.currentThread(), 'testing', False)
+        nb_done = 0
+        while True:
+            self.env.cr.execute("""
+                SELECT id, user_id, res_model, method, payload, create_date
+                  FROM auditlog_queue
+                 WHERE error IS NULL
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (limit,))
+            rows = self.env.cr.fetchall()
+            done_ids = []
+            for queue_id, uid, res_model, method, payload, create_date \
+                    in rows:
+                try:
+                    with self.env.cr.savepoint():
+                        res_ids, old_values, new_values, log_vals, \
+                            res_names = pickle.loads(
+                                base64.b64decode(bytes(payload)))
+                        logs = rule_model.create_logs(
+                            uid, res_model, res_ids, method, old_values,
+                            new_values, log_vals, res_names=res_names)
+                        if logs:
+                            # Date of the operation, not of the flush
+                            self.env.cr.execute(
+                                "UPDATE auditlog_log SET create_date = %s "
+                                "WHERE id IN %s",
+                                (create_date, tuple(logs.ids)))
+                            self.env.cr.execute(
+                                "UPDATE auditlog_log_line "
+                                "SET create_date = %s WHERE log_id IN %s",
+                                (create_date, tuple(logs.ids)))
+                    done_ids.append(queue_id)
+                except Exception as e:
+                    _logger.exception(
+                        "AUDITLOG QUEUE - entry %s not logged", queue_id)
+                    self.env.cr.execute(
+                        "UPDATE auditlog_queue SET error = %s WHERE id = %s",
+                        (str(e), queue_id))
+            if done_ids:
+                self.env.cr.execute(
+                    "DELETE FROM auditlog_queue WHERE id IN %s",
+                    (tuple(done_ids),))
+            nb_done += len(done_ids)
+            if not testing:
+                self.env.cr.commit()
+            if len(rows) < limit:
+                break
+        self.env['auditlog.log'].invalidate_cache(['create_date'])
+        self.env['auditlog.log.line'].invalidate_cache(['create_date'])
+        _logger.info("AUDITLOG QUEUE - %s entries logged", nb_done)
+        return True
@@ -80,15 +80,27 @@ class AuditlogRule(models.Model):
         states={'subscribed': [('readonly', True)]})
     log_type = fields.Selection(
         [('full', "Full log"),
+         ('diff', "Diff log"),
          ('fast', "Fast log"),
          ],
         string="Type", required=True, default='full',
         help=("Full log: make a diff between the data before and after "
               "the operation (log more info like computed fields which were "
               "updated, but it is slower)\n"
+              "Diff log: like the full log, but only for the written fields "
+              "and the stored fields computed from them, binary and "
+              "non-stored computed fields excluded (affordable on models "
+              "with many fields)\n"
               "Fast log: only log the changes made through the create and "
               "write operations (less information, but it is faster)"),
         states={'subscribed': [('readonly', True)]})
+    log_async = fields.Boolean(
+        "Log Asynchronously",
+        help=("Select this to only queue the data to log in the transaction "
+              "of the operation: the logs are written after the commit by "
+              "the 'Write queued audit logs' scheduled action, and nothing "
+              "is logged if the transaction is rolled back"),
+        states={'subscribed': [('readonly', True)]})
     # log_action = fields.Boolean(
     #     "Log Action",
     #     help=("Select this if you want to keep track of actions on the "
@@ -117,15 +129,46 @@ class AuditlogRule(models.Model):
             self.pool._auditlog_field_cache = {}
         if not hasattr(self.pool, '_auditlog_model_cache'):
             self.pool._auditlog_model_cache = {}
+        if not hasattr(self.pool, '_auditlog_async_cache'):
+            self.pool._auditlog_async_cache = set()
         if not self:
             self = self.search([('state', '=', 'subscribed')])
+        self._preload_field_cache()
         return self._patch_methods()
 
+    @api.multi
+    def _preload_field_cache(self):
+        """Load the 'ir.model.fields' data of the models of the subscribed
+        rules (and of the models they inherit) in the field cache, with one
+        'search()' and one 'read()', so that the first logs of a worker do
+        not have to query them field by field.
+        """
+        cache = self.pool._auditlog_field_cache
+        models = self.filtered(
+            lambda rule: rule.state == 'subscribed').mapped('model_id')
+        if not models:
+            return
+        all_model_ids = set(models.ids)
+        all_model_ids.update(models.mapped('inherited_model_ids').ids)
+        fields_by_model = {}
+        for field_data in self.env['ir.model.fields'].search(
+                [('model_id', 'in', list(all_model_ids))]).read(
+                load='_classic_write'):
+            fields_by_model.setdefault(
+                field_data['model_id'], {})[field_data['name']] = field_data
+        for model in models:
+            model_fields = {}
+            # fields of the model itself win over the inherited ones
+            for model_id in model.inherited_model_ids.ids + [model.id]:
+                model_fields.update(fields_by_model.get(model_id, {}))
+            cache[model.model] = model_fields
+
     @api.multi
     def _patch_methods(self):
         """Patch ORM methods of models defined in rules to log their calls."""
         updated = False
         model_cache = self.pool._auditlog_model_cache
+        async_cache = self.pool._auditlog_async_cache
         for rule in self:
             if rule.state != 'subscribed':
                 continue
@@ -133,6 +176,10 @@ class AuditlogRule(models.Model):
                 # ignore rules for models not loadable currently
                 continue
             model_cache[rule.model_id.model] = rule.model_id.id
+            if rule.log_async:
+                async_cache.add(rule.model_id.model)
+            else:
+                async_cache.discard(rule.model_id.model)
             model_model = self.env[rule.model_id.model]
             # CRUD
             #   -> create
@@ -171,6 +218,8 @@ class AuditlogRule(models.Model):
         updated = False
         for rule in self:
             model_model = self.env[rule.model_id.model]
+            getattr(self.pool, '_auditlog_async_cache', set()).discard(
+                rule.model_id.model)
             for method in ['create', 'read', 'write', 'unlink']:
                 if getattr(rule, 'log_%s' % method) and hasattr(
                         getattr(model_model, method), 'origin'):
@@ -208,34 +257,37 @@ class AuditlogRule(models.Model):
         self.ensure_one()
         log_type = self.log_type
 
-        @api.model
+        @api.model_create_multi
         @api.returns('self', lambda value: value.id)
-        def create_full(self, vals, **kwargs):
+        def create_full(self, vals_list, **kwargs):
             self = self.with_context(auditlog_disabled=True)
             rule_model = self.env['auditlog.rule']
-            new_record = create_full.origin(self, vals, **kwargs)
+            new_records = create_full.origin(self, vals_list, **kwargs)
+            fields_list = rule_model._get_log_fields(self, log_type)
             new_values = dict(
-                (d['id'], d) for d in new_record.sudo()
-                .with_context(prefetch_fields=False).read(list(self._fields)))
+                (d['id'], d) for d in new_records.sudo()
+                .with_context(prefetch_fields=False).read(fields_list))
             rule_model.sudo().create_logs(
-                self.env.uid, self._name, new_record.ids,
+                self.env.uid, self._name, new_records.ids,
                 'create', None, new_values, {'log_type': log_type})
-            return new_record
+            return new_records
 
-        @api.model
+        @api.model_create_multi
         @api.returns('self', lambda value: value.id)
-        def create_fast(self, vals, **kwargs):
+        def create_fast(self, vals_list, **kwargs):
             self = self.with_context(auditlog_disabled=True)
             rule_model = self.env['auditlog.rule']
-            vals2 = dict(vals)
-            new_record = create_fast.origin(self, vals, **kwargs)
-            new_values = {new_record.id: vals2}
+            vals_list2 = [dict(vals) for vals in vals_list]
+            new_records = create_fast.origin(self, vals_list, **kwargs)
+            new_values = dict(
+                (record.id, vals2)
+                for record, vals2 in zip(new_records, vals_list2))
             rule_model.sudo().create_logs(
-                self.env.uid, self._name, new_record.ids,
+                self.env.uid, self._name, new_records.ids,
                 'create', None, new_values, {'log_type': log_type})
-            return new_record
+            return new_records
 
-        return create_full if self.log_type == 'full' else create_fast
+        return create_fast if self.log_type == 'fast' else create_full
 
     @api.multi
     def _make_read(self):
@@ -277,13 +329,14 @@ class AuditlogRule(models.Model):
         def write_full(self, vals, **kwargs):
             self = self.with_context(auditlog_disabled=True)
             rule_model = self.env['auditlog.rule']
+            fields_list = rule_model._get_log_fields(self, log_type, vals)
             old_values = dict(
                 (d['id'], d) for d in self.sudo()
-                .with_context(prefetch_fields=False).read(list(self._fields)))
+                .with_context(prefetch_fields=False).read(fields_list))
             result = write_full.origin(self, vals, **kwargs)
             new_values = dict(
                 (d['id'], d) for d in self.sudo()
-                .with_context(prefetch_fields=False).read(list(self._fields)))
+                .with_context(prefetch_fields=False).read(fields_list))
             rule_model.sudo().create_logs(
                 self.env.uid, self._name, self.ids,
                 'write', old_values, new_values, {'log_type': log_type})
@@ -306,7 +359,7 @@ class AuditlogRule(models.Model):
                 'write', old_values, new_values, {'log_type': log_type})
             return result
 
-        return write_full if self.log_type == 'full' else write_fast
+        return write_fast if self.log_type == 'fast' else write_full
 
     @api.multi
     def _make_unlink(self):
@@ -318,9 +371,10 @@ class AuditlogRule(models.Model):
         def unlink_full(self, **kwargs):
             self = self.with_context(auditlog_disabled=True)
             rule_model = self.env['auditlog.rule']
+            fields_list = rule_model._get_log_fields(self, log_type)
             old_values = dict(
                 (d['id'], d) for d in self.sudo()
-                .with_context(prefetch_fields=False).read(list(self._fields)))
+                .with_context(prefetch_fields=False).read(fields_list))
             rule_model.sudo().create_logs(
                 self.env.uid, self._name, self.ids, 'unlink', old_values, None,
                 {'log_type': log_type})
@@ -335,14 +389,59 @@ class AuditlogRule(models.Model):
                 {'log_type': log_type})
             return unlink_fast.origin(self, **kwargs)
 
-        return unlink_full if self.log_type == 'full' else unlink_fast
+        return unlink_fast if self.log_type == 'fast' else unlink_full
+
+    @api.model
+    def _get_log_fields(self, model, log_type, vals=None):
+        """Return the fields to read to log an operation on `model`:
+            - 'full' log: all the fields
+            - 'diff' log: the stored fields, but binary ones, and when
+              `vals` are written, only those fields and the stored fields
+              computed from them (following the dependencies)
+        """
+        if log_type != 'diff':
+            return list(model._fields)
+
+        def loggable(field):
+            return field.store and field.type != 'binary'
+
+        if vals is None:
+            return [name for name, field in model._fields.items()
+                    if loggable(field)]
+        todo = [model._fields[name] for name in vals if name in model._fields]
+        done = set()
+        while todo:
+            field = todo.pop()
+            if field in done:
+                continue
+            done.add(field)
+            if not field.store:
+                # Written non-stored field: its inverse writes the fields it
+                # depends on
+                todo.extend(
+                    model._fields[path.split('.')[0]]
+                    for path in field.depends
+                    if path.split('.')[0] in model._fields)
+            todo.extend(
+                dependent for dependent, path
+                in model._field_triggers.get(field, ())
+                if dependent.model_name == model._name)
+        return [field.name for field in done if loggable(field)]
 
     def create_logs(self, uid, res_model, res_ids, method,
                     old_values=None, new_values=None,
-                    additional_log_values=None):
+                    additional_log_values=None, res_names=None):
         """Create logs. `old_values` and `new_values` are dictionaries, e.g:
             {RES_ID: {'FIELD': VALUE, ...}}
+        `res_names` is {RES_ID: NAME}, computed with 'name_get()' if not given.
+        All the logs, then all their lines, are created with one `create()`.
+        For the models of asynchronous rules, the logs are only queued.
         """
+        if res_model in getattr(self.pool, '_auditlog_async_cache', ()) \
+                and not self.env.context.get('auditlog_flush'):
+            return self.env['auditlog.queue'].enqueue(
+                uid, res_model, res_ids, method, old_values, new_values,
+                additional_log_values)
         if old_values is None:
             old_values = EMPTY_DICT
         if new_values is None:
@@ -350,34 +449,46 @@ class AuditlogRule(models.Model):
         log_model = self.env['auditlog.log']
         http_request_model = self.env['auditlog.http.request']
         http_session_model = self.env['auditlog.http.session']
+        model_model = self.env[res_model]
+        http_request_id = http_request_model.current_http_request()
+        http_session_id = http_session_model.current_http_session()
+        if res_names is None:
+            res_names = dict(model_model.browse(res_ids).name_get())
+        vals_list = []
         for res_id in res_ids:
-            model_model = self.env[res_model]
-            name = model_model.browse(res_id).name_get()
-            res_name = name and name[0] and name[0][1]
             vals = {
-                'name': res_name,
+                'name': res_names.get(res_id),
                 'model_id': self.pool._auditlog_model_cache[res_model],
                 'res_id': res_id,
                 'method': method,
                 'user_id': uid,
-                'http_request_id': http_request_model.current_http_request(),
-                'http_session_id': http_session_model.current_http_session(),
+                'http_request_id': http_request_id,
+                'http_session_id': http_session_id,
             }
             vals.update(additional_log_values or {})
-            log = log_model.create(vals)
+            vals_list.append(vals)
+        logs = log_model.create(vals_list)
+
+        lines = []
+        for log in logs:
+            res_id = log.res_id
             diff = DictDiffer(
                 new_values.get(res_id, EMPTY_DICT),
                 old_values.get(res_id, EMPTY_DICT))
-            if method is 'create':
-                self._create_log_line_on_create(log, diff.added(), new_values)
-            elif method is 'read':
-                self._create_log_line_on_read(
+            if method == 'create':
+                lines += self._create_log_line_on_create(
+                    log, diff.added(), new_values)
+            elif method == 'read':
+                lines += self._create_log_line_on_read(
                     log,
                     list(old_values.get(res_id, EMPTY_DICT).keys()), old_values
                 )
-            elif method is 'write':
-                self._create_log_line_on_write(
+            elif method == 'write':
+                lines += self._create_log_line_on_write(
                     log, diff.changed(), old_values, new_values)
+        self._set_x2many_value_text(method, lines)
+        self.env['auditlog.log.line'].create([vals for __, __, vals in lines])
+        return logs
 
     def _get_field(self, model, field_name):
         cache = self.pool._auditlog_field_cache
@@ -400,19 +511,25 @@ class AuditlogRule(models.Model):
                 cache[model.model][field_name] = field_data
         return cache[model.model][field_name]
 
-    def _create_log_line_on_read(
-            self, log, fields_list, read_values):
-        """Log field filled on a 'read' operation."""
-        log_line_model = self.env['auditlog.log.line']
+    def _get_log_line_fields(self, log, fields_list):
+        """Yield the ir.model.fields data of the loggable fields."""
         for field_name in fields_list:
             if field_name in FIELDS_BLACKLIST:
                 continue
             field = self._get_field(log.model_id, field_name)
             # not all fields have an ir.models.field entry (ie. related fields)
             if field:
-                log_vals = self._prepare_log_line_vals_on_read(
-                    log, field, read_values)
-                log_line_model.create(log_vals)
+                yield field
+
+    def _create_log_line_on_read(
+            self, log, fields_list, read_values):
+        """Log field filled on a 'read' operation.
+        Return a list of (log, field, vals), created by `create_logs`.
+        """
+        return [
+            (log, field, self._prepare_log_line_vals_on_read(
+                log, field, read_values))
+            for field in self._get_log_line_fields(log, fields_list)]
 
     def _prepare_log_line_vals_on_read(self, log, field, read_values):
         """Prepare the dictionary of values used to create a log line on a
@@ -426,25 +543,17 @@ class AuditlogRule(models.Model):
             'new_value': False,
             'new_value_text': False,
         }
-        if field['relation'] and '2many' in field['ttype']:
-            old_value_text = self.env[field['relation']].browse(
-                vals['old_value']).name_get()
-            vals['old_value_text'] = old_value_text
         return vals
 
     def _create_log_line_on_write(
             self, log, fields_list, old_values, new_values):
-        """Log field updated on a 'write' operation."""
-        log_line_model = self.env['auditlog.log.line']
-        for field_name in fields_list:
-            if field_name in FIELDS_BLACKLIST:
-                continue
-            field = self._get_field(log.model_id, field_name)
-            # not all fields have an ir.models.field entry (ie. related fields)
-            if field:
-                log_vals = self._prepare_log_line_vals_on_write(
-                    log, field, old_values, new_values)
-                log_line_model.create(log_vals)
+        """Log field updated on a 'write' operation.
+        Return a list of (log, field, vals), created by `create_logs`.
+        """
+        return [
+            (log, field, self._prepare_log_line_vals_on_write(
+                log, field, old_values, new_values))
+            for field in self._get_log_line_fields(log, fields_list)]
 
     def _prepare_log_line_vals_on_write(
             self, log, field, old_values, new_values):
@@ -459,40 +568,17 @@ class AuditlogRule(models.Model):
             'new_value': new_values[log.res_id][field['name']],
             'new_value_text': new_values[log.res_id][field['name']],
         }
-        # for *2many fields, log the name_get
-        if log.log_type == 'full' and field['relation'] \
-                and '2many' in field['ttype']:
-            # Filter IDs to prevent a 'name_get()' call on deleted resources
-            existing_ids = self.env[field['relation']]._search(
-                [('id', 'in', vals['old_value'])])
-            old_value_text = []
-            if existing_ids:
-                existing_values = self.env[field['relation']].browse(
-                    existing_ids).name_get()
-                old_value_text.extend(existing_values)
-            # Deleted resources will have a 'DELETED' text representation
-            deleted_ids = set(vals['old_value']) - set(existing_ids)
-            for deleted_id in deleted_ids:
-                old_value_text.append((deleted_id, 'DELETED'))
-            vals['old_value_text'] = old_value_text
-            new_value_text = self.env[field['relation']].browse(
-                vals['new_value']).name_get()
-            vals['new_value_text'] = new_value_text
         return vals
 
     def _create_log_line_on_create(
             self, log, fields_list, new_values):
-        """Log field filled on a 'create' operation."""
-        log_line_model = self.env['auditlog.log.line']
-        for field_name in fields_list:
-            if field_name in FIELDS_BLACKLIST:
-                continue
-            field = self._get_field(log.model_id, field_name)
-            # not all fields have an ir.models.field entry (ie. related fields)
-            if field:
-                log_vals = self._prepare_log_line_vals_on_create(
-                    log, field, new_values)
-                log_line_model.create(log_vals)
+        """Log field filled on a 'create' operation.
+        Return a list of (log, field, vals), created by `create_logs`.
+        """
+        return [
+            (log, field, self._prepare_log_line_vals_on_create(
+                log, field, new_values))
+            for field in self._get_log_line_fields(log, fields_list)]
 
     def _prepare_log_line_vals_on_create(self, log, field, new_values):
         """Prepare the dictionary of values used to create a log line on a
@@ -506,13 +592,47 @@ class AuditlogRule(models.Model):
             'new_value': new_values[log.res_id][field['name']],
             'new_value_text': new_values[log.res_id][field['name']],
         }
-        if log.log_type == 'full' and field['relation'] \
-                and '2many' in field['ttype']:
-            new_value_text = self.env[field['relation']].browse(
-                vals['new_value']).name_get()
-            vals['new_value_text'] = new_value_text
         return vals
 
+    def _set_x2many_value_text(self, method, lines):
+        """Replace the IDs of *2many values by their 'name_get()' in the
+        '*_value_text' of `lines`, with one 'name_get()' per relation model.
+        Old values of a 'write' on deleted resources are logged as 'DELETED'.
+        """
+        to_name = []
+        for log, field, vals in lines:
+            if not field['relation'] or '2many' not in field['ttype']:
+                continue
+            if method == 'read':
+                to_name.append((field['relation'], vals, 'old_value', False))
+            elif log.log_type in ('full', 'diff') and method == 'write':
+                to_name.append((field['relation'], vals, 'old_value', True))
+                to_name.append((field['relation'], vals, 'new_value', False))
+            elif log.log_type in ('full', 'diff') and method == 'create':
+                to_name.append((field['relation'], vals, 'new_value', False))
+        if not to_name:
+            return
+
+        ids_by_model = {}
+        for relation, vals, key, __ in to_name:
+            ids_by_model.setdefault(relation, set()).update(vals[key] or [])
+        names = {}
+        for relation, ids in ids_by_model.items():
+            # Filter IDs to prevent a 'name_get()' call on deleted resources
+            existing_ids = self.env[relation].with_context(active_test=False)._search([('id', 'in', list(ids))])
+            names[relation] = dict(
+                self.env[relation].browse(existing_ids).name_get())
+
+        for relation, vals, key, mark_deleted in to_name:
+            value_text = []
+            for res_id in vals[key] or []:
+                if res_id in names[relation]:
+                    value_text.append((res_id, names[relation][res_id]))
+                elif mark_deleted:
+                    # Deleted resources will have a 'DELETED' text
+                    value_text.append((res_id, 'DELETED'))
+            vals[key + '_text'] = value_text
+
     @api.multi
     def subscribe(self):
         """Subscribe Rule for auditing changes on model and apply shortcut
@@ -539,6 +659,9 @@ class AuditlogRule(models.Model):
         """Unsubscribe Auditing Rule on model."""
         # Revert patched methods
         self._revert_methods()
+        for rule in self:
+            getattr(self.pool, '_auditlog_field_cache', {}).pop(
+                rule.model_id.model, None)
         for rule in self:
             # Remove the shortcut to view logs
             act_window = rule.action_id
@@ -80,6 +80,34 @@ class AuditlogCommon(object):
             ('res_id', '=', testgroup4.id),
         ]).ensure_one())
 
+    def test_LogCreation4(self):
+        """Fourth test, several groups created at once: one log per group,
+        logs and lines being created in batch.
+        """
+
+        self.groups_rule.subscribe()
+        auditlog_log = self.env['auditlog.log']
+        testgroup5 = self.env['res.groups'].create({
+            'name': 'testgroup5',
+        })
+        groups = self.env['res.groups'].create([
+            {'name': 'testgroup6', 'implied_ids': [(4, testgroup5.id)]},
+            {'name': 'testgroup7', 'implied_ids': [(4, testgroup5.id)]},
+        ])
+        for group in groups:
+            log = auditlog_log.search([
+                ('model_id', '=', self.groups_model_id),
+                ('method', '=', 'create'),
+                ('res_id', '=', group.id),
+            ]).ensure_one()
+            name_line = log.line_ids.filtered(
+                lambda l: l.field_id.name == 'name')
+            self.assertEqual(name_line.new_value, group.name)
+            if self.groups_rule.log_type in ('full', 'diff'):
+                implied_line = log.line_ids.filtered(
+                    lambda l: l.field_id.name == 'implied_ids')
+                self.assertIn('testgroup5', implied_line.new_value_text)
+
 
 class TestAuditlogFull(TransactionCase, AuditlogCommon):
 
@@ -100,6 +128,58 @@ class TestAuditlogFull(TransactionCase, AuditlogCommon):
         self.groups_rule.unlink()
         super(TestAuditlogFull, self).tearDown()
 
+    def test_FieldCache(self):
+        """Fields of the model are cached when the rule is subscribed,
+        and the cache is dropped when a field changes.
+        """
+
+        self.groups_rule.subscribe()
+        cache = self.env.registry._auditlog_field_cache
+        self.assertEqual(cache['res.groups']['name']['ttype'], 'char')
+        self.env['ir.model.fields'].create({
+            'name': 'x_auditlog_test',
+            'field_description': "Auditlog test",
+            'model_id': self.groups_model_id,
+            'ttype': 'char',
+        })
+        self.assertNotIn('res.groups', cache)
+
+
+class TestAuditlogDiff(TransactionCase, AuditlogCommon):
+
+    def setUp(self):
+        super(TestAuditlogDiff, self).setUp()
+        self.groups_model_id = self.env.ref('base.model_res_groups').id
+        self.groups_rule = self.env['auditlog.rule'].create({
+            'name': 'testrule for groups',
+            'model_id': self.groups_model_id,
+            'log_read': True,
+            'log_create': True,
+            'log_write': True,
+            'log_unlink': True,
+            'log_type': 'diff',
+        })
+
+    def tearDown(self):
+        self.groups_rule.unlink()
+        super(TestAuditlogDiff, self).tearDown()
+
+    def test_LogFields(self):
+        """Only the written fields and the stored fields depending on them
+        are read.
+        """
+        rule_model = self.env['auditlog.rule']
+        groups_model = self.env['res.groups']
+        fields_list = rule_model._get_log_fields(
+            groups_model, 'diff', {'name': 'x'})
+        self.assertIn('name', fields_list)
+        # res.groups.full_name is not stored
+        self.assertNotIn('full_name', fields_list)
+        self.assertNotIn('implied_ids', fields_list)
+        all_fields = rule_model._get_log_fields(groups_model, 'diff')
+        self.assertIn('implied_ids', all_fields)
+        self.assertNotIn('full_name', all_fields)
+
 
 class TestAuditlogFast(TransactionCase, AuditlogCommon):
 
@@ -119,3 +199,51 @@ class TestAuditlogFast(TransactionCase, AuditlogCommon):
     def tearDown(self):
         self.groups_rule.unlink()
         super(TestAuditlogFast, self).tearDown()
+
+
+class TestAuditlogAsync(TransactionCase):
+
+    def setUp(self):
+        super(TestAuditlogAsync, self).setUp()
+        self.groups_model_id = self.env.ref('base.model_res_groups').id
+        self.groups_rule = self.env['auditlog.rule'].create({
+            'name': 'testrule for groups',
+            'model_id': self.groups_model_id,
+            'log_create': True,
+            'log_write': True,
+            'log_unlink': True,
+            'log_type': 'full',
+            'log_async': True,
+        })
+
+    def tearDown(self):
+        self.groups_rule.unlink()
+        super(TestAuditlogAsync, self).tearDown()
+
+    def test_LogQueue(self):
+        """Logs are queued, then written by the flush."""
+
+        self.groups_rule.subscribe()
+        auditlog_log = self.env['auditlog.log']
+        queue_model = self.env['auditlog.queue']
+        nb_queued = queue_model.search_count([])
+        group = self.env['res.groups'].create({
+            'name': 'testgroup1',
+        })
+        group.write({'name': 'Testgroup1'})
+        group_id = group.id
+        group.unlink()
+        domain = [
+            ('model_id', '=', self.groups_model_id),
+            ('res_id', '=', group_id),
+        ]
+        self.assertFalse(auditlog_log.search(domain))
+        self.assertEqual(queue_model.search_count([]), nb_queued + 3)
+
+        queue_model.flush()
+        logs = auditlog_log.search(domain)
+        self.assertEqual(
+            sorted(logs.mapped('method')), ['create', 'unlink', 'write'])
+        self.assertEqual(
+            logs.filtered(lambda l: l.method == 'unlink').name, 'Testgroup1')
+        self.assertFalse(queue_model.search([('error', '=', False)]))
@@ -1,5 +1,10 @@
 # Copyright 2016 ABF OSIELL <https://osiell.com>
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import gzip
+import json
+import os
+import shutil
+import tempfile
 import time
 
 from odoo.tests.common import TransactionCase
@@ -45,3 +50,26 @@ class TestAuditlogAutovacuum(TransactionCase):
             ('res_id', '=', group.id),
         ])
         self.assertEqual(nb_logs, 0)
+
+    def test_autovacuum_chunks_archive(self):
+        log_model = self.env['auditlog.log']
+        autovacuum_model = self.env['auditlog.autovacuum']
+        groups = self.env['res.groups'].create([
+            {'name': 'testgroup%s' % i} for i in range(3)])
+        logs = log_model.search([
+            ('model_id', '=', self.groups_model_id),
+            ('res_id', 'in', groups.ids),
+        ])
+        self.assertEqual(len(logs), 3)
+        time.sleep(1)
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        autovacuum_model.autovacuum(
+            days=0, chunk_size=2, archive_dir=archive_dir)
+        self.assertFalse(logs.exists())
+        archived_ids = set()
+        for name in os.listdir(archive_dir):
+            if name.startswith('auditlog_log-'):
+                with gzip.open(os.path.join(archive_dir, name), 'rt') as f:
+                    archived_ids.update(json.loads(line)['id'] for line in f)
+        self.assertTrue(set(logs.ids) <= archived_ids)
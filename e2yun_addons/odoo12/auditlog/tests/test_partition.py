@@ -0,0 +1,56 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import unittest
+
+from odoo.tests.common import TransactionCase
+
+from ..models.partition import is_partitioned
+
+
+class TestAuditlogPartition(TransactionCase):
+
+    def setUp(self):
+        super(TestAuditlogPartition, self).setUp()
+        if self.env.cr._cnx.server_version < 110000:
+            raise unittest.SkipTest("PostgreSQL 11 or later required")
+        # DDL is rolled back with the test transaction
+        self.env['auditlog.partition'].convert()
+
+    def test_reinit_partitioned(self):
+        """Updating the module does not add back the lines -> log key."""
+        self.assertTrue(is_partitioned(self.env.cr))
+        for model in ('auditlog.log', 'auditlog.log.line'):
+            self.env[model]._auto_init()
+        self.env.cr.execute("""
+            SELECT 1 FROM pg_constraint
+             WHERE conrelid = 'auditlog_log_line'::regclass
+               AND confrelid = 'auditlog_log'::regclass
+        """)
+        self.assertFalse(self.env.cr.fetchall())
+
+    def test_autovacuum_default_partition(self):
+        """Expired logs of the default partition are deleted with their
+        lines, by chunks."""
+        log_model = self.env['auditlog.log']
+        logs = log_model.create([{
+            'name': 'test partition %s' % i,
+            'model_id': self.env.ref('base.model_res_groups').id,
+            'res_id': i,
+            'method': 'write',
+            'line_ids': [(0, 0, {
+                'field_id': self.env.ref('base.field_res_groups__name').id,
+                'old_value': 'old', 'new_value': 'new'})],
+        } for i in range(3)])
+        lines = logs.mapped('line_ids')
+        # Months without partition go to the default one
+        for table, ids in (('auditlog_log', logs.ids),
+                           ('auditlog_log_line', lines.ids)):
+            self.env.cr.execute(
+                "UPDATE {} SET create_date = '2000-01-15' WHERE id IN %s"
+                .format(table), (tuple(ids),))
+        self.env.cr.execute(
+            "SELECT count(*) FROM auditlog_log_pdefault WHERE id IN %s",
+            (tuple(logs.ids),))
+        self.assertEqual(self.env.cr.fetchone()[0], 3)
+        self.env['auditlog.autovacuum'].autovacuum(days=1, chunk_size=2)
+        self.assertFalse(logs.exists())
+        self.assertFalse(lines.exists())
@@ -19,9 +19,14 @@ replace website google map with baidu map
 
 
 add Geolocation map for partner view 
+
+
+geocoding results are cached by address, partners can be geolocated later by a batch job
     """,
     'depends': ['base','base_geolocalize','e2yun_geoengine_maps'],
-    'data': ['views/res_partner_views.xml',
+    'data': ['security/ir.model.access.csv',
+             'data/ir_cron.xml',
+             'views/res_partner_views.xml',
              'views/website_templates.xml'
     ],
     'installable': True,
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+import logging
+import re
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+
+def normalize_address(address):
+    """Lower case address without repeated spaces nor spaces around separators,
+    so that the same address typed differently is geocoded once."""
+    address = re.sub(r'\s+', ' ', tools.ustr(address or '').strip().lower())
+    return re.sub(r'\s*([,，;；])\s*', r'\1', address)
+
+
+class GeocodeCache(models.Model):
+    _name = 'geocode.cache'
+    _description = 'Geocoding Results Cache'
+    _rec_name = 'address'
+
+    provider = fields.Selection([('baidu', 'Baidu'), ('bing', 'Bing')], required=True)
+    address = fields.Char(required=True, help="Normalized address")
+    found = fields.Boolean(help="Unchecked when the provider could not geolocate the address")
+    latitude = fields.Float(string='Geo Latitude', digits=(16, 5))
+    longitude = fields.Float(string='Geo Longitude', digits=(16, 5))
+
+    _sql_constraints = [
+        ('provider_address_uniq', 'unique (provider, address)', 'This address is already cached!'),
+    ]
+
+    @api.model
+    def _get_ttl_days(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('geocode.cache_days', default=180))
+
+    @api.model
+    def lookup(self, provider, addresses):
+        """Get the cached results of normalized ``addresses``, if geocoded less than
+        ``geocode.cache_days`` days ago (system parameter, 180 by default).
+
+        :return: dict address: (latitude, longitude), or None if the address was not found
+        """
+        if not addresses:
+            return {}
+        limit = fields.Datetime.now() - timedelta(days=self._get_ttl_days())
+        self.env.cr.execute("""
+            SELECT address, found, latitude, longitude FROM geocode_cache
+             WHERE provider = %s AND address IN %s AND write_date >= %s
+        """, (provider, tuple(addresses), limit))
+        return {address: (latitude, longitude) if found else None
+                for address, found, latitude, longitude in self.env.cr.fetchall()}
+
+    @api.model
+    def store(self, provider, results):
+        """Cache geocoding results in one statement.
+
+        :param results: dict normalized address: (latitude, longitude), or None if not found
+        """
+        if not results:
+            return
+        now = fields.Datetime.now()
+        rows = [(provider, address, bool(result), result and result[0] or 0.0, result and result[1] or 0.0,
+                 self.env.uid, now, self.env.uid, now)
+                for address, result in results.items()]
+        execute_values(self.env.cr._obj, """
+            INSERT INTO geocode_cache (provider, address, found, latitude, longitude,
+                                       create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (provider, address) DO UPDATE
+               SET found = EXCLUDED.found, latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude,
+                   write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+        """, rows, page_size=len(rows))
+        self.invalidate_cache()
+
+    @api.model
+    def vacuum(self):
+        """Delete the results older than ``geocode.cache_days`` days."""
+        limit = fields.Datetime.now() - timedelta(days=self._get_ttl_days())
+        self.env.cr.execute("DELETE FROM geocode_cache WHERE write_date < %s", (limit,))
+        _logger.info("%s expired geocoding results deleted", self.env.cr.rowcount)
+        self.invalidate_cache()
+        return True
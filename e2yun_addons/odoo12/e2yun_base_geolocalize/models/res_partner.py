@@ -3,16 +3,66 @@
 import json
 import werkzeug
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from psycopg2.extras import execute_values
 
 from odoo import api, fields, models, tools, _
 from odoo.addons.base_geoengine import fields as geo_fields
 from odoo.exceptions import UserError
 
+from .geocode_cache import normalize_address
+
 _logger = logging.getLogger(__name__)
 
-def geo_find_baidu(addr,city, apikey=False):
+BAIDU_GEOCODE_URL = "http://api.map.baidu.com/geocoder/v2/?"
+BING_GEOCODE_URL = "https://dev.virtualearth.net/REST/v1/Locations/?"
+# seconds to wait for the geocoding servers
+GEOCODE_TIMEOUT = 10
+# Baidu status of exceeded quotas: quota check, daily quota, concurrency
+BAIDU_QUOTA_STATUS = (4, 302, 401, 402)
+ADDRESS_FIELDS = ('street', 'street2', 'city', 'country_id', 'zip', 'state_id', 'zip_id')
+
+_session_lock = threading.Lock()
+_session = None
+
+
+class GeocodeQuotaError(UserError):
+    """The quota of the geocoding provider is exceeded"""
+
+
+def get_geocode_session(pool_size=10):
+    """HTTP session shared by the geocoding requests of the process, keeping connections alive"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+class Throttle(object):
+    """Limit calls to ``rate`` per second, shared by threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+def geo_find_baidu(addr,city, apikey=False, session=None, url=None):
     if not addr:
         return None
 
@@ -22,9 +72,10 @@ def geo_find_baidu(addr,city, apikey=False):
                           Visit http://lbsyun.baidu.com/apiconsole/key/create for more information.
                           '''))
 
-    url = "http://api.map.baidu.com/geocoder/v2/?"
     try:
-        result = requests.get(url, params={'address': addr, 'city': city,'output': 'json', 'ak': apikey}).json()
+        result = (session or requests).get(url or BAIDU_GEOCODE_URL,
+                                           params={'address': addr, 'city': city, 'output': 'json', 'ak': apikey},
+                                           timeout=GEOCODE_TIMEOUT).json()
     except Exception as e:
         raise UserError(_('Cannot contact geolocation servers. Please make sure that your Internet connection is up and running (%s).') % e)
     status_message = 'OK'
@@ -55,6 +106,8 @@ def geo_find_baidu(addr,city, apikey=False):
                           'Then, go to Developer Console, and enable the APIs:\n'
                           'Geocoding, Maps Static, Maps Javascript.\n'
                           % (result['status'], status_message))
+            if result['status'] in BAIDU_QUOTA_STATUS:
+                raise GeocodeQuotaError(error_msg)
             raise UserError(error_msg)
 
     try:
@@ -63,7 +116,7 @@ def geo_find_baidu(addr,city, apikey=False):
     except (KeyError, ValueError):
         return None
 
-def geo_find_bing(addr, apikey=False):
+def geo_find_bing(addr, apikey=False, session=None, url=None):
     if not addr:
         return None
 
@@ -74,9 +127,14 @@ def geo_find_bing(addr, apikey=False):
                           for more information.
                           '''))
 
-    url = "https://dev.virtualearth.net/REST/v1/Locations/?"
     try:
-        result = requests.get(url, params={'q':addr, 'o':'json', 'key':apikey}).json()
+        response = (session or requests).get(url or BING_GEOCODE_URL, params={'q': addr, 'o': 'json', 'key': apikey},
+                                             timeout=GEOCODE_TIMEOUT)
+        if response.status_code == 429:
+            raise GeocodeQuotaError(_('Unable to geolocate, Bing rate limit exceeded.'))
+        result = response.json()
+    except GeocodeQuotaError:
+        raise
     except Exception as e:
         raise UserError(_('Cannot contact geolocation servers. Please make sure that your Internet connection is up and running (%s).') % e)
 
@@ -118,28 +176,130 @@ class ResPartner(models.Model):
     _inherit = "res.partner"
     # Geometry Field
     shape = fields.GeoPoint('Coordinate')
+    geo_pending = fields.Boolean('Geolocation Pending', index=True, copy=False,
+                                 help="Address changed, to be geolocated by the batch geocoding job")
 
     # partner_latitude = fields.Float(string='Geo Latitude', digits=(16, 5))
     # partner_longitude = fields.Float(string='Geo Longitude', digits=(16, 5))
     # date_localization = fields.Date(string='Geolocation Date')
     def create_geometry(self):
-        for partner in self:
-            lat = partner.partner_latitude
-            lng = partner.partner_longitude
-            point = geo_fields.GeoPoint.from_latlon(cr=partner.env.cr,
-                                                    latitude=lat,
-                                                    longitude=lng)
-            partner.shape = point
+        self._sync_shape_from_latlon()
+
+    @api.multi
+    def _sync_shape_from_latlon(self):
+        """Set the shape of the partners from their latitude and longitude, in one statement"""
+        if not self.ids:
+            return
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET shape = ST_Transform(ST_SetSRID(ST_MakePoint(partner_longitude, partner_latitude), 4326),
+                                        %s)
+             WHERE id IN %s
+        """, (self._fields['shape'].srid, tuple(self.ids)))
+        self.invalidate_cache(['shape'], self.ids)
+
+    @api.multi
+    def _sync_latlon_from_shape(self):
+        """Set the latitude and longitude of the partners from their shape, in one statement"""
+        if not self.ids:
+            return
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET partner_latitude = ST_Y(ST_Transform(shape, 4326)),
+                   partner_longitude = ST_X(ST_Transform(shape, 4326))
+             WHERE id IN %s AND shape IS NOT NULL
+        """, (tuple(self.ids),))
+        self.invalidate_cache(['partner_latitude', 'partner_longitude'], self.ids)
+
+    @api.model
+    def _write_geolocations(self, locations, date=None):
+        """Write the coordinates and shapes of many partners in one statement.
+
+        :param locations: dict partner id: (latitude, longitude)
+        :param date: geolocation date, today by default
+        """
+        if not locations:
+            return
+        date = date or fields.Date.context_today(self)
+        srid = self._fields['shape'].srid
+        rows = [(partner_id, lat, lng, date, srid, self.env.uid) for partner_id, (lat, lng) in locations.items()]
+        execute_values(self.env.cr._obj, """
+            UPDATE res_partner p
+               SET partner_latitude = v.lat, partner_longitude = v.lng, date_localization = v.date,
+                   shape = ST_Transform(ST_SetSRID(ST_MakePoint(v.lng, v.lat), 4326), v.srid),
+                   write_uid = v.uid, write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS v (id, lat, lng, date, srid, uid)
+             WHERE p.id = v.id
+        """, rows, template='(%s, %s::float8, %s::float8, %s::date, %s, %s)', page_size=len(rows))
+        self.browse(list(locations)).invalidate_cache(
+            ['partner_latitude', 'partner_longitude', 'date_localization', 'shape', 'write_uid', 'write_date'])
+
+    @api.model
+    def backfill_shapes(self, from_shape=False, chunk_size=50000):
+        """Set the missing shapes of geolocated partners from their latitude and longitude
+        (or the missing coordinates from the shapes with ``from_shape``), by ranges of
+        ``chunk_size`` ids committed one by one. To be called from an Odoo shell, e.g. after
+        importing partners with their coordinates.
+
+        :return: number of partners updated
+        """
+        testing = getattr(threading.currentThread(), 'testing', False)
+        cr = self.env.cr
+        cr.execute("SELECT min(id), max(id) FROM res_partner")
+        min_id, max_id = cr.fetchone()
+        if from_shape:
+            query = """
+                UPDATE res_partner
+                   SET partner_latitude = ST_Y(ST_Transform(shape, 4326)),
+                       partner_longitude = ST_X(ST_Transform(shape, 4326))
+                 WHERE id >= %s AND id < %s AND shape IS NOT NULL
+                   AND coalesce(partner_latitude, 0) = 0 AND coalesce(partner_longitude, 0) = 0
+            """
+            params = ()
+        else:
+            query = """
+                UPDATE res_partner
+                   SET shape = ST_Transform(ST_SetSRID(ST_MakePoint(partner_longitude, partner_latitude), 4326),
+                                            %s)
+                 WHERE id >= %s AND id < %s AND shape IS NULL
+                   AND (coalesce(partner_latitude, 0) != 0 OR coalesce(partner_longitude, 0) != 0)
+            """
+            params = (self._fields['shape'].srid,)
+        nb_partners = 0
+        start = min_id or 0
+        while min_id is not None and start <= max_id:
+            cr.execute(query, params + (start, start + chunk_size))
+            nb_partners += cr.rowcount
+            if not testing:
+                cr.commit()
+            start += chunk_size
+            _logger.info("partner shapes: %s/%s ids done, %s partners updated", start - min_id,
+                         max_id - min_id + 1, nb_partners)
+        self.invalidate_cache(['shape', 'partner_latitude', 'partner_longitude'])
+        return nb_partners
+
+    @api.model
+    def _geo_localize_deferred(self):
+        """Geolocate partners whose address changed later, by the batch geocoding job, if the system
+        parameter ``geocode.defer`` is set or with ``defer_geo_localize`` in the context."""
+        if 'defer_geo_localize' in self.env.context:
+            return bool(self.env.context['defer_geo_localize'])
+        return bool(self.env['ir.config_parameter'].sudo().get_param('geocode.defer'))
 
     @api.model
     def create(self, vals):
+        deferred = not (vals.get('partner_latitude') or vals.get('partner_longitude')) and \
+            self._geo_localize_deferred()
+        if deferred:
+            vals = dict(vals, geo_pending=True)
         res = super(ResPartner, self).create(vals)
-        lat = self.partner_latitude
-        lng = self.partner_longitude
+        lat = res.partner_latitude
+        lng = res.partner_longitude
         if lat == 0.0 and lng == 0.0:
-            res.geo_localize()
+            if not deferred:
+                res.geo_localize()
         else:
-            self.create_geometry()
+            res.create_geometry()
         return res
 
     @classmethod
@@ -161,66 +321,200 @@ class ResPartner(models.Model):
         return result
 
     @api.multi
-    def geo_localize(self):
+    def _geo_localize_queries(self):
+        """
+        :return: (provider, full address, city level address, city) of the partner
+        """
+        self.ensure_one()
+        street = self.street
+        if self.street2:
+            street = (street or '') + self.street2
+        provider = 'baidu' if self.country_id.code == 'CN' else 'bing'
+        state = self.state_id.name
+        country = self.country_id.name
+        return (provider,
+                geo_query_address(street=street, zip=self.zip, city=self.city, state=state, country=country),
+                geo_query_address(city=self.city, state=state, country=country),
+                self.city)
+
+    @api.model
+    def _geocode(self, queries, raise_errors=True, over_quota=None):
+        """Geocode addresses, each distinct address once: cached results first, the others
+        from the providers, by a pool of ``geocode.workers`` threads (4 by default) sending at most
+        ``geocode.rate`` requests per second (10 by default). Requests of a provider whose quota is
+        exceeded are stopped. Provider URLs can be replaced by the system parameters
+        ``baidu.geocode_url`` and ``bing.geocode_url``, e.g. by a local stub geocoder.
+
+        :param queries: list of (provider, address, city)
+        :param raise_errors: raise the first error, else only log errors
+        :param over_quota: set of the providers whose quota is exceeded, not requested, updated
+            with the providers exceeding their quota, to share between calls
+        :return: dict (provider, normalized address): (latitude, longitude) or None if not found,
+            addresses in error are left out
+        """
+        Param = self.env['ir.config_parameter'].sudo()
+        cache = self.env['geocode.cache'].sudo()
+        to_find = {}
+        results = {}
+        for provider, address, city in queries:
+            key = (provider, normalize_address(address))
+            if key[1] and key not in to_find:
+                to_find[key] = (address, city)
+        for provider in set(key[0] for key in to_find):
+            cached = cache.lookup(provider, [key[1] for key in to_find if key[0] == provider])
+            for address, result in cached.items():
+                results[(provider, address)] = result
+                del to_find[(provider, address)]
+        if not to_find:
+            return results
+
+        workers = int(Param.get_param('geocode.workers', default=4))
+        throttle = Throttle(float(Param.get_param('geocode.rate', default=10)))
+        session = get_geocode_session(workers)
+        apikeys = {
+            'baidu': Param.get_param('baidu.api_key_geocode', default='LSh6ALesEBqAus4GCDurc0sRSkbrqfjH'),
+            'bing': Param.get_param('bing.api_key_geocode',
+                                    default='AqY4IFeQhJPHi5FjGBNc7hfgUNcaVf7S_qyyP_dlVCesSJUqI7dBA-gsyoAIUvGu'),
+        }
+        urls = {
+            'baidu': Param.get_param('baidu.geocode_url') or BAIDU_GEOCODE_URL,
+            'bing': Param.get_param('bing.geocode_url') or BING_GEOCODE_URL,
+        }
+        if over_quota is None:
+            over_quota = set()
+        skipped = set(over_quota)
+
+        def find(item):
+            (provider, normalized), (address, city) = item
+            if provider in over_quota:
+                return None, None
+            throttle.wait()
+            try:
+                if provider == 'baidu':
+                    return geo_find_baidu(address, city, apikeys[provider], session, urls[provider]), None
+                return geo_find_bing(address, apikeys[provider], session, urls[provider]), None
+            except GeocodeQuotaError as e:
+                over_quota.add(provider)
+                return None, e
+            except Exception as e:
+                return None, e
+
+        found = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for (key, value), (result, error) in zip(to_find.items(), executor.map(find, to_find.items())):
+                if error is not None:
+                    errors.append(error)
+                elif key[0] not in over_quota or result:
+                    found[key] = result
+        for provider in set(key[0] for key in found):
+            cache.store(provider, {key[1]: result for key, result in found.items() if key[0] == provider})
+        results.update(found)
+        _logger.info("geocoded %s addresses: %s cached, %s found, %s errors", len(results) + len(errors),
+                     len(results) - len(found), len(found), len(errors))
+        for provider in over_quota - skipped:
+            _logger.warning("%s geocoding quota exceeded, requests stopped", provider)
+        if errors and raise_errors:
+            raise errors[0]
+        return results
+
+    @api.multi
+    def _geo_localize_batch(self, raise_errors=True, over_quota=None):
+        """Geolocate the partners with `_geocode`, their city if their address is not found.
+
+        :param over_quota: set of the providers whose quota is exceeded, see `_geocode`
+        :return: partners whose geolocation is done, found or not
+        """
         # We need country names in English below
         lang = self.env.lang if self.env.lang else self.env.user.lang
-        for partner in self.with_context(lang=lang):
-            street = partner.street
-            if partner.street2:
-                street += partner.street2
-            if partner.country_id.code == 'CN':
-                apikey = self.env['ir.config_parameter'].sudo().get_param('baidu.api_key_geocode',
-                                                                          default='LSh6ALesEBqAus4GCDurc0sRSkbrqfjH')
-
-                result = partner._geo_localize_cn(apikey,
-                                               street,
-                                               partner.zip,
-                                               partner.city,
-                                               partner.state_id.name,
-                                               partner.country_id.name)
-            else:
-                apikey = self.env['ir.config_parameter'].sudo().get_param('bing.api_key_geocode',
-                                                                          default='AqY4IFeQhJPHi5FjGBNc7hfgUNcaVf7S_qyyP_dlVCesSJUqI7dBA-gsyoAIUvGu')
-                result = partner._geo_localize_en(apikey,
-                                               street,
-                                               partner.zip,
-                                               partner.city,
-                                               partner.state_id.name,
-                                               partner.country_id.name)
+        partners = self.with_context(lang=lang)
+        queries = {partner.id: partner._geo_localize_queries() for partner in partners}
+        if over_quota is None:
+            over_quota = set()
+        results = self._geocode([(provider, search, city) for provider, search, fallback, city in queries.values()],
+                                raise_errors, over_quota)
+        fallbacks = [(provider, fallback, city) for provider, search, fallback, city in queries.values()
+                     if not normalize_address(search) or
+                     results.get((provider, normalize_address(search)), False) is None]
+        results.update(self._geocode(fallbacks, raise_errors, over_quota))
+
+        done = self.browse()
+        locations = {}
+        for partner in partners:
+            provider, search, fallback, city = queries[partner.id]
+            search_key = (provider, normalize_address(search))
+            fallback_key = (provider, normalize_address(fallback))
+            result = results.get(search_key, False) if search_key[1] else None
+            if result is None:
+                # address not found: city level address
+                result = results.get(fallback_key, False) if fallback_key[1] else None
+            if result is False:
+                # provider error, to be retried
+                continue
+            done |= partner
             if result:
-                lat = result[0]
-                lng = result[1]
-                point = geo_fields.GeoPoint.from_latlon(cr=partner.env.cr,
-                                                        latitude=lat,
-                                                        longitude=lng)
-                partner.write({
-                    'partner_latitude': result[0],
-                    'partner_longitude': result[1],
-                    'date_localization': fields.Date.context_today(partner),
-                    'shape': point
-                })
+                locations[partner.id] = result
+        self._write_geolocations(locations)
+        done.filtered('geo_pending').write({'geo_pending': False})
+        return done
+
+    @api.multi
+    def geo_localize(self):
+        self._geo_localize_batch(raise_errors=len(self) == 1)
         return True
 
+    @api.model
+    def _cron_geo_localize(self, batch_size=500, time_limit=None):
+        """Geolocate the partners whose geolocation was deferred, by batches of ``batch_size``
+        committed one by one, until no partner is left or ``time_limit`` seconds are spent.
+        Once the quota of a geocoding provider is exceeded, its partners are skipped for the
+        rest of the run. Also deletes expired cached results.
+        """
+        stop_time = time_limit and time.time() + time_limit
+        testing = getattr(threading.currentThread(), 'testing', False)
+        self.env['geocode.cache'].sudo().vacuum()
+        over_quota = set()
+        domain = [('geo_pending', '=', True)]
+        offset = 0
+        while not stop_time or time.time() < stop_time:
+            partners = self.search(domain, order='id', offset=offset, limit=batch_size)
+            if not partners:
+                break
+            quota_exceeded = set(over_quota)
+            done = partners._geo_localize_batch(raise_errors=False, over_quota=over_quota)
+            if not testing:
+                self.env.cr.commit()
+            if over_quota != quota_exceeded:
+                if over_quota >= {'baidu', 'bing'}:
+                    break
+                # partners of a provider over quota stay pending for the next run
+                domain = [('geo_pending', '=', True)] + (
+                    ['|', ('country_id', '=', False), ('country_id.code', '!=', 'CN')]
+                    if 'baidu' in over_quota else [('country_id.code', '=', 'CN')])
+                offset = 0
+                continue
+            # partners in error stay pending for the next run
+            offset += len(partners - done)
+            if not done or len(partners) < batch_size:
+                break
+        return True
 
     @api.multi
     def write(self, vals):
+        address_changed = any(field in vals for field in ADDRESS_FIELDS)
+        deferred = address_changed and 'partner_latitude' not in vals and 'partner_longitude' not in vals and \
+            self._geo_localize_deferred()
+        if deferred:
+            vals = dict(vals, geo_pending=True)
 
         res = super(ResPartner, self).write(vals)
 
         if ('partner_latitude' in vals) or ('partner_longitude' in vals):
             self.create_geometry()
-        elif (('street' in vals) or ('street2' in vals) or ('city' in vals) or
-                  ('country_id' in vals) or ('zip' in vals) or ('state_id' in vals) or
-                  ('zip_id' in vals)):
+        elif address_changed and not deferred:
             self.geo_localize()
         if 'shape' in vals:
-            self.env.cr.execute(
-                """
-                    UPDATE res_partner SET 
-                        partner_latitude = ST_Y(ST_Transform(shape,4326)),
-                        partner_longitude = ST_X(ST_Transform(shape,4326))
-                    WHERE id = %(id)s 
-                """, {'id': self.id})
+            self._sync_latlon_from_shape()
 
         return res
 
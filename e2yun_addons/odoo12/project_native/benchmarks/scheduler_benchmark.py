@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Plan synthetic projects with the scheduler graph, without Odoo.
+
+    python scheduler_benchmark.py [sizes...]     default: 1000 10000 50000
+
+Every task gets up to 3 FS/SS predecessors picked from earlier tasks and
+a duration without calendar, then one forward pass, one backward pass and
+the critical path are timed, like project.task._scheduler_plan_start_calc.
+Then 10 task durations are changed and planned again incrementally.
+"""
+import importlib.util
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    "scheduler_graph", os.path.join(HERE, "..", "tools", "scheduler_graph.py"))
+scheduler_graph = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(scheduler_graph)
+
+PROJECT_START = datetime(2019, 1, 7, 8, 0, 0)
+
+
+def make_project(size, seed=42):
+    rnd = random.Random(seed)
+    tasks = []
+    links = []
+    for task_id in range(1, size + 1):
+        tasks.append({
+            "id": task_id,
+            "plan_duration": rnd.choice([3600, 4 * 3600, 8 * 3600, 86400, 2 * 86400]),
+            "soon_date_start": PROJECT_START,
+            "soon_date_end": PROJECT_START,
+            "late_date_start": PROJECT_START,
+            "late_date_end": PROJECT_START,
+            "schedule_mode": "auto",
+            "constrain_type": "asap",
+            "constrain_date": False,
+            "active": True,
+            "has_children": False,
+        })
+        if task_id == 1:
+            continue
+        for parent_id in set(rnd.randint(max(1, task_id - 50), task_id - 1) for x in range(rnd.randint(0, 3))):
+            links.append({
+                "id": len(links) + 1,
+                "type": "FS" if rnd.random() < 0.9 else "SS",
+                "lag_qty": rnd.choice([0, 0, 0, 1]),
+                "lag_type": "hour",
+                "parent_task_id": parent_id,
+                "task_id": task_id,
+            })
+    return tasks, links
+
+
+def period(task, direction, new_date, date_type):
+    diff = timedelta(seconds=task["plan_duration"])
+    if date_type == "date_start":
+        return False, new_date, new_date + diff
+    return False, new_date - diff, new_date
+
+
+def constrain(task, vals, calendar_level, scheduling_type):
+    return vals, calendar_level
+
+
+def plan(tasks, links):
+    graph = scheduler_graph.SchedulerGraph(tasks, links)
+    graph.schedule("forward", period, constrain, project_date=PROJECT_START)
+    project_end = max(task["soon_date_end"] for task in graph.tasks.values() if task.get("calc"))
+    graph.schedule("backward", period, constrain, project_date=project_end)
+    graph.critical_path()
+    return graph
+
+
+def main(sizes):
+    for size in sizes:
+        tasks, links = make_project(size)
+        start = time.time()
+        graph = plan(tasks, links)
+        elapsed = time.time() - start
+        critical = sum(1 for task in graph.tasks.values() if task["critical_path"])
+        print("{:>7} tasks {:>7} links: {:8.3f}s, {} on critical path".format(
+            size, len(graph.links), elapsed, critical))
+
+        changed_ids = random.Random(size).sample(list(graph.tasks), 10)
+        for task_id in changed_ids:
+            graph.tasks[task_id]["plan_duration"] += 3600
+        start = time.time()
+        moved_ids = graph.propagate("forward", changed_ids, period, constrain, project_date=PROJECT_START)
+        elapsed = time.time() - start
+        print("{:>7} tasks incremental: {:8.3f}s, {} tasks moved".format(size, elapsed, len(moved_ids)))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
@@ -2,6 +2,7 @@
 from . import project_task
 from . import project_task_calendar
 from . import project_task_scheduler
+from . import project_task_batch
 from . import project_task_detail_plan
 from . import project_task_info
 from . import project_task_critical_path
\ No newline at end of file
@@ -178,26 +178,6 @@ class ProjectTaskPredecessor(models.Model):
 
 
 
-    @api.multi
-    def unlink(self):
-
-        parent_task_id = self.parent_task_id
-        res = super(ProjectTaskPredecessor, self).unlink()
-
-        if res:
-            search_if_parent = self.env['project.task.predecessor'].sudo().search_count(
-                [('parent_task_id', '=', parent_task_id.id)])
-
-            if not search_if_parent:
-                parent_task_id.write({
-                    'predecessor_parent': 0
-                })
-
-
-
-
-        return res
-
 
 
 class ProjectTaskNative(models.Model):
@@ -264,6 +244,7 @@ class ProjectTaskNative(models.Model):
     predecessor_ids = fields.One2many('project.task.predecessor', 'task_id', 'Links')
     predecessor_count = fields.Integer(compute='_compute_predecessor_count', string='Predecessor Count', store=True)
     predecessor_parent = fields.Integer(compute='_compute_predecessor_count', string='Predecessor parent', store=True)
+    successor_ids = fields.One2many('project.task.predecessor', 'parent_task_id', 'Successor Links')
 
     # sorting
     sorting_seq = fields.Integer(string='Sorting Seq.')
@@ -418,20 +399,13 @@ class ProjectTaskNative(models.Model):
 
             super(ProjectTaskNative, self)._onchange_project()
 
-    @api.depends("predecessor_ids")
+    @api.depends("predecessor_ids", "successor_ids")
     def _compute_predecessor_count(self):
 
         for task in self:
-            for predecessor in task.predecessor_ids:
-                predecessor.parent_task_id.write({
-                    'predecessor_parent': 1,
-                })
-
-            search_if_parent = self.env['project.task.predecessor'].sudo().search_count(
-                [('parent_task_id', '=', task.id)])
             task.update({
                 'predecessor_count': len(task.predecessor_ids),
-                'predecessor_parent': search_if_parent,
+                'predecessor_parent': len(task.successor_ids),
             })
 
 
@@ -457,20 +431,46 @@ class ProjectTaskNative(models.Model):
 
         return True
 
+    @api.model
+    def scheduler_plan_incremental(self, project_id, task_ids=None):
+        """
+        Plan again only changed tasks and what depends on them (Plan button of the gantt view).
+        Without changed tasks (project dates changed...), plan the whole project.
+        :param task_ids: changed tasks, default: tasks of project with Plan Action.
+        :return: list of task ids written
+        """
+        search_project = self.env['project.project'].sudo().search([('id', '=', project_id)], limit=1)
+        scheduling_type = search_project.scheduling_type
+
+        if scheduling_type == "manual":
+            raise UserError(_(
+                'Not work in manual mode. Please set in project: Backwork or Forward'))
+
+        if task_ids is None:
+            task_ids = self.sudo().search([('project_id', '=', project_id), ('plan_action', '!=', 0)]).ids
+            if not task_ids:
+                self.scheduler_plan(project_id)
+                return self.sudo().search([('project_id', '=', project_id)]).ids
+
+        written_ids = []
+        if task_ids:
+            written_ids = self._scheduler_plan_incremental_calc(project=search_project,
+                                                                scheduling_type=scheduling_type,
+                                                                changed_ids=task_ids)
+            self._summary_work(project_id=project_id)
+
+        self._scheduler_plan_complite(project_id=project_id, scheduling_type=scheduling_type)
+
+        return written_ids
+
 
     def _scheduler_plan_complite(self, project_id, scheduling_type):
 
         search_tasks = self.env['project.task'].sudo().search([('project_id', '=', project_id)])
+        search_tasks.filtered('plan_action').write({'plan_action': False})
 
         if scheduling_type == "forward":
-            date_list_end = []
-            for task in search_tasks:
-                var_data = {}
-                var_data['plan_action'] = False
-                task.sudo().write(var_data)
-
-                if task.date_end:
-                    date_list_end.append(fields.Datetime.from_string(task.date_end))
+            date_list_end = [fields.Datetime.from_string(task.date_end) for task in search_tasks if task.date_end]
 
             if date_list_end:
                 new_prj_date_end = max(date_list_end)
@@ -479,14 +479,7 @@ class ProjectTaskNative(models.Model):
                 })
 
         if scheduling_type == "backward":
-            date_list_start = []
-            for task in search_tasks:
-                var_data = {}
-                var_data['plan_action'] = False
-                task.sudo().write(var_data)
-
-                if task.date_start:
-                    date_list_start.append(fields.Datetime.from_string(task.date_start))
+            date_list_start = [fields.Datetime.from_string(task.date_start) for task in search_tasks if task.date_start]
 
             if date_list_start:
                 new_prj_date_start = min(date_list_start)
@@ -499,6 +492,7 @@ class ProjectTaskNative(models.Model):
         search_tasks = self.env['project.task'].sudo().search(
             ['&', ('project_id', '=', project_id), ('child_ids', '!=', False)])
 
+        tasks_vals = {}
         for task in search_tasks:
             var_data = {}
             if task.schedule_mode == "auto":
@@ -510,12 +504,15 @@ class ProjectTaskNative(models.Model):
                         task.summary_date_start)
                     var_data["plan_duration"] = diff.total_seconds()
 
-                    # var_data["duration"] = diff.total_seconds()
+            # write only what changed
+            var_data = dict((key, value) for key, value in var_data.items() if task[key] != value)
+            tasks_vals[task.id] = var_data
 
-            task.sudo().write(var_data)
+        search_tasks._batch_write(tasks_vals)
 
-    @api.depends("predecessor_ids.task_id", "predecessor_ids.type", "constrain_type", "constrain_date", "plan_duration",
-                 "duration", "project_id.scheduling_type", )
+    @api.depends("predecessor_ids.task_id", "predecessor_ids.parent_task_id", "predecessor_ids.type",
+                 "predecessor_ids.lag_qty", "predecessor_ids.lag_type", "constrain_type", "constrain_date",
+                 "plan_duration", "duration", "schedule_mode", "project_id.scheduling_type", )
     def _compute_plan_action(self):
         for task in self:
             task.plan_action = True
@@ -579,49 +576,57 @@ class ProjectTaskNative(models.Model):
         self.do_sorting(self.subtask_project_id.id)
 
     def tree_onfly(self, query, parent):  # array with inside array for sorting only in level.
-        parent['children'] = []
+        children = {}
         for item in query:
-            if item['parent_id'] == parent['id']:
-                parent['children'].append(item)
-                self.tree_onfly(query, item)
-        return parent
+            children.setdefault(item['parent_id'], []).append(item)
 
-    def flat_onfly(self, object, level=0):  # recusive search sub level.
-        result = []
+        for item in query:
+            item['children'] = children.get(item['id'], [])
 
-        def _get_rec(object, level, parent=None):
+        parent['children'] = children.get(parent['id'], [])
+        return parent
 
-            object = sorted(object, key=itemgetter('sorting_level_seq'))
-            for line in object:
+    def flat_onfly(self, object, level=0):  # search sub level without recursion, level max 16.
+        result = []
 
-                res = {}
-                res['id'] = '{}'.format(line["id"])
-                res['name'] = u'{}'.format(line["name"])
-                res['parent_id'] = u'{}'.format(line["parent_id"])
-                res['sorting_level_seq'] = line["sorting_level_seq"]
-                res['level'] = '{}'.format(level)
+        def _sorted_rev(lines):
+            return reversed(sorted(lines, key=itemgetter('sorting_level_seq')))
 
-                result.append(res)
+        stack = [(line, level) for line in _sorted_rev(object)]
+        while stack:
+            line, line_level = stack.pop()
 
-                if line["children"]:
+            res = {}
+            res['id'] = line["id"]
+            res['name'] = line["name"]
+            res['parent_id'] = line["parent_id"]
+            res['sorting_level_seq'] = line["sorting_level_seq"]
+            res['level'] = '{}'.format(line_level)
 
-                    if level < 16:
-                        level += 1
-                        parent = line["id"]
+            result.append(res)
 
-                    _get_rec(line["children"], level, parent)
+            if line["children"]:
+                child_level = line_level + 1 if line_level < 16 else line_level
+                stack.extend((child, child_level) for child in _sorted_rev(line["children"]))
 
-                    if level > 0 and level < 16:
-                        level -= 1
-                        parent = None
+        return result
 
-            return result
+    def _sorting_line_datas(self, search_id):
+        search_objs = self.sudo().search_read([('subtask_project_id', '=', search_id)],
+                                              ['name', 'parent_id', 'sorting_level_seq'])
+        line_datas = []
+        for search_obj in search_objs:
+            res = {}
+            res['id'] = '{}'.format(search_obj['id'])
+            res['name'] = u'{}'.format(search_obj['name'])
+            res['parent_id'] = u'{}'.format(search_obj['parent_id'] and search_obj['parent_id'][0])
+            res['sorting_level_seq'] = search_obj['sorting_level_seq']
 
-        children = _get_rec(object, level)
+            line_datas.append(res)
 
-        return children
+        return line_datas
 
-    def do_sorting(self, subtask_project_id=None, project_id=None):  # recusive search sub level.
+    def do_sorting(self, subtask_project_id=None, project_id=None):  # search sub level.
 
         search_id = subtask_project_id
 
@@ -634,17 +639,7 @@ class ProjectTaskNative(models.Model):
                         project.sudo().write({"subtask_project_id": project_id})
                     search_id = project_id
 
-        search_objs = self.sudo().search([('subtask_project_id', '=', search_id)])
-
-        line_datas = []
-        for search_obj in search_objs:
-            res = {}
-            res['id'] = '{}'.format(search_obj.id)
-            res['name'] = u'{}'.format(search_obj.name)
-            res['parent_id'] = u'{}'.format(search_obj.parent_id.id)
-            res['sorting_level_seq'] = search_obj.sorting_level_seq
-
-            line_datas.append(res)
+        line_datas = self._sorting_line_datas(search_id)
 
         root = {'id': "False"}
 
@@ -655,30 +650,16 @@ class ProjectTaskNative(models.Model):
         # otsortirovanoje derevo dla vivoda v proskom rezime na UI.
         flat_onfly = self.flat_onfly(tree_onfly["children"])
 
-        for index, line in enumerate(flat_onfly):
-            var_data = {
-                "sorting_seq": index + 1,
-                "sorting_level": int(line["level"]),
-            }
-
-            task_obj = self.env['project.task']
-            task_obj_search = task_obj.sudo().search([('id', '=', int(line["id"]))])
-            task_obj_search.sudo().write(var_data)
+        sorting_rows = [(int(line["id"]), index + 1, int(line["level"])) for index, line in enumerate(flat_onfly)]
+        self.sudo()._batch_update_sorting(sorting_rows)
 
         self.after_do_sorting(tree_onfly, flat_onfly)
 
     @api.model
     def sorting_update(self, sorting_ids, subtask_project_id, project_id):
 
-        for sort in sorting_ids:
-            id = sort["id"]
-            seq = sort["seq"]
-
-            var_data = {
-                "sorting_level_seq": int(seq)
-            }
-            task_obj_search = self.sudo().search([('id', '=', int(id))])
-            task_obj_search.sudo().write(var_data)
+        sorting_rows = [(int(sort["id"]), int(sort["seq"])) for sort in sorting_ids]
+        self.sudo()._batch_update_columns(['sorting_level_seq'], sorting_rows)
 
         if not subtask_project_id:
 
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api
+from odoo.tools import split_every
+import logging
+
+from collections import OrderedDict
+
+_logger = logging.getLogger(__name__)  # Need for message in console.
+
+
+class ProjectTaskNativeBatch(models.Model):
+    _name = 'project.task'
+    _inherit = 'project.task'
+
+    # Persistence of scheduler / sorting results: one SQL UPDATE for the
+    # values of each task (dates...), one write per group of tasks with the
+    # same other values, one create per line model, instead of one write()
+    # per task.
+
+    _batch_size = 1000
+    # types of the fields updated by SQL when their values differ by task
+    _batch_column_types = ('boolean', 'integer', 'float', 'date', 'datetime')
+
+    def _batch_write(self, vals_by_task):
+        """
+        Values of plain columns (dates, duration, critical path...) are updated with
+        _batch_update_columns, one UPDATE ... FROM (VALUES ...) for all the tasks writing
+        the same fields. Other values are written with one write() per group of tasks
+        with the same values.
+        :param vals_by_task: dict task id: vals, values must be hashable
+        :return: count of write() calls
+        """
+        column_rows = OrderedDict()
+        groups = OrderedDict()
+        for task_id, vals in vals_by_task.items():
+            fnames = tuple(sorted(fname for fname in vals if self._batch_is_column(fname)))
+            if fnames:
+                column_rows.setdefault(fnames, []).append([task_id] + [vals[fname] for fname in fnames])
+            others = tuple(sorted((key, value) for key, value in vals.items() if key not in fnames))
+            if others:
+                groups.setdefault(others, []).append(task_id)
+
+        for fnames, rows in column_rows.items():
+            self._batch_update_columns(list(fnames), rows, modified=True)
+
+        for vals, task_ids in groups.items():
+            self.browse(task_ids).write(dict(vals))
+
+        return len(groups)
+
+    def _batch_is_column(self, fname):
+        """
+        Whether fname can be updated by SQL: stored, not computed, not translated nor tracked.
+        """
+        field = self._fields.get(fname)
+        return bool(field and field.store and field.type in self._batch_column_types
+                    and not field.compute and not field.inverse
+                    and not getattr(field, 'track_visibility', None))
+
+    def _batch_create_lines(self, model_name, vals_list):
+        """
+        Create lines of model_name (project.task.detail.plan, project.task.info...)
+        for many tasks at once, every vals must have task_id.
+        """
+        lines = self.env[model_name]
+        for vals_chunk in split_every(self._batch_size, vals_list, list):
+            lines |= lines.create(vals_chunk)
+        return lines
+
+    def _batch_update_columns(self, fnames, rows, modified=False):
+        """
+        Write columns with one SQL UPDATE per chunk, without ORM write: no write hooks,
+        and no recompute unless modified.
+        :param fnames: list of column names
+        :param rows: list of (task id, value for each column)
+        :param modified: check write access, set write_uid / write_date and recompute the
+            stored fields depending on fnames of the changed tasks, as write() does
+        """
+        if modified:
+            self.check_access_rights('write')
+            self.browse([row[0] for row in rows]).check_access_rule('write')
+        fields = [self._fields[fname] for fname in fnames]
+        columns = ", ".join('"{0}" = v."{0}"::{1}'.format(field.name, field.column_type[1]) for field in fields)
+        if modified:
+            columns += ", write_uid = %s, write_date = (now() at time zone 'UTC')"
+        changed = " OR ".join('t."{0}" IS DISTINCT FROM v."{0}"::{1}'.format(field.name, field.column_type[1])
+                              for field in fields)
+        placeholders = "({})".format(", ".join(["%s"] * (len(fnames) + 1)))
+
+        changed_ids = []
+        for rows_chunk in split_every(self._batch_size, rows, list):
+            query = """
+                UPDATE project_task AS t
+                   SET {columns}
+                  FROM (VALUES {values}) AS v (id, {names})
+                 WHERE t.id = v.id
+                   AND ({changed})
+             RETURNING t.id
+            """.format(columns=columns,
+                       values=", ".join([placeholders] * len(rows_chunk)),
+                       names=", ".join('"{}"'.format(fname) for fname in fnames),
+                       changed=changed)
+            params = [self.env.uid] if modified else []
+            for row in rows_chunk:
+                params.append(row[0])
+                params.extend(field.convert_to_column(value, self) for field, value in zip(fields, row[1:]))
+            self.env.cr.execute(query, params)
+            changed_ids += [row[0] for row in self.env.cr.fetchall()]
+
+        self.invalidate_cache(fnames, [row[0] for row in rows])
+        if modified and changed_ids:
+            self.invalidate_cache(['write_uid', 'write_date'], changed_ids)
+            self.browse(changed_ids).modified(fnames)
+            self.recompute()
+        return changed_ids
+
+    def _batch_update_sorting(self, rows):
+        """
+        :param rows: list of (task id, sorting_seq, sorting_level)
+        """
+        self._batch_update_columns(['sorting_seq', 'sorting_level'], rows)
@@ -2,6 +2,8 @@
 from odoo import models, fields, api
 import logging
 
+from ..tools.scheduler_graph import critical_path_info
+
 _logger = logging.getLogger(__name__) # Need for message in console.
 
 
@@ -16,37 +18,7 @@ class ProjectTaskCriticalPath(models.Model):
 
 
     def _critical_path_calc(self, task):
-        task["critical_path"] = False
-        task["info_vals"] = False
-        value = {}
-
-        need_key = ["soon_date_start", "soon_date_end", "late_date_start", "late_date_end"]
-
-        if all(key in task for key in need_key):
-            if task["late_date_start"] and task["soon_date_start"]:
-                soon_date_start = fields.Datetime.from_string(task["soon_date_start"])
-                late_date_start = fields.Datetime.from_string(task["late_date_start"])
-                start = ((late_date_start - soon_date_start).total_seconds()) / 3600
-                value["left_up"] = task["soon_date_start"]
-                value["left_down"] = task["late_date_start"]
-                value["start"] = "{:.2f}".format(start)
-                if start <= 0:
-                    task["critical_path"] = True
-
-            if task["late_date_end"] and task["soon_date_end"]:
-                soon_date_end = fields.Datetime.from_string(task["soon_date_end"])
-                late_date_end = fields.Datetime.from_string(task["late_date_end"])
-                end = ((late_date_end - soon_date_end).total_seconds()) / 3600
-                value["right_up"] = task["soon_date_end"]
-                value["right_down"] = task["late_date_end"]
-                value["end"] = "{:.2f}".format(end)
-                if end <= 0:
-                    task["critical_path"] = True
-
-            if value:
-                task["info_vals"] = value
-
-        return task
+        return critical_path_info(task)
 
 
     # @api.model
@@ -25,15 +25,6 @@ class ProjectTask(models.Model):
     info_ids = fields.One2many('project.task.info', 'task_id', 'Info Value')
 
 
-    def _task_info_add(self, task, vals, info_name):
-
-        if "info_vals" in task.keys() and task["info_vals"]:
-            info_data = task["info_vals"]
-            info_data["name"] = info_name
-            task_info_lines = [(0, 0, info_data)]
-            vals["info_ids"] = task_info_lines
-        return vals
-
     def _task_info_remove(self, info_name):
         domain = [('name', '=', info_name)]
         result = self.env['project.task.info'].sudo().search(domain)
@@ -3,6 +3,9 @@ from odoo import models, fields, api, _
 import logging
 
 from datetime import datetime, timedelta
+from odoo.exceptions import UserError
+
+from ..tools.scheduler_graph import SchedulerGraph, SchedulerCycleError, lag_timedelta
 
 
 _logger = logging.getLogger(__name__) # Need for message in console.
@@ -14,8 +17,104 @@ class ProjectTaskNativeScheduler(models.Model):
 
     def _scheduler_plan_start_calc(self, project, scheduling_type):
 
-        tasks_ap = []
-        predecessors_ap = []
+        graph = self._scheduler_graph_load(project)
+
+        #clean detail plaN FOR TASKS.
+        self.browse(list(graph.tasks)).mapped('detail_plan_ids').unlink()
+
+        #Project dates
+        project_ap = self._scheduler_project_ap(project, scheduling_type)
+
+        #Remove task _info by cp_[project_id]
+        info_name = "cp_{}".format(project.id)
+        self._task_info_remove(info_name)
+
+        period = self._scheduler_graph_period
+        constrain = self._scheduler_work_constrain
+
+        #Calc First Step
+        date_type = "date_start" if scheduling_type == "forward" else "date_end"
+        graph.schedule(scheduling_type, period, constrain, project_date=project_ap[date_type])
+
+        #Calc new project date, Revers Step, Critical Path
+        self._scheduler_graph_revers(graph, project_ap, scheduling_type)
+
+        # Check if as Late as possible for task and recalculate with allowed buffer
+        alap_ids = []
+        for task_alap in graph.tasks.values():
+
+            if task_alap["constrain_type"] == "alap":
+
+                if scheduling_type == "forward":
+                    task_alap["soon_date_start"] = task_alap["late_date_start"]
+                    task_alap["soon_date_end"] = task_alap["late_date_end"]
+
+                else:
+                    task_alap["late_date_start"] = task_alap["soon_date_start"]
+                    task_alap["late_date_end"] = task_alap["soon_date_end"]
+
+                alap_ids.append(task_alap["id"])
+
+        if alap_ids:
+            graph.schedule(scheduling_type, period, constrain, sources=alap_ids)
+
+        #Write result to tasl
+        task_ids = [task_id for task_id, task in graph.tasks.items() if "calc" in task.keys()]
+        self._scheduler_graph_write(graph, project, scheduling_type, info_name, task_ids, task_ids)
+
+    def _scheduler_plan_incremental_calc(self, project, scheduling_type, changed_ids):
+        """
+        Plan again only changed_ids and the tasks after them (forward: successors,
+        backward: predecessors), stop where dates do not change. Late/soon dates
+        and critical path of the other pass are computed in memory, only tasks
+        with new dates, critical path or info are written.
+        :return: list of task ids written
+        """
+        graph = self._scheduler_graph_load(project)
+
+        # As Late As Possible move tasks with buffer of the whole project.
+        if any(task["constrain_type"] == "alap" for task in graph.tasks.values()):
+            self._scheduler_plan_start_calc(project, scheduling_type)
+            return list(graph.tasks)
+
+        for task in graph.tasks.values():
+            task["calc"] = True
+
+        project_ap = self._scheduler_project_ap(project, scheduling_type)
+        info_name = "cp_{}".format(project.id)
+
+        date_type = "date_start" if scheduling_type == "forward" else "date_end"
+        moved_ids = graph.propagate(scheduling_type, changed_ids,
+                                    self._scheduler_graph_period, self._scheduler_work_constrain,
+                                    project_date=project_ap[date_type])
+
+        self._scheduler_graph_revers(graph, project_ap, scheduling_type)
+
+        infos = self.env['project.task.info'].sudo().search_read(
+            [('name', '=', info_name), ('task_id', 'in', list(graph.tasks))],
+            ['task_id', 'start', 'end', 'left_up', 'left_down', 'right_up', 'right_down'])
+        info_by_task = {}
+        for info in infos:
+            info_by_task[info['task_id'][0]] = dict((key, info[key] or False) for key in info
+                                                    if key not in ('id', 'task_id'))
+
+        task_ids = set(moved_ids)
+        for task_id, task in graph.tasks.items():
+            new_info = dict((key, value and '{}'.format(value)) for key, value in (task["info_vals"] or {}).items())
+            if task["critical_path"] != task["stored_critical_path"] or new_info != info_by_task.get(task_id, {}):
+                task_ids.add(task_id)
+
+        task_ids = [task_id for task_id in graph.tasks if task_id in task_ids]
+        if task_ids:
+            self.env['project.task.info'].sudo().search(
+                [('name', '=', info_name), ('task_id', 'in', task_ids)]).unlink()
+            self.browse(moved_ids).mapped('detail_plan_ids').unlink()
+            self._scheduler_graph_write(graph, project, scheduling_type, info_name, task_ids, moved_ids)
+
+        return task_ids
+
+    def _scheduler_graph_load(self, project):
+
         project_id = project.id
 
         #Tasks
@@ -29,16 +128,12 @@ class ProjectTaskNativeScheduler(models.Model):
             attendance_ids = project.resource_calendar_id.attendance_ids
             global_leave_ids = project.resource_calendar_id.global_leave_ids
 
+        tasks_ap = []
         for task in tasks_list:
 
-            #clean detail plaN FOR TASK.
-            task.detail_plan_ids.unlink()
-
             #Tasks List
             tasks_ap.append({"id": task.id,
                              "plan_duration": task.plan_duration,
-                             # "date_start": task.date_start,
-                             # "date_end": task.date_end,
                              "soon_date_start": task.date_start,
                              "soon_date_end": task.date_end,
                              "late_date_start": task.date_start,
@@ -50,131 +145,98 @@ class ProjectTaskNativeScheduler(models.Model):
                              "constrain_type": task.constrain_type,
                              "constrain_date": task.constrain_date,
                              "detail_plan": task.detail_plan,
-                             "name": task.name
+                             "name": task.name,
+                             "active": task.active,
+                             "has_children": bool(task.child_ids),
+                             "stored_critical_path": task.critical_path,
                              })
 
-            domain = ['|', ('task_id', '=', task.id), ('parent_task_id', '=', task.id)]
-            predecessors_list = self.env['project.task.predecessor'].sudo().search(domain)
-
-            #Precedessor List
-            for predecessor in predecessors_list:
-                predecessors_ap.append(
-                    {"id": predecessor.id,
-                     "type": predecessor.type,
-                     "lag_qty": predecessor.lag_qty,
-                     "lag_type": predecessor.lag_type,
-                     "parent_task_id" : predecessor.parent_task_id.id,
-                     "task_id" : predecessor.task_id.id
-                     })
-
-        #Predecessors
-        predecessors_ap = [i for n, i in enumerate(predecessors_ap) if i not in predecessors_ap[n + 1:]]
+        #Precedessor List
+        domain = ['|', ('task_id', 'in', tasks_list.ids), ('parent_task_id', 'in', tasks_list.ids)]
+        predecessors_list = self.env['project.task.predecessor'].sudo().search(domain)
+        predecessors_ap = [{"id": predecessor.id,
+                            "type": predecessor.type,
+                            "lag_qty": predecessor.lag_qty,
+                            "lag_type": predecessor.lag_type,
+                            "parent_task_id": predecessor.parent_task_id.id,
+                            "task_id": predecessor.task_id.id
+                            } for predecessor in predecessors_list]
+
+        try:
+            return SchedulerGraph(tasks_ap, predecessors_ap)
+        except SchedulerCycleError as error:
+            names = self.browse(error.task_ids).mapped('name')
+            raise UserError(_('Predecessor links form a cycle between tasks: %s') % ', '.join(names))
+
+    def _scheduler_project_ap(self, project, scheduling_type):
 
-        #Project dates
         p_date_start, p_date_end = self._project_check_date(project, scheduling_type)
-        project_ap = {
+        return {
             "id": project.id,
             "project_obj": project,
-            "date_start" : p_date_start,
-            "date_end" : p_date_end
+            "date_start": p_date_start,
+            "date_end": p_date_end
         }
 
-
-        #Remove task _info by cp_[project_id]
-        info_name = "cp_{}".format(project.id)
-        self._task_info_remove(info_name)
-
-        #Calc First Step
-        tasks_ap = self._ap_calc_tasks_list(project_ap=project_ap,
-                                            tasks_ap=tasks_ap,
-                                            predecessors_ap=predecessors_ap,
-                                            scheduling_type=scheduling_type,
-                                            project_id=project_id, revers_step=False)
+    def _scheduler_graph_revers(self, graph, project_ap, scheduling_type):
 
         #Calc new project date
-        project_ap = self._project_get_date(project_ap, tasks_ap, scheduling_type)
-
-
-        #Copy Tasks List
-        # x_tasks = [x.copy() for x in tasks_ap]
+        project_ap = self._project_get_date(project_ap, list(graph.tasks.values()), scheduling_type)
 
         #Cals Revers Step
-        tasks_ap = self._ap_calc_tasks_list(project_ap=project_ap,
-                                            tasks_ap=tasks_ap,
-                                            predecessors_ap=predecessors_ap,
-                                            scheduling_type=scheduling_type,
-                                            project_id=project_id, revers_step=True)
-
+        revers_type = "backward" if scheduling_type == "forward" else "forward"
+        date_type = "date_start" if revers_type == "forward" else "date_end"
+        graph.schedule(revers_type, self._scheduler_graph_period, self._scheduler_work_constrain,
+                       project_date=project_ap[date_type])
 
         # Calc Critical Path
-        for task_cp in tasks_ap:
-            task_cp = self._critical_path_calc(task=task_cp)
+        graph.critical_path()
 
+    def _scheduler_graph_write(self, graph, project, scheduling_type, info_name, task_ids, detail_task_ids):
+        """
+        :param task_ids: tasks to write dates, critical path and info
+        :param detail_task_ids: tasks to save detail plan (if allowed)
+        """
+        if scheduling_type == "forward":
+            task_date_start = "soon_date_start"
+            task_date_end = "soon_date_end"
+            detail_plan = "soon_detail_plan"
+        else:
+            task_date_start = "late_date_start"
+            task_date_end = "late_date_end"
+            detail_plan = "late_detail_plan"
 
-        # Check if as Late as possible for task and recalculate with allowed buffer
-        for task_alap in tasks_ap:
+        detail_task_ids = set(detail_task_ids)
+        tasks_vals = {}
+        detail_lines = []
+        info_lines = []
+        for task_id in task_ids:
+            task_new = graph.tasks[task_id]
 
-            if task_alap["constrain_type"] == "alap":
+            vals = {}
+            vals["date_start"] = task_new[task_date_start]
+            vals["date_end"] = task_new[task_date_end]
 
-                if scheduling_type == "forward":
-                    task_alap["soon_date_start"] = task_alap["late_date_start"]
-                    task_alap["soon_date_end"] = task_alap["late_date_end"]
+            if task_new.get("info_vals"):
+                info_lines.append(dict(task_new["info_vals"], name=info_name, task_id=task_id))
 
-                else:
-                    task_alap["late_date_start"] = task_alap["soon_date_start"]
-                    task_alap["late_date_end"] = task_alap["soon_date_end"]
+            if task_id in detail_task_ids and detail_plan in task_new.keys() \
+                    and (project.detail_plan or task_new["detail_plan"]):
+                for line in self._add_detail_plan(task_new[detail_plan]):
+                    detail_lines.append(dict(line[2], task_id=task_id))
 
-                self._ap_calc_scheduler_recur_work(task_id=task_alap["id"],
-                                                   scheduling_type=scheduling_type,
-                                                   project=project_ap,
-                                                   tasks=tasks_ap,
-                                                   predecessors=predecessors_ap,
-                                                   revers_step=False)
+            if "critical_path" in task_new.keys():
+                vals["critical_path"] = task_new["critical_path"]
 
+            tasks_vals[task_id] = vals
 
-        #Write result to tasl
         projects_task_obj = self.env['project.task']
-        for task_new in tasks_ap:
-            # self._critical_path_calc( task, vals)
-
-            if "calc" in task_new.keys():
-                task_id = task_new["id"]
-                task_obj = projects_task_obj.browse(task_id)
-                vals = {}
-                vals = self._task_info_add(task=task_new, vals=vals, info_name=info_name)
-
-                if scheduling_type == "forward":
-                    task_date_start = "soon_date_start"
-                    task_date_end = "soon_date_end"
-                    detail_plan = "soon_detail_plan"
-                else:
-                    task_date_start = "late_date_start"
-                    task_date_end = "late_date_end"
-                    detail_plan = "late_detail_plan"
-
-                vals["date_start"] = task_new[task_date_start]
-                vals["date_end"] = task_new[task_date_end]
-
-
-                if detail_plan in task_new.keys():
-
-                    save_detail_plan = False
-                    if task_obj.project_id and task_obj.project_id.detail_plan:
-                        save_detail_plan = True
-                    elif task_obj.detail_plan:
-                        save_detail_plan = True
-
-                    if save_detail_plan:
-                        task_detail_lines = self._add_detail_plan(task_new[detail_plan])
-                        if task_detail_lines:
-                            vals["detail_plan_ids"] = task_detail_lines
-
-                if "critical_path" in task_new.keys():
-                    vals["critical_path"] = task_new["critical_path"]
-
-                task_obj.write(vals)
-
+        projects_task_obj._batch_write(tasks_vals)
+        projects_task_obj._batch_create_lines('project.task.info', info_lines)
+        projects_task_obj._batch_create_lines('project.task.detail.plan', detail_lines)
 
+    def _scheduler_graph_period(self, task_obj, direction, new_date, date_type):
+        return self._ap_cal_period(task_obj=task_obj, direction=direction, new_date=new_date, date_type=date_type)
 
 
     def _project_get_date(self, project_ap, tasks_ap, scheduling_type):
@@ -205,154 +267,6 @@ class ProjectTaskNativeScheduler(models.Model):
         return project_ap
 
 
-    # 0 all Calc Tasks List
-    def _ap_calc_tasks_list(self, project_ap, tasks_ap, predecessors_ap, scheduling_type, project_id, revers_step=False):
-
-        search_tasks, scheduling_type = self._ap_calc_tasks_list_search(scheduling_type=scheduling_type,
-                                                                      project_id=project_id, revers_step=revers_step)
-
-        for stask in search_tasks:
-            tasks_ap = self._ap_calc_scheduler_first_work(task=stask, scheduling_type=scheduling_type,
-                                                          project=project_ap, tasks=tasks_ap,
-                                                          predecessors=predecessors_ap, revers_step=revers_step)
-        return tasks_ap
-
-    def _ap_calc_tasks_list_search(self, scheduling_type, project_id, revers_step=False):
-
-        search_tasks = []
-
-        if revers_step:
-            if scheduling_type == "forward":
-                scheduling_type = "backward"
-            elif scheduling_type == "backward":
-                scheduling_type = "forward"
-
-        if scheduling_type == "forward":
-            search_tasks = self.env['project.task'].sudo().search(
-                ['&', ('project_id', '=', project_id), ('predecessor_count', '=', 0)])
-
-        if scheduling_type == "backward":
-            search_tasks = self.env['project.task'].sudo().search(
-                ['&', ('project_id', '=', project_id), ('predecessor_parent', '=', 0)])
-
-        return search_tasks, scheduling_type
-
-
-    # 1 Fist Work
-    def _ap_calc_scheduler_first_work(self, task, scheduling_type, project, tasks, predecessors, revers_step=False):
-
-        if not task.child_ids:  # (auto mode and task not group.)
-            vals = {}
-            if task.schedule_mode == "auto":
-
-                task_obj = self._task_from_list(tasks, task.id)
-
-
-                if scheduling_type == "forward":
-                    direction = "normal"
-                    date_type = "date_start"
-                    cp_date_start = "soon_date_start"
-                    cp_date_end = "soon_date_end"
-
-                elif scheduling_type == "backward":
-                    direction = "revers"
-                    date_type = "date_end"
-                    cp_date_start = "late_date_start"
-                    cp_date_end = "late_date_end"
-
-                else:
-                    return tasks
-
-                new_date = project[date_type]
-                calendar_level, date_start, date_end = self._ap_cal_period(task_obj=task_obj,
-                                                                           direction=direction,
-                                                                           new_date=new_date,
-                                                                           date_type=date_type)
-
-                vals[cp_date_start] = date_start
-                vals[cp_date_end] = date_end
-                vals, calendar_level = self._scheduler_work_constrain(task_obj, vals, calendar_level, scheduling_type)
-
-                if calendar_level:
-                    vals["detail_plan"] = calendar_level
-
-            # vals = self._critical_path_add_value(vals, revers_step)
-
-                tasks = [self._task_date_update(x_task, task.id, vals) for x_task in tasks]
-
-            else:
-                vals["calc"] = True
-                tasks = [self._task_date_update(x_task, task.id, vals) for x_task in tasks]
-
-            tasks = self._ap_calc_scheduler_recur_work(task_id=task.id,
-                                                       scheduling_type=scheduling_type,
-                                                       project=project,
-                                                       tasks=tasks,
-                                                       predecessors=predecessors,
-                                                       revers_step=revers_step)
-
-            return tasks
-
-
-
-        else:
-            return tasks
-
-
-
-    # 2 Recursion Work
-    def _ap_calc_scheduler_recur_work(self, task_id, scheduling_type, project, tasks, predecessors, revers_step=False):
-
-        if scheduling_type == "forward":
-            task_field = "parent_task_id"
-            next_task_field = "task_id"
-        elif scheduling_type == "backward":
-            task_field = 'task_id'
-            next_task_field = "parent_task_id"
-
-        search_objs = filter(lambda x: x[task_field] == task_id, predecessors)
-        search_objs = list(search_objs)
-
-        for predecessor_obj in search_objs:
-
-            date_list = self._calc_date_list(scheduling_type, predecessors, tasks, predecessor_obj)
-            task_obj = self._task_from_list(tasks, task_id=predecessor_obj[next_task_field])
-
-            if task_obj:
-                vals, calendar_level = self._calc_new_date(scheduling_type=scheduling_type,
-                                                           predecessor_obj=predecessor_obj,
-                                                           task_obj=task_obj, date_list=date_list)
-
-                if task_obj["schedule_mode"] == "auto":
-
-                    if vals:
-
-                        if 'plan_action' not in vals.keys():
-                            task_id = task_obj["id"]
-                            #check constrain
-                            vals, calendar_level = self._scheduler_work_constrain(task_obj, vals, calendar_level, scheduling_type)
-
-                            if calendar_level:
-                                vals["detail_plan"] = calendar_level
-
-                            tasks = [self._task_date_update(x_task, task_id, vals) for x_task in tasks]
-
-                            # vals = self._critical_path_add_value(vals, revers_step)
-                else:
-                    vals["calc"] = True
-                    tasks = [self._task_date_update(x_task, task_id, vals) for x_task in tasks]
-
-
-                next_task_id = predecessor_obj[next_task_field]
-
-                self._ap_calc_scheduler_recur_work(task_id=next_task_id, scheduling_type=scheduling_type,
-                                                       project=project, tasks=tasks, predecessors=predecessors,
-                                                       revers_step=revers_step)
-
-        return tasks
-
-
-
     # Tools
 
     def _project_check_date(self, project, scheduling_type):
@@ -440,247 +354,10 @@ class ProjectTaskNativeScheduler(models.Model):
 
 
 
-    def _task_date_update(self, task, task_id, vals):
-
-        if task["id"] == task_id:
-            if "calc" in vals.keys():
-                task["calc"] = True
-                return task
-
-            if "soon_date_start" in vals.keys() and "soon_date_end" in vals.keys():
-                date_start = "soon_date_start"
-                date_end = "soon_date_end"
-                detail_plan = "soon_detail_plan"
-                task["calc"] = True
-
-            elif "late_date_start" in vals.keys() and "late_date_end" in vals.keys():
-                date_start = "late_date_start"
-                date_end = "late_date_end"
-                detail_plan = "late_detail_plan"
-                task["calc"] = True
-            else:
-                return task
-
-            task[date_start] = vals[date_start]
-            task[date_end] = vals[date_end]
-
-
-            if "detail_plan" in vals.keys():
-                task[detail_plan] = vals["detail_plan"]
-                del vals["detail_plan"]
-
-        return task
-
-
-    def _task_from_list(self, tasks, task_id):
-        task_list = []
-        if tasks and task_id:
-            search_objs = filter(lambda x: x['id'] == task_id, tasks)
-
-            if search_objs:
-                search_objs_list = list(search_objs)
-                if search_objs_list[0]:
-                    task_list = search_objs_list[0]
-
-        return task_list
-
-
-
-    def _calc_date_list(self, scheduling_type, predecessors, tasks, predecessor_obj):
-
-        date_list = []
-        type_link = predecessor_obj["type"]
-        task_date_obj = 0
-        parent_date_field_1 = 0
-        parent_date_field_2 = 0
-
-        if scheduling_type == "forward":
-
-            dt_list_task_field = "task_id"
-            dt_list_task_id = predecessor_obj["task_id"]
-
-            cp_date_start = "soon_date_start"
-            cp_date_end = "soon_date_end"
-
-            if type_link == "FS":
-                task_date_obj = "parent_task_id"
-                parent_date_field_1 = cp_date_end
-                parent_date_field_2 = cp_date_start
-
-            elif type_link == "SS":
-                task_date_obj = "parent_task_id"
-                parent_date_field_1 = cp_date_start
-                parent_date_field_2 = cp_date_end
-
-            elif type_link == "FF":
-                task_date_obj = "parent_task_id"
-                parent_date_field_1 = cp_date_end
-                parent_date_field_2 = cp_date_start
-
-            elif type_link == "SF":
-                task_date_obj = "parent_task_id"
-                parent_date_field_1 = cp_date_start
-                parent_date_field_2 = cp_date_end
-
-
-        elif scheduling_type == "backward":
-            dt_list_task_field = 'parent_task_id'
-            dt_list_task_id = predecessor_obj["parent_task_id"]
-            cp_date_start = "late_date_start"
-            cp_date_end = "late_date_end"
-
-            if type_link == "FS":
-                task_date_obj = "task_id"
-                parent_date_field_1 = cp_date_start
-                parent_date_field_2 = cp_date_end
-
-            elif type_link == "SS":
-                task_date_obj = "parent_task_id"
-                parent_date_field_1 = cp_date_start
-                parent_date_field_2 = cp_date_end
-
-            elif type_link == "FF":
-                task_date_obj = "parent_task_id"
-                parent_date_field_1 = cp_date_end
-                parent_date_field_2 = cp_date_start
-
-            elif type_link == "SF":
-                task_date_obj = "task_id"
-                parent_date_field_1 = cp_date_end
-                parent_date_field_2 = cp_date_start
-        else:
-            return date_list
-
-
-
-        search_date_objs = filter(lambda x: x[dt_list_task_field] == dt_list_task_id and x['type'] == type_link, predecessors)
-        search_date_objs = list(search_date_objs)
-
-
-        for date_obj in search_date_objs:
-
-            parent_task = self._task_from_list(tasks, task_id=date_obj[task_date_obj])
-
-            if parent_task and parent_date_field_1 and parent_task[parent_date_field_1]:
-                parent_date = fields.Datetime.from_string(parent_task[parent_date_field_1])
-
-                if date_obj["lag_qty"] != 0 and parent_date and parent_task[parent_date_field_2]:
-
-                    parent_date_two = fields.Datetime.from_string(parent_task[parent_date_field_2])
-                    parent_date = self._predecessor_lag_timedelta(parent_date,
-                                                                  date_obj["lag_qty"], date_obj["lag_type"],
-                                                                  parent_date_two)
-                date_list.append(parent_date)
-
-        return date_list
-
-
-    def _calc_new_date(self, scheduling_type, predecessor_obj, task_obj, date_list):
-
-        new_date = cp_date_start = cp_date_end = direction = date_type = False
-        vals = {}
-        calendar_level = []
-        type_link = predecessor_obj["type"]
-
-        if date_list:
-
-            if scheduling_type == "forward":
-
-                cp_date_start = "soon_date_start"
-                cp_date_end = "soon_date_end"
-
-                if type_link == "FS":
-
-                    new_date = max(date_list)
-                    date_type = "date_start"
-                    direction = "normal"
-
-                if type_link == "SS":
-                    new_date = min(date_list)
-                    date_type = "date_start"
-                    direction = "normal"
-
-                if type_link == "FF":
-                    new_date = max(date_list)
-                    date_type = "date_end"
-                    direction = "revers"
-
-                if type_link == "SF":
-
-                    new_date = min(date_list)
-                    date_type = "date_end"
-                    direction = "revers"
-
-
-            elif scheduling_type == "backward":
-
-                cp_date_start = "late_date_start"
-                cp_date_end = "late_date_end"
-
-                if type_link == "FS":
-
-                    new_date = min(date_list)
-                    date_type = "date_end"
-                    direction = "revers"
-
-                if type_link == "SS":
-                    new_date = min(date_list)
-                    date_type = "date_start"
-                    direction = "normal"
-
-                if type_link == "FF":
-                    new_date = max(date_list)
-                    date_type = "date_end"
-                    direction = "revers"
-
-                if type_link == "SF":
-
-                    new_date = max(date_list)
-                    date_type = "date_start"
-                    direction = "normal"
-
-        if new_date:
-            calendar_level, date_start, date_end = self._ap_cal_period(task_obj=task_obj, direction=direction,
-                                                                       new_date=new_date, date_type=date_type,
-                                                                       cal_value=None)
-            vals[cp_date_start] = date_start
-            vals[cp_date_end] = date_end
-
-        else:
-            vals['plan_action'] = True
-
-        return vals, calendar_level
-
 
 
     def _predecessor_lag_timedelta(self, parent_date, lag_qty, lag_type, parent_date_two, plan_type='forward'):
-
-        diff = timedelta(days=0)
-
-        if plan_type == 'backward':
-            lag_qty = lag_qty * -1
-
-        if lag_type == "day":
-            diff = timedelta(days=lag_qty)
-            return parent_date+diff
-
-        if lag_type == "hour":
-            diff = timedelta(seconds=lag_qty*3600)
-
-        if lag_type == "minute":
-            diff = timedelta(seconds=lag_qty*60)
-
-        if lag_type == "percent":
-            diff = parent_date - parent_date_two
-            duration = diff.total_seconds()
-            percent_second = (duration*abs(lag_qty))/100
-
-            diff = timedelta(seconds=percent_second)
-
-        if lag_qty > 0:
-            return parent_date + diff
-        else:
-            return parent_date - diff
+        return lag_timedelta(parent_date, lag_qty, lag_type, parent_date_two, plan_type=plan_type)
 
 
     def _scheduler_work_constrain(self, task_obj, vals, calendar_level, scheduling_type):
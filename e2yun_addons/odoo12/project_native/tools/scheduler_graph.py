@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory task graph for the project scheduler.
+
+Tasks and predecessor links are indexed once, tasks are ordered
+topologically and every forward (soon dates) or backward (late dates)
+pass visits each task and each link exactly once. No Odoo import here:
+calendar and constraint work is done by the callbacks given to
+SchedulerGraph.schedule(), so the engine can also be run standalone
+(see benchmarks/scheduler_benchmark.py).
+"""
+import heapq
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+_logger = logging.getLogger(__name__)  # Need for message in console.
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# scheduling_type: date start key, date end key, detail plan key
+DATE_KEYS = {
+    "forward": ("soon_date_start", "soon_date_end", "soon_detail_plan"),
+    "backward": ("late_date_start", "late_date_end", "late_detail_plan"),
+}
+
+# scheduling_type: link type: task field of link to read date, date field, second date field (percent lag)
+LINK_DATE_FIELDS = {
+    "forward": {
+        "FS": ("parent_task_id", "soon_date_end", "soon_date_start"),
+        "SS": ("parent_task_id", "soon_date_start", "soon_date_end"),
+        "FF": ("parent_task_id", "soon_date_end", "soon_date_start"),
+        "SF": ("parent_task_id", "soon_date_start", "soon_date_end"),
+    },
+    "backward": {
+        "FS": ("task_id", "late_date_start", "late_date_end"),
+        "SS": ("parent_task_id", "late_date_start", "late_date_end"),
+        "FF": ("parent_task_id", "late_date_end", "late_date_start"),
+        "SF": ("task_id", "late_date_end", "late_date_start"),
+    },
+}
+
+# scheduling_type: link type: operation on date list, date_type, direction
+LINK_NEW_DATE = {
+    "forward": {
+        "FS": (max, "date_start", "normal"),
+        "SS": (min, "date_start", "normal"),
+        "FF": (max, "date_end", "revers"),
+        "SF": (min, "date_end", "revers"),
+    },
+    "backward": {
+        "FS": (min, "date_end", "revers"),
+        "SS": (min, "date_start", "normal"),
+        "FF": (max, "date_end", "revers"),
+        "SF": (max, "date_start", "normal"),
+    },
+}
+
+
+class SchedulerCycleError(ValueError):
+    """ Predecessor links of the project are not a DAG. """
+
+    def __init__(self, task_ids):
+        self.task_ids = task_ids
+        super(SchedulerCycleError, self).__init__(
+            "Predecessor links form a cycle between tasks: {}".format(task_ids))
+
+
+def to_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value[:19], DATETIME_FORMAT)
+
+
+def lag_timedelta(parent_date, lag_qty, lag_type, parent_date_two, plan_type='forward'):
+
+    diff = timedelta(days=0)
+
+    if plan_type == 'backward':
+        lag_qty = lag_qty * -1
+
+    if lag_type == "day":
+        diff = timedelta(days=lag_qty)
+        return parent_date + diff
+
+    if lag_type == "hour":
+        diff = timedelta(seconds=lag_qty * 3600)
+
+    if lag_type == "minute":
+        diff = timedelta(seconds=lag_qty * 60)
+
+    if lag_type == "percent":
+        diff = parent_date - parent_date_two
+        duration = diff.total_seconds()
+        percent_second = (duration * abs(lag_qty)) / 100
+
+        diff = timedelta(seconds=percent_second)
+
+    if lag_qty > 0:
+        return parent_date + diff
+    else:
+        return parent_date - diff
+
+
+def critical_path_info(task):
+    """
+    Set "critical_path" and "info_vals" for task from soon and late dates.
+    :param task: task dict of the graph
+    :return: task
+    """
+    task["critical_path"] = False
+    task["info_vals"] = False
+    value = {}
+
+    need_key = ["soon_date_start", "soon_date_end", "late_date_start", "late_date_end"]
+
+    if all(key in task for key in need_key):
+        if task["late_date_start"] and task["soon_date_start"]:
+            soon_date_start = to_datetime(task["soon_date_start"])
+            late_date_start = to_datetime(task["late_date_start"])
+            start = ((late_date_start - soon_date_start).total_seconds()) / 3600
+            value["left_up"] = task["soon_date_start"]
+            value["left_down"] = task["late_date_start"]
+            value["start"] = "{:.2f}".format(start)
+            if start <= 0:
+                task["critical_path"] = True
+
+        if task["late_date_end"] and task["soon_date_end"]:
+            soon_date_end = to_datetime(task["soon_date_end"])
+            late_date_end = to_datetime(task["late_date_end"])
+            end = ((late_date_end - soon_date_end).total_seconds()) / 3600
+            value["right_up"] = task["soon_date_end"]
+            value["right_down"] = task["late_date_end"]
+            value["end"] = "{:.2f}".format(end)
+            if end <= 0:
+                task["critical_path"] = True
+
+        if value:
+            task["info_vals"] = value
+
+    return task
+
+
+class SchedulerGraph(object):
+    """
+    Tasks indexed by id and predecessor links indexed by both ends.
+
+    Task dict keys used here: id, schedule_mode, active, has_children and the
+    soon_/late_ date keys. Link dict keys: id, type, lag_qty, lag_type,
+    parent_task_id (predecessor) and task_id (successor). Links to tasks of
+    other projects are kept, they count for the root search like
+    predecessor_count / predecessor_parent, but are not planned.
+    """
+
+    def __init__(self, tasks, links):
+        self.tasks = OrderedDict((task["id"], task) for task in tasks)
+        self.links = []
+        self.links_in = {}
+        self.links_out = {}
+
+        link_ids = set()
+        for link in links:
+            if link["id"] in link_ids:
+                continue
+            link_ids.add(link["id"])
+            self.links.append(link)
+            self.links_in.setdefault(link["task_id"], []).append(link)
+            self.links_out.setdefault(link["parent_task_id"], []).append(link)
+
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        degree = OrderedDict((task_id, 0) for task_id in self.tasks)
+        for link in self.links:
+            if link["task_id"] in degree and link["parent_task_id"] in degree:
+                degree[link["task_id"]] += 1
+
+        queue = deque(task_id for task_id, count in degree.items() if not count)
+        order = []
+        while queue:
+            task_id = queue.popleft()
+            order.append(task_id)
+            for link in self.links_out.get(task_id, []):
+                next_id = link["task_id"]
+                if next_id in degree:
+                    degree[next_id] -= 1
+                    if not degree[next_id]:
+                        queue.append(next_id)
+
+        if len(order) != len(degree):
+            raise SchedulerCycleError([task_id for task_id, count in degree.items() if count])
+
+        return order
+
+    def roots(self, scheduling_type):
+        """
+        Tasks a pass starts from: forward - no predecessor, backward - no successor.
+        Group tasks (with children) and archived tasks are not roots.
+        """
+        links = self.links_in if scheduling_type == "forward" else self.links_out
+        return [task_id for task_id in self.order
+                if task_id not in links
+                and self.tasks[task_id].get("active", True)
+                and not self.tasks[task_id].get("has_children")]
+
+    def _pass_index(self, scheduling_type):
+        if scheduling_type == "forward":
+            return self.order, self.links_in, "parent_task_id"
+        return list(reversed(self.order)), self.links_out, "task_id"
+
+    def schedule(self, scheduling_type, period, constrain, project_date=None, sources=None):
+        """
+        One pass over the graph: forward set soon dates, backward set late dates.
+
+        :param scheduling_type: forward , backward
+        :param period: callable(task, direction, new_date, date_type) -> (calendar_level, date_start, date_end)
+        :param constrain: callable(task, vals, calendar_level, scheduling_type) -> (vals, calendar_level)
+        :param project_date: datetime the roots are planned from.
+        :param sources: task ids keep their dates, only tasks reached from them are planned.
+        :return: list of planned task ids
+        """
+        if scheduling_type not in DATE_KEYS:
+            return []
+
+        if sources is None:
+            roots = set(self.roots(scheduling_type))
+            start_ids = roots
+        else:
+            roots = set()
+            start_ids = sources
+
+        sources = set(start_ids)
+        order, links_in, other_field = self._pass_index(scheduling_type)
+
+        planned = []
+        reached = set()
+        for task_id in order:
+            task = self.tasks[task_id]
+
+            if task_id in roots:
+                reached.add(task_id)
+                self._plan_root(task, scheduling_type, project_date, period, constrain)
+                planned.append(task_id)
+                continue
+
+            if task_id in sources:
+                reached.add(task_id)
+                continue
+
+            task_links = links_in.get(task_id, [])
+            if not any(link[other_field] in reached for link in task_links):
+                continue
+
+            reached.add(task_id)
+            if self._plan_links(task, task_links, scheduling_type, period, constrain):
+                planned.append(task_id)
+
+        return planned
+
+    def propagate(self, scheduling_type, task_ids, period, constrain, project_date=None):
+        """
+        Plan again task_ids and then only the tasks after a changed task or a
+        task whose dates moved (forward: successors, backward: predecessors),
+        in pass order.
+
+        :param task_ids: changed tasks (duration, links, constraint...)
+        :return: list of task ids whose dates moved, in pass order
+        """
+        if scheduling_type not in DATE_KEYS:
+            return []
+
+        date_start_key, date_end_key, detail_key = DATE_KEYS[scheduling_type]
+        order, links_in, other_field = self._pass_index(scheduling_type)
+        if scheduling_type == "forward":
+            links_out, next_field = self.links_out, "task_id"
+        else:
+            links_out, next_field = self.links_in, "parent_task_id"
+
+        position = dict((task_id, index) for index, task_id in enumerate(order))
+        roots = set(self.roots(scheduling_type))
+
+        changed = set(task_ids)
+        queue = [position[task_id] for task_id in changed if task_id in position]
+        heapq.heapify(queue)
+        queued = set(queue)
+
+        moved = []
+        while queue:
+            task_id = order[heapq.heappop(queue)]
+            task = self.tasks[task_id]
+            before = (to_datetime(task.get(date_start_key)), to_datetime(task.get(date_end_key)))
+
+            if task_id in roots:
+                self._plan_root(task, scheduling_type, project_date, period, constrain)
+            else:
+                self._plan_links(task, links_in.get(task_id, []), scheduling_type, period, constrain)
+
+            if (to_datetime(task.get(date_start_key)), to_datetime(task.get(date_end_key))) != before:
+                moved.append(task_id)
+            elif task_id not in changed:
+                continue
+
+            for link in links_out.get(task_id, []):
+                next_position = position.get(link[next_field])
+                if next_position is not None and next_position not in queued:
+                    queued.add(next_position)
+                    heapq.heappush(queue, next_position)
+
+        return moved
+
+    def critical_path(self):
+        for task in self.tasks.values():
+            critical_path_info(task)
+
+    def _plan_root(self, task, scheduling_type, project_date, period, constrain):
+
+        if task["schedule_mode"] != "auto":
+            task["calc"] = True
+            return
+
+        if scheduling_type == "forward":
+            direction, date_type = "normal", "date_start"
+        else:
+            direction, date_type = "revers", "date_end"
+
+        date_start_key, date_end_key, detail_key = DATE_KEYS[scheduling_type]
+        calendar_level, date_start, date_end = period(task, direction, project_date, date_type)
+        vals = {date_start_key: date_start, date_end_key: date_end}
+        vals, calendar_level = constrain(task, vals, calendar_level, scheduling_type)
+        self._update(task, scheduling_type, vals, calendar_level)
+
+    def _plan_links(self, task, task_links, scheduling_type, period, constrain):
+        """
+        Plan task from its links, grouped by link type. When a task has links
+        of several types the most restrictive result is kept: the latest start
+        going forward, the earliest end going backward.
+        """
+        if task["schedule_mode"] != "auto":
+            return False
+
+        date_start_key, date_end_key, detail_key = DATE_KEYS[scheduling_type]
+
+        groups = OrderedDict()
+        for link in task_links:
+            groups.setdefault(link["type"], []).append(link)
+
+        best_vals = best_level = best_date = None
+        for type_link, links in groups.items():
+            vals, calendar_level = self._link_vals(task, type_link, links, scheduling_type, period)
+            if not vals:
+                continue
+
+            if scheduling_type == "forward":
+                date = to_datetime(vals[date_start_key])
+                better = best_date is None or (date is not None and date > best_date)
+            else:
+                date = to_datetime(vals[date_end_key])
+                better = best_date is None or (date is not None and date < best_date)
+
+            if best_vals is None or better:
+                best_vals, best_level, best_date = vals, calendar_level, date
+
+        if not best_vals:
+            return False
+
+        vals, calendar_level = constrain(task, best_vals, best_level, scheduling_type)
+        self._update(task, scheduling_type, vals, calendar_level)
+        return True
+
+    def _link_vals(self, task, type_link, links, scheduling_type, period):
+
+        if type_link not in LINK_DATE_FIELDS[scheduling_type]:
+            return {}, False
+
+        task_field, date_field, date_field_two = LINK_DATE_FIELDS[scheduling_type][type_link]
+        operation, date_type, direction = LINK_NEW_DATE[scheduling_type][type_link]
+
+        date_list = []
+        for link in links:
+            parent_task = self.tasks.get(link[task_field])
+            if not parent_task or not parent_task.get(date_field):
+                continue
+
+            parent_date = to_datetime(parent_task[date_field])
+            if link["lag_qty"] != 0 and parent_date and parent_task.get(date_field_two):
+                parent_date = lag_timedelta(parent_date, link["lag_qty"], link["lag_type"],
+                                            to_datetime(parent_task[date_field_two]))
+            date_list.append(parent_date)
+
+        if not date_list:
+            return {}, False
+
+        date_start_key, date_end_key, detail_key = DATE_KEYS[scheduling_type]
+        calendar_level, date_start, date_end = period(task, direction, operation(date_list), date_type)
+        return {date_start_key: date_start, date_end_key: date_end}, calendar_level
+
+    def _update(self, task, scheduling_type, vals, calendar_level):
+
+        date_start_key, date_end_key, detail_key = DATE_KEYS[scheduling_type]
+        if date_start_key not in vals or date_end_key not in vals:
+            return
+
+        task["calc"] = True
+        task[date_start_key] = vals[date_start_key]
+        task[date_end_key] = vals[date_end_key]
+
+        if calendar_level:
+            task[detail_key] = calendar_level
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Working time index of a resource calendar for the project scheduler.
+
+Work intervals (attendances with global leaves already applied) are kept
+in a sorted array with the cumulative working seconds before each of
+them, so adding or subtracting a duration is a binary search instead of
+a day by day walk over attendances and leaves. All datetimes are naive,
+in the calendar time zone. The index grows on demand, up to MAX_DAYS
+around the dates asked.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
+
+MAX_DAYS = 2000
+BLOCK_DAYS = 366
+
+
+class WorkingTimeIndex(object):
+
+    def __init__(self, attendances, leaves):
+        """
+        :param attendances: list of dict: dayofweek (int), hour_from, hour_to (float hours),
+                            date_from, date_to (date or False), name
+        :param leaves: list of dict: date_from, date_to (naive datetime), name
+        """
+        self.attendances = {}
+        for attendance in sorted(attendances, key=lambda att: (att["dayofweek"], att["hour_from"])):
+            self.attendances.setdefault(attendance["dayofweek"], []).append(attendance)
+        self.leaves = leaves
+
+        self._lock = threading.Lock()
+        self._days = {}
+        self._data = None
+
+    # Build
+
+    def _check_leave(self, leaves, work_from, work_to):
+        """
+        Same rules as project.task _check_leave:
+            True, False = work interval in leave totaly
+            False, dict of new from and to = leave cut of from or to
+            False, False = nothing to do
+        """
+        for leave in leaves:
+            leave_from = leave["date_from"]
+            leave_to = leave["date_to"]
+
+            if not leave_from > work_from and not leave_to < work_to:
+                return True, False
+
+            new_work_from = work_from
+            if leave_from <= work_from and leave_to.date() == work_from.date():
+                td_from = leave_to - work_from
+                if td_from.days == 0:
+                    new_work_from = work_from + td_from
+
+            new_work_to = work_to
+            if leave_to >= work_to and leave_from.date() == work_to.date():
+                td_to = work_to - leave_from
+                if td_to.days == 0:
+                    new_work_to = work_to - td_to
+
+            if new_work_from != work_from or new_work_to != work_to:
+                return False, {"name": leave["name"], "from": new_work_from, "to": new_work_to}
+
+        return False, False
+
+    def _day_segments(self, day):
+        """
+        :return: list of (from, to, attendance name, leave name or False) for day
+        """
+        segments = self._days.get(day)
+        if segments is not None:
+            return segments
+
+        segments = []
+        midnight = datetime.combine(day, time())
+        day_end = midnight + timedelta(days=1)
+        leaves = [leave for leave in self.leaves
+                  if leave["date_from"] <= day_end and leave["date_to"] >= midnight]
+
+        for attendance in self.attendances.get(day.weekday(), []):
+            if attendance["date_from"] and attendance["date_from"] > day:
+                continue
+            if attendance["date_to"] and attendance["date_to"] < day:
+                continue
+
+            work_from = midnight + timedelta(hours=attendance["hour_from"])
+            work_to = midnight + timedelta(hours=attendance["hour_to"])
+            cut_name = False
+
+            if leaves:
+                global_leave, cut_hour = self._check_leave(leaves, work_from, work_to)
+                if global_leave:
+                    continue
+                if cut_hour:
+                    work_from, work_to, cut_name = cut_hour["from"], cut_hour["to"], cut_hour["name"]
+
+            if work_to > work_from:
+                segments.append((work_from, work_to, attendance["name"], cut_name))
+
+        self._days[day] = segments
+        return segments
+
+    def _build(self, first_day, last_day):
+        segments = []
+        day = first_day
+        while day <= last_day:
+            segments.extend(self._day_segments(day))
+            day += timedelta(days=1)
+
+        starts = [segment[0] for segment in segments]
+        ends = [segment[1] for segment in segments]
+        cumul = [0.0]
+        for segment in segments:
+            cumul.append(cumul[-1] + (segment[1] - segment[0]).total_seconds())
+
+        return first_day, last_day, starts, ends, cumul, segments
+
+    def _snapshot(self, first_day, last_day):
+        with self._lock:
+            data = self._data
+            if data is None or first_day < data[0] or last_day > data[1]:
+                if data is not None:
+                    first_day = min(first_day, data[0])
+                    last_day = max(last_day, data[1])
+                data = self._data = self._build(first_day, last_day)
+        return data
+
+    # Query
+
+    def forward(self, date_start, seconds):
+        """
+        Work intervals from date_start until seconds of work are done.
+        :return: list of (from, to, day offset from date_start, segment)
+        """
+        if seconds <= 0:
+            return []
+
+        day = date_start.date()
+        span = BLOCK_DAYS
+        while True:
+            first_day, last_day, starts, ends, cumul, segments = self._snapshot(day, day + timedelta(days=span))
+            count = len(segments)
+
+            i = bisect_right(ends, date_start)
+            if i < count:
+                begin = cumul[i] + max(0.0, (date_start - starts[i]).total_seconds())
+                target = begin + seconds
+                j = bisect_left(cumul, target) - 1
+                if j < count or span >= MAX_DAYS:
+                    break
+            elif span >= MAX_DAYS:
+                return []
+            span = min(span * 2, MAX_DAYS)
+
+        partial = j >= count
+        j = min(j, count - 1)
+
+        result = []
+        for k in range(i, j + 1):
+            piece_from = max(starts[k], date_start) if k == i else starts[k]
+            if k == j and not partial:
+                piece_to = starts[k] + timedelta(seconds=target - cumul[k])
+            else:
+                piece_to = ends[k]
+            result.append((piece_from, piece_to, (starts[k].date() - day).days, segments[k]))
+
+        return result
+
+    def backward(self, date_end, seconds):
+        """
+        Work intervals back from date_end until seconds of work are done.
+        :return: list of (from, to, day offset to date_end, segment), latest first
+        """
+        if seconds <= 0:
+            return []
+
+        day = date_end.date()
+        span = BLOCK_DAYS
+        while True:
+            first_day, last_day, starts, ends, cumul, segments = self._snapshot(day - timedelta(days=span), day)
+
+            k = bisect_left(starts, date_end) - 1
+            if k >= 0:
+                finish = cumul[k] + min((ends[k] - starts[k]).total_seconds(),
+                                        (date_end - starts[k]).total_seconds())
+                target = finish - seconds
+                if target >= 0 or span >= MAX_DAYS:
+                    break
+            elif span >= MAX_DAYS:
+                return []
+            span = min(span * 2, MAX_DAYS)
+
+        partial = target < 0
+        j = 0 if partial else bisect_right(cumul, target) - 1
+
+        result = []
+        for m in range(k, j - 1, -1):
+            piece_to = min(ends[m], date_end) if m == k else ends[m]
+            if m == j and not partial:
+                piece_from = starts[m] + timedelta(seconds=target - cumul[m])
+            else:
+                piece_from = starts[m]
+            result.append((piece_from, piece_to, (day - starts[m].date()).days, segments[m]))
+
+        return result
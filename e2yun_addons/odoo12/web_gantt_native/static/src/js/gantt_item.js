@@ -305,7 +305,7 @@ var GanttListItem = Widget.extend({
 
             self._rpc({
                     model: res_model,
-                    method: 'scheduler_plan',
+                    method: 'scheduler_plan_incremental',
                     args: [res_id],
                     context: self.state.contexts
                 })
@@ -13,7 +13,7 @@
     'author': "Grzegorz Marczyński",
     'category': 'Productivity',
 
-    'version': '12.0.1.3',
+    'version': '12.0.1.4',
 
     'depends': ['web',
                 'bus',
@@ -21,7 +21,11 @@
                 ],
 
     'data': [
+        'security/ir.model.access.csv',
+        'security/web_progress_security.xml',
+        'data/ir_cron.xml',
         'views/templates.xml',
+        'views/web_progress_import_chunk_views.xml',
     ],
 
     'qweb': [
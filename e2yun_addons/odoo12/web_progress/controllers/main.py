@@ -1,6 +1,22 @@
+import datetime
 import json
-from odoo import http
-from odoo.addons.web.controllers.main import ReportController, request
+import operator
+import tempfile
+from werkzeug.wsgi import wrap_file
+from odoo import http, _
+from odoo.exceptions import UserError
+from odoo.http import content_disposition
+from odoo.tools import pycompat
+from odoo.addons.web.controllers.main import ReportController, CSVExport, ExcelExport, request
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# exported files bigger than this are written on disk
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+
 
 class WPReportController(ReportController):
 
@@ -21,4 +37,115 @@ class WPReportController(ReportController):
         web_progress_obj.web_progress_percent(0, 'Report')
         ret = super(WPReportController, self).report_download(data, token)
         web_progress_obj.web_progress_percent(100, 'Report done')
-        return ret
\ No newline at end of file
+        return ret
+
+
+class WPStreamingExport(object):
+    """
+    Export rows streamed batch by batch into a spooled temporary file, so that memory
+    does not grow with the number of exported lines. Grouped exports are left to the standard export.
+    """
+
+    def base(self, data, token):
+        params = json.loads(data)
+        if params.get('groupby'):
+            return super(WPStreamingExport, self).base(data, token)
+        model, fields, ids, domain, import_compat = \
+            operator.itemgetter('model', 'fields', 'ids', 'domain', 'import_compat')(params)
+
+        Model = request.env[model].with_context(import_compat=import_compat, **params.get('context', {}))
+        records = Model.browse(ids) or Model.search(domain, offset=0, limit=False, order=False)
+
+        if not Model._is_an_ordinary_table():
+            fields = [field for field in fields if field['name'] != 'id']
+
+        field_names = [f['name'] for f in fields]
+        if import_compat:
+            columns_headers = field_names
+        else:
+            columns_headers = [val['label'].strip() for val in fields]
+
+        fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self.write_batches(fileobj, columns_headers,
+                           records.web_progress_export_data_iter(field_names, self.raw_data), len(records))
+        size = fileobj.tell()
+        fileobj.seek(0)
+        return request.make_response(wrap_file(request.httprequest.environ, fileobj),
+                                     headers=[('Content-Disposition', content_disposition(self.filename(model))),
+                                              ('Content-Type', self.content_type),
+                                              ('Content-Length', size)],
+                                     cookies={'fileToken': token})
+
+    def write_batches(self, fileobj, fields, batches, count):
+        """
+        Write the exported file
+        :param fileobj: binary file to write into
+        :param fields: column headers
+        :param batches: iterator on lists of rows
+        :param count: number of exported records
+        """
+        raise NotImplementedError()
+
+
+class WPCSVExport(WPStreamingExport, CSVExport):
+
+    def write_batches(self, fileobj, fields, batches, count):
+        writer = pycompat.csv_writer(fileobj, quoting=1)
+        writer.writerow(fields)
+        for rows in batches:
+            for data in rows:
+                row = []
+                for d in data:
+                    # Spreadsheet apps tend to detect formulas on leading =, + and -
+                    if isinstance(d, pycompat.string_types) and d.startswith(('=', '-', '+')):
+                        d = "'" + d
+                    row.append(pycompat.to_text(d))
+                writer.writerow(row)
+
+
+class WPExcelExport(WPStreamingExport, ExcelExport):
+
+    def write_batches(self, fileobj, fields, batches, count):
+        # rows are written in order, constant_memory keeps only the current one in memory
+        workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        if count + 1 > worksheet.xls_rowmax:
+            raise UserError(_("There are too many rows (%s rows, limit: %s) to export as Excel 2007-2013 (.xlsx) "
+                              "format. Consider splitting the export.") % (count, worksheet.xls_rowmax - 1))
+        header_style = workbook.add_format({'bold': True})
+        base_style = workbook.add_format({'text_wrap': True})
+        date_style = workbook.add_format({'text_wrap': True, 'num_format': 'yyyy-mm-dd'})
+        datetime_style = workbook.add_format({'text_wrap': True, 'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        for column, fieldname in enumerate(fields):
+            worksheet.write(0, column, fieldname, header_style)
+            worksheet.set_column(column, column, 30)  # around 220 pixels
+        row_index = 0
+        for rows in batches:
+            for row in rows:
+                row_index += 1
+                if row_index >= worksheet.xls_rowmax:
+                    raise UserError(_("There are too many rows (%s rows, limit: %s) to export as Excel 2007-2013 "
+                                      "(.xlsx) format. Consider splitting the export.") %
+                                    (row_index, worksheet.xls_rowmax - 1))
+                for column, cell_value in enumerate(row):
+                    cell_style = base_style
+                    if isinstance(cell_value, bytes):
+                        try:
+                            cell_value = pycompat.to_text(cell_value)
+                        except UnicodeDecodeError:
+                            raise UserError(_("Binary fields can not be exported to Excel unless their content is "
+                                              "base64-encoded. That does not seem to be the case for %s.") %
+                                            fields[column])
+                    if isinstance(cell_value, str):
+                        if len(cell_value) > worksheet.xls_strmax:
+                            cell_value = _("The content of this cell is too long for an XLSX file (more than %s "
+                                           "characters). Please use the CSV format for this export.") % \
+                                worksheet.xls_strmax
+                        else:
+                            cell_value = cell_value.replace("\r", " ")
+                    elif isinstance(cell_value, datetime.datetime):
+                        cell_style = datetime_style
+                    elif isinstance(cell_value, datetime.date):
+                        cell_style = date_style
+                    worksheet.write(row_index, column, cell_value, cell_style)
+        workbook.close()
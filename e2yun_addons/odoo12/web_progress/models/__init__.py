@@ -2,4 +2,5 @@ from . import base
 from . import base_import
 from . import ir_actions_report
 from . import ir_cron
-from . import web_progress
\ No newline at end of file
+from . import web_progress
+from . import web_progress_import_chunk
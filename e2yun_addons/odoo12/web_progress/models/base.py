@@ -1,5 +1,6 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _
+from odoo.models import fix_import_export_id_paths
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -142,25 +143,41 @@ class Base(models.AbstractModel):
         else:
             return extracted
 
+    @api.multi
+    def web_progress_export_data_iter(self, fields_to_export, raw_data=False):
+        """
+        Streaming version of export_data: yields the exported rows batch by batch, with progress reporting
+        when progress_code is in the context, so that only one batch of rows is held in memory
+        :param fields_to_export: list of fields
+        :param raw_data: True to return value in native Python type
+        :return: yields lists of rows of batches of 1000 records
+        """
+        fields_to_export = [fix_import_export_id_paths(f) for f in fields_to_export]
+        if raw_data:
+            self = self.with_context(export_raw_data=True)
+        for sub in self._export_batches():
+            yield super(Base, sub)._export_rows(fields_to_export)
+
+    @api.multi
+    def _export_batches(self):
+        """ Splits the self recordset in batches of 1000 (to avoid
+        entire-recordset-prefetch-effects) & removes the previous batch
+        from the cache after it's been iterated in full
+        """
+        for idx in self.web_progress_iter(range(0, len(self), 1000), _("exporting batches of 1000 lines") +
+                                          " ({})".format(self._description)):
+            sub = self[idx:idx + 1000]
+            yield sub
+            self.invalidate_cache(ids=sub.ids)
+
     @api.multi
     def _export_rows(self, fields, *args, _is_toplevel_call=True):
         """
         Add progress reporting to base export (on batch-level)
         """
         if _is_toplevel_call and 'progress_code' in self._context:
-            def splittor(rs):
-                """ Splits the self recordset in batches of 1000 (to avoid
-                entire-recordset-prefetch-effects) & removes the previous batch
-                from the cache after it's been iterated in full
-                """
-                for idx in self.web_progress_iter(range(0, len(rs), 1000), _("exporting batches of 1000 lines") +
-                                                  " ({})".format(self._description)):
-                    sub = rs[idx:idx + 1000]
-                    yield sub
-                    rs.invalidate_cache(ids=sub.ids)
-
             ret = []
-            for sub in splittor(self):
+            for sub in self._export_batches():
                 ret += super(Base, sub)._export_rows(fields, _is_toplevel_call=_is_toplevel_call)
             return ret
         return super(Base, self)._export_rows(fields, *args, _is_toplevel_call=_is_toplevel_call)
@@ -1,6 +1,11 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _
 from odoo.exceptions import UserError
+from odoo.models import fix_import_export_id_paths
+from odoo.tools import config
+import logging
+
+_logger = logging.getLogger(__name__)
 
 
 class BaseImport(models.TransientModel):
@@ -13,9 +18,104 @@ class BaseImport(models.TransientModel):
         Re-raise all other errors
         """
         try:
-            ret = super(BaseImport, self).do(fields, columns, options, dryrun=dryrun)
+            chunk_size = self._get_import_chunk_size(options, dryrun)
+            if chunk_size:
+                ret = self._do_chunked(fields, columns, options, chunk_size)
+            else:
+                ret = super(BaseImport, self).do(fields, columns, options, dryrun=dryrun)
         except UserError as e:
             ret = {'messages': [{'record': False, 'type': 'warning', 'message': e.name, }]}
         except Exception:
             raise
-        return ret
\ No newline at end of file
+        return ret
+
+    def _get_import_chunk_size(self, options, dryrun):
+        """
+        Get the number of rows per chunk of a chunked import, 0 for a standard import.
+        Chunked imports are enabled by the chunk_size import option or the web_progress_import_chunk_size
+        configuration option. Tests of imports and imports in batches of the web client are never chunked.
+        """
+        if dryrun or options.get('limit'):
+            return 0
+        return int(options.get('chunk_size') or config.get('web_progress_import_chunk_size') or 0)
+
+    @api.multi
+    def _do_chunked(self, fields, columns, options, chunk_size):
+        """
+        Queue the file by chunks of about chunk_size rows, loaded by the "Load import chunks" scheduled action,
+        each chunk in its own cursor and transaction, and return at once. Progress and errors of the import
+        are kept by its web.progress.import.chunk records (see get_import_state).
+        """
+        self.ensure_one()
+        res_model = self.res_model
+        try:
+            data, import_fields = self._convert_import_data(fields, options)
+            # Parse date and float field
+            data = self._parse_import_data(data, import_fields, options)
+        except ValueError as error:
+            return {'messages': [{'type': 'error', 'message': str(error), 'record': False}]}
+
+        chunks = self._split_import_data(data, import_fields, chunk_size)
+        name_create_enabled_fields = options.pop('name_create_enabled_fields', {})
+        # progress is reported by chunk by the scheduled action, not by the chunks themselves
+        context = dict(self.env.context, name_create_enabled_fields=name_create_enabled_fields)
+        context.pop('progress_code', None)
+        code = self.env['web.progress.import.chunk'].queue(res_model, import_fields, chunks, context)
+        _logger.info('import %s of %d rows queued in %d chunks', code, len(data), len(chunks))
+        if options.get('headers'):
+            self._save_import_mapping(fields, columns)
+        return {'ids': [], 'nextrow': 0, 'import_code': code,
+                'messages': [{'type': 'info', 'record': False,
+                              'message': _("The import of {} rows has been queued in {} chunks.").format(
+                                  len(data), len(chunks))}]}
+
+    @api.multi
+    def _split_import_data(self, data, import_fields, chunk_size):
+        """
+        Split rows in chunks of at least chunk_size rows. Chunks are cut before the first row of a record only:
+        rows without values for the fields of the model itself hold one2many lines of the previous record.
+        :return: list of pairs (index of the first row, rows)
+        """
+        model_fields = self.env[self.res_model]._fields
+        record_indexes = []
+        for index, import_field in enumerate(import_fields):
+            field = model_fields.get(fix_import_export_id_paths(import_field)[0])
+            if not (field and field.type == 'one2many'):
+                record_indexes.append(index)
+        chunks = []
+        start = 0
+        for index, row in enumerate(data):
+            if index - start >= chunk_size and (not record_indexes or any(row[i] for i in record_indexes)):
+                chunks.append((start, data[start:index]))
+                start = index
+        if data:
+            chunks.append((start, data[start:]))
+        return chunks
+
+    def _shift_import_message(self, message, start):
+        """
+        Make row numbers of an import message of a chunk relative to the whole file
+        :param start: index of the first row of the chunk
+        """
+        message = dict(message)
+        if message.get('rows'):
+            message['rows'] = {'from': message['rows']['from'] + start, 'to': message['rows']['to'] + start}
+        if type(message.get('record')) is int:
+            message['record'] += start
+        return message
+
+    @api.multi
+    def _save_import_mapping(self, fields, columns):
+        """
+        Save the field selected for each column of the file, as a standard import does
+        """
+        mapping_obj = self.env['base_import.mapping']
+        for index, column_name in enumerate(columns):
+            if column_name:
+                mapping = mapping_obj.search([('res_model', '=', self.res_model), ('column_name', '=', column_name)])
+                if mapping:
+                    mapping.write({'field_name': fields[index]})
+                else:
+                    mapping_obj.create({'res_model': self.res_model,
+                                        'column_name': column_name,
+                                        'field_name': fields[index]})
@@ -0,0 +1,229 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo.tools import config
+from threading import RLock
+import json
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+lock = RLock()
+# backend chosen by the configuration, created on first use
+_backend = None
+
+
+class ProgressBackend(object):
+    """
+    Storage of the live progress of ongoing operations and of cancel requests.
+    Progress of an operation is stored as the list of the progress vals of all its recursion depths,
+    as they were last reported.
+    """
+    def __init__(self, ttl=1800):
+        """
+        :param ttl: seconds after which the data of an operation not reported anymore is forgotten
+        """
+        self.ttl = ttl
+
+    def store(self, dbname, code, progress_list):
+        """
+        Store the last progress of an operation
+        :param progress_list: list of progress vals, one per recursion depth
+        """
+        raise NotImplementedError()
+
+    def get(self, dbname, code):
+        """
+        :return: (list) last progress vals of an operation, empty if unknown
+        """
+        raise NotImplementedError()
+
+    def get_all(self, dbname):
+        """
+        :return: (dict) code: last progress vals of every operation
+        """
+        raise NotImplementedError()
+
+    def clear(self, dbname, code):
+        """
+        Forget the progress of an operation (its cancel request is kept)
+        """
+        raise NotImplementedError()
+
+    def cancel(self, dbname, code, uid):
+        """
+        Register a cancel request of an operation
+        :param uid: id of the user cancelling the operation
+        """
+        raise NotImplementedError()
+
+    def get_cancel_uid(self, dbname, code):
+        """
+        :return: (int) id of the user who cancelled the operation or None
+        """
+        raise NotImplementedError()
+
+    def claim_report(self, dbname, code, uid, now, period):
+        """
+        Claim the next progress report of an operation, shared by all the processes reporting it
+        :param uid: id of the user running the operation
+        :param now: (float) timestamp of the report
+        :param period: seconds between two reports
+        :return: (pair) timestamp of the first report of the operation and
+            whether the report is claimed, i.e. no report was made less than period ago
+        """
+        raise NotImplementedError()
+
+    def release(self, dbname, code):
+        """
+        Forget the report times of a finished operation
+        """
+        raise NotImplementedError()
+
+
+class MemoryProgressBackend(ProgressBackend):
+    """
+    Progress kept in the memory of the server process.
+    Only for servers running in one process (threaded mode, no --workers).
+    """
+    def __init__(self, ttl=1800):
+        super(MemoryProgressBackend, self).__init__(ttl)
+        # (dbname, code): (time of the report, progress list)
+        self.progress = {}
+        # (dbname, code): (time of the request, user id)
+        self.cancels = {}
+        # (dbname, code): (time of the last report, time of the first report)
+        self.report_times = {}
+
+    def _vacuum(self):
+        limit = time.time() - self.ttl
+        with lock:
+            for data in (self.progress, self.cancels, self.report_times):
+                for key in [k for k, v in data.items() if v[0] < limit]:
+                    del data[key]
+
+    def store(self, dbname, code, progress_list):
+        with lock:
+            self.progress[(dbname, code)] = (time.time(), progress_list)
+
+    def get(self, dbname, code):
+        with lock:
+            return list(self.progress.get((dbname, code), (0, []))[1])
+
+    def get_all(self, dbname):
+        self._vacuum()
+        with lock:
+            return {code: list(progress_list)
+                    for (db, code), (ts, progress_list) in self.progress.items() if db == dbname}
+
+    def clear(self, dbname, code):
+        with lock:
+            self.progress.pop((dbname, code), None)
+
+    def cancel(self, dbname, code, uid):
+        with lock:
+            self.cancels[(dbname, code)] = (time.time(), uid)
+
+    def get_cancel_uid(self, dbname, code):
+        with lock:
+            return self.cancels.get((dbname, code), (0, None))[1]
+
+    def claim_report(self, dbname, code, uid, now, period):
+        with lock:
+            last, first = self.report_times.get((dbname, code), (None, now))
+            if last is not None and now - last < period:
+                return first, False
+            self.report_times[(dbname, code)] = (now, first)
+            return first, True
+
+    def release(self, dbname, code):
+        with lock:
+            self.report_times.pop((dbname, code), None)
+
+
+class RedisProgressBackend(ProgressBackend):
+    """
+    Progress kept in Redis, shared by all the workers of all the servers using the same Redis database.
+    Keys:
+        web_progress:<dbname>:<code> - JSON progress list, expiring after ttl
+        web_progress:<dbname>:<code>:cancel - id of the user who cancelled the operation, expiring after ttl
+        web_progress:<dbname>:<code>:first - time of the first report, expiring after ttl
+        web_progress:<dbname>:<code>:report - set while a report was made less than the report period ago
+        web_progress:<dbname> - hash code: time of the last report, to list the operations
+    """
+    def __init__(self, url, ttl=1800):
+        super(RedisProgressBackend, self).__init__(ttl)
+        import redis
+        self.redis = redis.StrictRedis.from_url(url)
+
+    def _key(self, dbname, code=None, suffix=None):
+        return ':'.join(['web_progress', dbname] + [k for k in (code, suffix) if k])
+
+    def store(self, dbname, code, progress_list):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._key(dbname, code), json.dumps(progress_list), ex=self.ttl)
+        pipe.hset(self._key(dbname), code, time.time())
+        pipe.execute()
+
+    def get(self, dbname, code):
+        data = self.redis.get(self._key(dbname, code))
+        return data and json.loads(data.decode('utf-8')) or []
+
+    def get_all(self, dbname):
+        codes = {code.decode('utf-8'): float(ts) for code, ts in self.redis.hgetall(self._key(dbname)).items()}
+        limit = time.time() - self.ttl
+        expired = [code for code, ts in codes.items() if ts < limit]
+        if expired:
+            self.redis.hdel(self._key(dbname), *expired)
+        codes = [code for code in codes if code not in expired]
+        if not codes:
+            return {}
+        data_list = self.redis.mget([self._key(dbname, code) for code in codes])
+        return {code: json.loads(data.decode('utf-8')) for code, data in zip(codes, data_list) if data}
+
+    def clear(self, dbname, code):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(self._key(dbname, code))
+        pipe.hdel(self._key(dbname), code)
+        pipe.execute()
+
+    def cancel(self, dbname, code, uid):
+        self.redis.set(self._key(dbname, code, 'cancel'), uid, ex=self.ttl)
+
+    def get_cancel_uid(self, dbname, code):
+        uid = self.redis.get(self._key(dbname, code, 'cancel'))
+        return uid and int(uid) or None
+
+    def claim_report(self, dbname, code, uid, now, period):
+        first_key = self._key(dbname, code, 'first')
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._key(dbname, code, 'report'), uid, nx=True, px=max(int(period * 1000), 1))
+        pipe.set(first_key, now, nx=True, ex=self.ttl)
+        pipe.get(first_key)
+        claimed, _new, first = pipe.execute()
+        return float(first or now), bool(claimed)
+
+    def release(self, dbname, code):
+        self.redis.delete(self._key(dbname, code, 'report'), self._key(dbname, code, 'first'))
+
+
+def get_backend(ttl=1800):
+    """
+    Get the progress backend chosen by the configuration option web_progress_backend:
+        database (default) - progress is stored in web.progress records, returns None
+        memory - MemoryProgressBackend
+        redis - RedisProgressBackend using the option web_progress_redis_url
+    :param ttl: seconds after which the data of an operation not reported anymore is forgotten
+    """
+    global _backend
+    with lock:
+        if _backend is None:
+            name = config.get('web_progress_backend') or 'database'
+            if name == 'memory':
+                _backend = MemoryProgressBackend(ttl)
+            elif name == 'redis':
+                url = config.get('web_progress_redis_url') or 'redis://localhost:6379/0'
+                _backend = RedisProgressBackend(url, ttl)
+            else:
+                if name != 'database':
+                    _logger.warning("Unknown web_progress_backend {}, using database".format(name))
+                _backend = False
+    return _backend or None
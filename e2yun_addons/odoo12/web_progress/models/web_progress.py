@@ -3,6 +3,7 @@ from odoo import models, api, registry, fields, _, SUPERUSER_ID
 from odoo.exceptions import UserError
 from threading import RLock
 from datetime import datetime, timedelta
+from .progress_backend import get_backend
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -15,6 +16,9 @@ first_report_time = {}
 recur_depths = {}
 # progress reports data
 progress_data = {}
+# keys of progress vals returned to the web client
+progress_keys = ['msg', 'code', 'progress', 'progress_total', 'done', 'total', 'time_left', 'time_total',
+                 'time_elapsed', 'state', 'cancellable', 'uid', 'user']
 
 
 class WebProgress(models.TransientModel):
@@ -40,6 +44,28 @@ class WebProgress(models.TransientModel):
                               ], "State")
     cancellable = fields.Boolean("Cancellable")
 
+    @api.model_cr
+    def init(self):
+        # report times of ongoing operations shared by all the processes reporting them (see _claim_report),
+        # unlogged as this is lost without harm on a crash
+        self.env.cr.execute("""
+        CREATE UNLOGGED TABLE IF NOT EXISTS web_progress_state (
+            code VARCHAR PRIMARY KEY,
+            create_uid INTEGER,
+            first_report_time TIMESTAMP,
+            last_report_time TIMESTAMP
+        )
+        """)
+
+    @api.model
+    def _transient_vacuum(self, force=False):
+        """
+        Remove also the report times of operations not reported anymore
+        """
+        self.env.cr.execute("DELETE FROM web_progress_state WHERE last_report_time < %s",
+                            (datetime.now() - timedelta(hours=self._transient_max_hours),))
+        return super(WebProgress, self)._transient_vacuum(force=force)
+
     #
     # Called by web client
     #
@@ -64,6 +90,12 @@ class WebProgress(models.TransientModel):
         :param code: web progress code
         :param recur_depth: recursion depth
         """
+        backend = self._get_backend()
+        if backend and code:
+            progress_list = backend.get(self.env.cr.dbname, code)
+            if progress_list:
+                return [{key: vals.get(key) for key in progress_keys} for vals in progress_list
+                        if recur_depth is None or vals.get('recur_depth') == recur_depth]
         result = []
         domain = []
         if recur_depth is not None:
@@ -103,13 +135,18 @@ class WebProgress(models.TransientModel):
         """
         Get progress information for all ongoing operations
         """
+        backend = self._get_backend()
+        if backend:
+            return self._get_all_progress_backend(backend)
+        # only operations with report times are ongoing
         query = """
-        SELECT DISTINCT
-        FIRST_VALUE(CASE WHEN state = 'ongoing' AND done != total THEN id END) 
-            OVER (PARTITION BY code ORDER BY create_date DESC, recur_depth DESC) AS id
-        FROM web_progress
-        WHERE recur_depth = 0 {user_id}
-        """.format(user_id=self.env.user.id != SUPERUSER_ID and "AND create_uid = {}".format(self.env.user.id) or '')
+        SELECT DISTINCT ON (p.code)
+            CASE WHEN p.state = 'ongoing' AND p.done != p.total THEN p.id END AS id
+        FROM web_progress_state s
+        JOIN web_progress p ON p.code = s.code
+        WHERE p.recur_depth = 0 {user_id}
+        ORDER BY p.code, p.create_date DESC
+        """.format(user_id=self.env.user.id != SUPERUSER_ID and "AND p.create_uid = {}".format(self.env.user.id) or '')
         # superuser has right to see (and cancel) progress of everybody
         # _logger.info(query)
         self.env.cr.execute(query)
@@ -118,18 +155,8 @@ class WebProgress(models.TransientModel):
         # compute real progress when there are recursive progress calls
         progress_real = {}
         for progress_id in progress_ids:
-            progress = 0
-            progress_total = 100
             deep_progress_list = progress_id.get_progress(progress_id.code)
-            if len(deep_progress_list) <= 1:
-                progress = progress_id.progress
-            else:
-                for el in deep_progress_list:
-                    if el['progress'] and el['total']:
-                        progress += el['progress'] * progress_total / 100
-                    if el['total']:
-                        progress_total /= el['total']
-            progress_real[progress_id.code] = round(progress, 0)
+            progress_real[progress_id.code] = self._get_real_progress(deep_progress_list, progress_id.progress)
         return [{'msg': progress_id.msg,
                  'code': progress_id.code,
                  'progress': progress_real[progress_id.code],
@@ -140,6 +167,47 @@ class WebProgress(models.TransientModel):
                  'uid': progress_id.create_uid.id,
                  } for progress_id in progress_ids]
 
+    def _get_all_progress_backend(self, backend):
+        """
+        Get progress information for all ongoing operations from the progress backend
+        """
+        result = []
+        for code, progress_list in sorted(backend.get_all(self.env.cr.dbname).items()):
+            vals = progress_list and progress_list[0]
+            if not vals or vals.get('recur_depth') or vals.get('state') != 'ongoing' or \
+                    vals.get('done') == vals.get('total'):
+                continue
+            # superuser has right to see (and cancel) progress of everybody
+            if self.env.user.id != SUPERUSER_ID and vals.get('uid') != self.env.user.id:
+                continue
+            result.append({'msg': vals.get('msg'),
+                           'code': code,
+                           'progress': self._get_real_progress(progress_list, vals.get('progress')),
+                           'done': vals.get('done'),
+                           'total': vals.get('total'),
+                           'state': vals.get('state'),
+                           'cancellable': vals.get('cancellable'),
+                           'uid': vals.get('uid'),
+                           })
+        return result
+
+    def _get_real_progress(self, deep_progress_list, progress):
+        """
+        Compute real progress when there are recursive progress calls
+        :param deep_progress_list: progress vals of all recursion depths
+        :param progress: progress of the main operation
+        :return: (float) real progress rounded to 0 decimals
+        """
+        if len(deep_progress_list) > 1:
+            progress = 0
+            progress_total = 100
+            for el in deep_progress_list:
+                if el['progress'] and el['total']:
+                    progress += el['progress'] * progress_total / 100
+                if el['total']:
+                    progress_total /= el['total']
+        return round(progress or 0, 0)
+
     #
     # Protected members called by backend
     # Do not call them directly
@@ -201,54 +269,173 @@ class WebProgress(models.TransientModel):
             recur_depth = recur_depths.get(code, 0)
         return recur_depth
 
+    def _get_backend(self):
+        """
+        Get the backend storing the live progress, None when it is stored in web.progress records
+        """
+        return get_backend(int(self._transient_max_hours * 3600))
+
     @api.model
-    def _create_progress(self, vals_list, notify=True):
+    def _create_progress(self, vals_list, notify=True, cr=None):
         """
         Create a web progress record
         Creation uses a fresh cursor, i.e. outside the current transaction scope
+        With a progress backend, only the final state of the main operation is stored in web.progress
         :param vals: list of creation vals
+        :param cr: fresh cursor of the report to use instead of a new one, committed by the caller
         :return: None
         """
         if not vals_list:
             return
         code = vals_list[0].get('code')
+        backend = self._get_backend()
+        if backend:
+            if not any(vals.get('state') == 'done' and not vals.get('recur_depth') for vals in vals_list):
+                self._store_progress(backend, vals_list, notify=notify)
+                return
+            backend.clear(self.env.cr.dbname, code)
+        if cr:
+            self._create_progress_records(cr, vals_list, notify=notify)
+            return
         with api.Environment.manage():
             with registry(self.env.cr.dbname).cursor() as new_cr:
-                # Create a new environment with new cursor database
-                new_env = api.Environment(new_cr, self.env.uid, self.env.context)
-                # with_env replace original env for this method
-                progress_obj = self.with_env(new_env)
-                for vals in vals_list:
-                    progress_obj.create(vals)  # isolated transaction to commit
-                # notify bus
-                if notify:
-                    progress_notif = progress_obj.get_progress(code)
-                    new_env['bus.bus'].sendone('web_progress', progress_notif)
-                new_env.cr.commit()
+                self._create_progress_records(new_cr, vals_list, notify=notify)
+                new_cr.commit()
+
+    def _create_progress_records(self, new_cr, vals_list, notify=True):
+        """
+        Create web progress records in a fresh cursor
+        """
+        code = vals_list[0].get('code')
+        # Create a new environment with new cursor database
+        new_env = api.Environment(new_cr, self.env.uid, self.env.context)
+        # with_env replace original env for this method
+        progress_obj = self.with_env(new_env)
+        for vals in vals_list:
+            progress_obj.create(vals)  # isolated transaction to commit
+        # notify bus
+        if notify:
+            progress_notif = progress_obj.get_progress(code)
+            new_env['bus.bus'].sendone('web_progress', progress_notif)
+
+    def _store_progress(self, backend, vals_list, notify=True):
+        """
+        Store live progress in the progress backend and notify the bus
+        :param backend: progress backend
+        :param vals_list: list of progress vals of all recursion depths
+        """
+        dbname = self.env.cr.dbname
+        code = vals_list[0].get('code')
+        if any(vals.get('state') == 'cancel' for vals in vals_list):
+            backend.cancel(dbname, code, self.env.user.id)
+            return
+        progress_list = []
+        for vals in vals_list:
+            progress_vals = {key: vals.get(key, False) for key in progress_keys}
+            progress_vals.update(recur_depth=vals.get('recur_depth', 0),
+                                 uid=self.env.user.id,
+                                 user=self.env.user.name)
+            progress_list.append(progress_vals)
+        backend.store(dbname, code, progress_list)
+        if notify:
+            with api.Environment.manage():
+                with registry(dbname).cursor() as new_cr:
+                    # the bus is the only table written
+                    new_env = api.Environment(new_cr, self.env.uid, self.env.context)
+                    new_env['bus.bus'].sendone('web_progress', [{key: vals[key] for key in progress_keys}
+                                                                for vals in progress_list])
+                    new_env.cr.commit()
 
     @api.model
-    def _check_cancelled(self, params):
+    def _check_cancelled(self, params, cr=None):
         """
         Check if operation was not cancelled by the user.
         The check is executed using a fresh cursor, i.e., it looks outside the current transaction scope
         :param code: web progress code
+        :param cr: fresh cursor of the report to use instead of a new one
         :return: (recordset) res.users of the user that cancelled the operation
         """
         code = params.get('code')
+        backend = self._get_backend()
+        if backend:
+            cancel_uid = backend.get_cancel_uid(self.env.cr.dbname, code)
+            if cancel_uid and cancel_uid in (self.env.user.id, SUPERUSER_ID):
+                return self.create_uid.browse(cancel_uid)
+            return False
+        if cr:
+            return self._check_cancelled_query(cr, code)
         with api.Environment.manage():
             with registry(self.env.cr.dbname).cursor() as new_cr:
                 # use new cursor to check for cancel
-                query = """
-                SELECT create_uid FROM web_progress
-                WHERE code = %s AND state = 'cancel' AND recur_depth = 0 
-                    AND (create_uid = %s OR create_uid = %s)
-                """
-                new_cr.execute(query, (code, self.env.user.id, SUPERUSER_ID))
-                result = new_cr.fetchall()
-                if result:
-                    return self.create_uid.browse(result[0])
+                return self._check_cancelled_query(new_cr, code)
+
+    def _check_cancelled_query(self, new_cr, code):
+        query = """
+        SELECT create_uid FROM web_progress
+        WHERE code = %s AND state = 'cancel' AND recur_depth = 0 
+            AND (create_uid = %s OR create_uid = %s)
+        """
+        new_cr.execute(query, (code, self.env.user.id, SUPERUSER_ID))
+        result = new_cr.fetchall()
+        if result:
+            return self.create_uid.browse(result[0])
         return False
 
+    def _claim_report(self, params, time_now, cr=None):
+        """
+        Claim the next progress report of an operation. Report times are shared by all the processes reporting
+        the operation (web_progress_state table or progress backend), so that they report once per period
+        and estimate the time left from the same start.
+        :param params: params of progress
+        :param time_now: datetime of now
+        :param cr: fresh cursor of the report to use instead of a new one, committed by the caller
+        :return: (pair) datetime of the first report of the operation (None if it is this one) and
+            whether to report now
+        """
+        code = params.get('code')
+        backend = self._get_backend()
+        if backend:
+            first, claimed = backend.claim_report(self.env.cr.dbname, code, self.env.user.id, time_now.timestamp(),
+                                                  self._progress_period_secs)
+            first_ts = datetime.fromtimestamp(first)
+        else:
+            query = """
+            INSERT INTO web_progress_state (code, create_uid, first_report_time, last_report_time)
+            VALUES (%(code)s, %(uid)s, %(now)s, %(now)s)
+            ON CONFLICT (code) DO UPDATE SET last_report_time = EXCLUDED.last_report_time
+            WHERE web_progress_state.last_report_time <= %(last)s
+            RETURNING first_report_time
+            """
+            query_params = dict(code=code, uid=self.env.user.id, now=time_now,
+                                last=time_now - timedelta(seconds=self._progress_period_secs))
+            if cr:
+                cr.execute(query, query_params)
+                result = cr.fetchone()
+            else:
+                with api.Environment.manage():
+                    with registry(self.env.cr.dbname).cursor() as new_cr:
+                        new_cr.execute(query, query_params)
+                        result = new_cr.fetchone()
+                        new_cr.commit()
+            claimed = bool(result)
+            first_ts = result and result[0] or time_now
+        return first_ts < time_now and first_ts or None, claimed
+
+    def _release_report(self, params):
+        """
+        Remove the shared report times of a finished operation
+        :param params: params of progress
+        """
+        code = params.get('code')
+        backend = self._get_backend()
+        if backend:
+            backend.release(self.env.cr.dbname, code)
+            return
+        with api.Environment.manage():
+            with registry(self.env.cr.dbname).cursor() as new_cr:
+                new_cr.execute("DELETE FROM web_progress_state WHERE code = %s", (code,))
+                new_cr.commit()
+
     def _get_parent_codes(self, params):
         """
         Get list of precise codes of all parents
@@ -359,20 +546,40 @@ class WebProgress(models.TransientModel):
         period_sec = (time_now - last_ts).total_seconds()
         # report progress every time period
         if period_sec >= self._progress_period_secs:
-            if params.get('cancellable', True):
-                user_id = self._check_cancelled(params)
-                if user_id:
-                    raise UserError(_("Operation has been cancelled by") + " " + user_id.name)
-            time_left, time_total, time_elapsed = self._get_time_left(params, time_now, first_ts)
-            if time_left:
-                self._set_attrib_for_all(params, 'time_left', time_left)
-            if time_total:
-                self._set_attrib_for_all(params, 'time_total', time_total)
-            if time_elapsed:
-                self._set_attrib_for_all(params, 'time_elapsed', time_elapsed)
-            self._report_progress_store(params)
             with lock:
                 last_report_time[code] = time_now
+            if self._get_backend():
+                self._report_progress_claimed(params, time_now, first_ts)
+                return
+            with api.Environment.manage():
+                with registry(self.env.cr.dbname).cursor() as new_cr:
+                    # claim, cancel check and progress records in one fresh transaction
+                    self._report_progress_claimed(params, time_now, first_ts, cr=new_cr)
+                    new_cr.commit()
+
+    def _report_progress_claimed(self, params, time_now, first_ts, cr=None):
+        """
+        Report progress if the report of this period is not claimed by another process
+        :param cr: fresh cursor of the report (database mode), committed by the caller
+        """
+        shared_first_ts, claimed = self._claim_report(params, time_now, cr=cr)
+        if not claimed:
+            # reported by another process less than a period ago
+            return
+        if shared_first_ts:
+            first_ts = shared_first_ts
+        if params.get('cancellable', True):
+            user_id = self._check_cancelled(params, cr=cr)
+            if user_id:
+                raise UserError(_("Operation has been cancelled by") + " " + user_id.name)
+        time_left, time_total, time_elapsed = self._get_time_left(params, time_now, first_ts)
+        if time_left:
+            self._set_attrib_for_all(params, 'time_left', time_left)
+        if time_total:
+            self._set_attrib_for_all(params, 'time_total', time_total)
+        if time_elapsed:
+            self._set_attrib_for_all(params, 'time_elapsed', time_elapsed)
+        self._report_progress_store(params, cr=cr)
 
     def _report_progress_done(self, params):
         """
@@ -403,6 +610,7 @@ class WebProgress(models.TransientModel):
                     del last_report_time[code]
                 if code in first_report_time:
                     del first_report_time[code]
+            self._release_report(params)
         # remove data for this precise code code
         with lock:
             if precise_code in progress_data:
@@ -416,7 +624,7 @@ class WebProgress(models.TransientModel):
         vals = {k:v for k,v in params.items() if k in self._fields}
         return vals
 
-    def _report_progress_store(self, params):
+    def _report_progress_store(self, params, cr=None):
         """
         Progress storing function. Stores progress in log and in db.
         :param code: progress operation code
@@ -427,6 +635,7 @@ class WebProgress(models.TransientModel):
         :param recur_depth: recursion depth
         :param cancellable: indicates whether the operation is cancellable
         :param state: state of progress: ongoing or done
+        :param cr: fresh cursor of the report to store it with, committed by the caller
         """
         global progress_data
         codes = self._get_parent_codes(params)
@@ -459,5 +668,5 @@ class WebProgress(models.TransientModel):
             logger_cmd(log_message)
             vals_list.append(self._report_progress_prepare_vals(my_progress_data))
             first_line = False
-        self._create_progress(vals_list)
+        self._create_progress(vals_list, cr=cr)
 
@@ -0,0 +1,218 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models, api, registry, fields, _
+from odoo.exceptions import UserError
+from odoo.tools import config
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+
+class WebProgressImportChunk(models.Model):
+    _name = 'web.progress.import.chunk'
+    _description = "Chunk of an Import"
+    _order = 'id'
+    # days the loaded and cancelled chunks are kept
+    _keep_days = 7
+
+    code = fields.Char("Import Code", required=True, index=True, readonly=True)
+    user_id = fields.Many2one('res.users', "User", required=True, index=True, readonly=True)
+    res_model = fields.Char("Model", required=True, readonly=True)
+    import_fields = fields.Text("Fields", readonly=True)
+    import_context = fields.Text("Context", readonly=True)
+    rows = fields.Text("Rows", readonly=True)
+    start = fields.Integer("First Row", readonly=True, help="Index of the first row of the chunk in the file")
+    row_count = fields.Integer("Rows Count", readonly=True)
+    state = fields.Selection([('pending', "Pending"),
+                              ('done', "Done"),
+                              ('failed', "Failed"),
+                              ('cancel', "Cancelled"),
+                              ], "State", required=True, default='pending', index=True, readonly=True)
+    record_ids = fields.Text("Imported IDs", readonly=True)
+    messages = fields.Text("Messages", readonly=True)
+
+    @api.model
+    def queue(self, res_model, import_fields, chunks, context):
+        """
+        Queue the chunks of an import, loaded by the "Load import chunks" scheduled actions
+        :param chunks: list of pairs (index of the first row, rows)
+        :param context: JSON serializable context of the import
+        :return: code of the import
+        """
+        code = str(uuid.uuid4())
+        self.sudo().create([{'code': code,
+                             'user_id': self.env.uid,
+                             'res_model': res_model,
+                             'import_fields': json.dumps(import_fields),
+                             'import_context': json.dumps(context),
+                             'rows': json.dumps(rows),
+                             'start': start,
+                             'row_count': len(rows),
+                             } for start, rows in chunks])
+        self._wake_up_cron()
+        return code
+
+    @api.model
+    def _get_loader_crons(self):
+        """
+        Get the scheduled actions loading chunks: web_progress_import_workers of them (4 by default), copies of
+        "Load import chunks" being created as needed. A scheduled action runs in one cron thread at a time,
+        so they load chunks in parallel, up to the max_cron_threads of the server.
+        :return: active ir.cron records
+        """
+        cron = self.env.ref('web_progress.ir_cron_load_import_chunks', raise_if_not_found=False)
+        if not cron:
+            return self.env['ir.cron']
+        cron = cron.sudo().with_context(active_test=False)
+        # imports queued at the same time do not both create the missing copies
+        self.env.cr.execute("SELECT pg_advisory_xact_lock(hashtext('web_progress_import_chunk_crons'))")
+        crons = cron.search([('model_id', '=', cron.model_id.id), ('code', '=', cron.code)])
+        workers = int(config.get('web_progress_import_workers') or 4)
+        for index in range(len(crons), workers):
+            crons |= cron.copy({'name': "{} ({})".format(cron.name, index + 1)})
+        return crons.filtered('active')
+
+    @api.model
+    def _wake_up_cron(self):
+        """
+        Run the loading scheduled actions as soon as the import is committed. Running ones are not waited for,
+        they load the new chunks before they stop.
+        """
+        crons = self._get_loader_crons()
+        if crons:
+            self.env.cr.execute("""
+            UPDATE ir_cron SET nextcall = now() at time zone 'UTC'
+            WHERE id IN (SELECT id FROM ir_cron WHERE id IN %s FOR UPDATE SKIP LOCKED)
+            """, (tuple(crons.ids),))
+
+    @api.model
+    def get_import_state(self, code):
+        """
+        Get the state of an import from its chunks
+        :param code: code of the import
+        :return: dict of state (pending, done, failed or cancel), counts of rows by state, ids of the imported
+            records and messages of all chunks
+        """
+        chunks = self.search([('code', '=', code)])
+        rows = dict.fromkeys(['pending', 'done', 'failed', 'cancel'], 0)
+        ids = []
+        messages = []
+        for chunk in chunks:
+            rows[chunk.state] += chunk.row_count
+            ids += json.loads(chunk.record_ids or '[]')
+            messages += json.loads(chunk.messages or '[]')
+        if rows['pending']:
+            state = 'pending'
+        elif rows['cancel']:
+            state = 'cancel'
+        elif rows['failed']:
+            state = 'failed'
+        else:
+            state = 'done'
+        return {'state': state, 'rows': rows, 'ids': ids, 'messages': messages}
+
+    @api.multi
+    def _load(self):
+        """
+        Load the chunk in the current cursor, as the user of the import. A chunk with errors is rolled back.
+        """
+        self.ensure_one()
+        rows = json.loads(self.rows)
+        context = dict(json.loads(self.import_context), import_file=True)
+        model = self.env[self.res_model].sudo(self.user_id).with_context(context)
+        try:
+            with self.env.cr.savepoint():
+                result = model.load(json.loads(self.import_fields), rows)
+        except Exception as e:
+            _logger.exception('import of a chunk failed')
+            result = {'ids': False,
+                      'messages': [{'type': 'error', 'message': str(e), 'record': False,
+                                    'rows': {'from': 0, 'to': len(rows) - 1}}]}
+        import_obj = self.env['base_import.import']
+        messages = [import_obj._shift_import_message(message, self.start) for message in result['messages']]
+        failed = any(message['type'] == 'error' for message in messages)
+        self.write({'state': failed and 'failed' or 'done',
+                    'record_ids': json.dumps(not failed and result['ids'] or []),
+                    'messages': json.dumps(messages),
+                    # loaded rows are not needed anymore
+                    'rows': failed and self.rows or False})
+
+    @api.model
+    def _cron_load_chunks(self):
+        """
+        Load the pending chunks import by import, each chunk in its own cursor and transaction: chunks without
+        errors are committed even if other chunks fail. Progress is reported by chunk to the user of the import,
+        who can cancel the chunks not loaded yet. The loading scheduled actions (see _get_loader_crons) run at
+        the same time, a chunk being loaded by one of them is skipped by the others.
+        Called from a cron.
+        """
+        testing = getattr(threading.currentThread(), 'testing', False)
+        seen_codes = []
+        while True:
+            if not testing:
+                # new snapshot: chunks queued and loaded since the last import
+                self.env.cr.commit()
+            self.env.cr.execute("""
+            SELECT code, user_id FROM web_progress_import_chunk
+            WHERE state = 'pending' AND NOT code = ANY(%s)
+            ORDER BY id LIMIT 1
+            """, (seen_codes,))
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            code, user_id = row
+            seen_codes.append(code)
+            self._load_import(code, user_id)
+        self._vacuum_chunks()
+        return True
+
+    @api.model
+    def _load_import(self, code, user_id):
+        """
+        Load the pending chunks of an import
+        """
+        chunks = self.search([('code', '=', code), ('state', '=', 'pending')])
+        model_name = self.env[chunks[0].res_model]._description.lower()
+        progress_obj = self.sudo(user_id).with_context(progress_code=code)
+        try:
+            for chunk_id in progress_obj.web_progress_iter(chunks.ids, _("importing chunks to {}").format(model_name),
+                                                            cancellable=True, log_level="info"):
+                self._load_in_new_cursor(chunk_id)
+        except UserError as e:
+            # fresh cursor: chunks were changed by other cursors since the snapshot of the cron one,
+            # chunks being loaded by other crons are left to them
+            with api.Environment.manage():
+                with registry(self.env.cr.dbname).cursor() as new_cr:
+                    new_cr.execute("""
+                    UPDATE web_progress_import_chunk SET state = 'cancel', messages = %s
+                    WHERE id IN (SELECT id FROM web_progress_import_chunk
+                                 WHERE code = %s AND state = 'pending' FOR UPDATE SKIP LOCKED)
+                    """, (json.dumps([{'type': 'warning', 'record': False, 'message': e.name}]), code))
+                    new_cr.commit()
+            self.invalidate_cache()
+
+    @api.model
+    def _load_in_new_cursor(self, chunk_id):
+        """
+        Load a pending chunk in its own cursor, skipped if it is loaded by another cron
+        """
+        with api.Environment.manage():
+            with registry(self.env.cr.dbname).cursor() as new_cr:
+                new_cr.execute("""
+                SELECT id FROM web_progress_import_chunk WHERE id = %s AND state = 'pending' FOR UPDATE SKIP LOCKED
+                """, (chunk_id,))
+                if new_cr.fetchone():
+                    self.with_env(self.env(cr=new_cr)).browse(chunk_id)._load()
+                new_cr.commit()
+
+    @api.model
+    def _vacuum_chunks(self):
+        """
+        Delete the loaded and cancelled chunks older than _keep_days days
+        """
+        self.env.cr.execute("""
+        DELETE FROM web_progress_import_chunk WHERE state IN ('done', 'cancel') AND write_date < %s
+        """, (datetime.now() - timedelta(days=self._keep_days),))
@@ -1,8 +1,11 @@
 from odoo.tests import common
-from odoo import exceptions
+from odoo import api, exceptions
+from unittest import mock
+from datetime import datetime, timedelta
 import uuid
 import logging
 from ..models.web_progress import last_report_time
+from ..models import progress_backend
 
 _logger = logging.getLogger(__name__)
 
@@ -116,3 +119,132 @@ class WebProgressTest(common.SavepointCase):
         self.partner_ids.web_progress_percent(0, "Start")
         self.partner_ids.web_progress_percent(50, "Middle")
         self.partner_ids.web_progress_percent(100, "End")
+
+    def test_web_progress_claim_report(self):
+        """
+        Check that report times are shared: no report is claimed less than a period after the previous one
+        """
+        params = dict(code=str(uuid.uuid4()), recur_depth=0)
+        period = self.web_progress_obj._progress_period_secs
+        time_now = datetime.now()
+        first_ts, claimed = self.web_progress_obj._claim_report(params, time_now)
+        self.assertTrue(claimed, msg="First report shall be claimed")
+        self.assertIsNone(first_ts, msg="First report has no previous start")
+        first_ts, claimed = self.web_progress_obj._claim_report(params, time_now + timedelta(seconds=1))
+        self.assertFalse(claimed, msg="Report within the period shall not be claimed")
+        first_ts, claimed = self.web_progress_obj._claim_report(params, time_now + timedelta(seconds=period))
+        self.assertTrue(claimed, msg="Report after the period shall be claimed")
+        self.assertEqual(first_ts, time_now, msg="Time of the first report shall be shared")
+        self.web_progress_obj._release_report(params)
+        first_ts, claimed = self.web_progress_obj._claim_report(params, time_now + timedelta(seconds=1))
+        self.assertTrue(claimed, msg="Report of a released operation shall be claimed")
+        self.web_progress_obj._release_report(params)
+
+    def test_web_progress_memory_backend(self):
+        """
+        Check that live progress and cancel requests are kept in a progress backend
+        """
+        backend = progress_backend.MemoryProgressBackend()
+        progress_backend._backend = backend
+        self.addCleanup(setattr, progress_backend, '_backend', None)
+        progress_code = str(uuid.uuid4())
+        dbname = self.env.cr.dbname
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        for idx, partner_id in enumerate(self.partner_ids.with_progress(msg="Backend")):
+            if idx == 1:
+                self.assertEqual(backend.get(dbname, progress_code)[0]['state'], 'ongoing')
+                progress = self.web_progress_obj.get_progress(progress_code)
+                self.assertEqual(progress[0]['msg'], "Backend")
+                self.assertIn(progress_code, [p['code'] for p in self.web_progress_obj.get_all_progress()])
+        # final state is stored in web.progress only
+        self.assertFalse(backend.get(dbname, progress_code))
+        self.partner_ids.web_progress_cancel()
+        self.assertTrue(backend.get_cancel_uid(dbname, progress_code))
+        self._check_web_progress_cancelled()
+        with self.assertRaises(exceptions.UserError, msg="Exception UserErro shall have been raised"):
+            self._check_web_progress_iter_recordset_many(0)
+
+    def test_split_import_data(self):
+        """
+        Check that chunks of a chunked import are cut before the first row of a record
+        """
+        import_obj = self.env['base_import.import'].create({'res_model': 'res.partner'})
+        data = [['A', 'a1'], ['', 'a2'], ['B', 'b1'], ['C', ''], ['', 'c1']]
+        chunks = import_obj._split_import_data(data, ['name', 'child_ids/name'], 1)
+        self.assertEqual([start for start, rows in chunks], [0, 2, 3], msg="Lines shall stay with their record")
+        self.assertEqual(sum((rows for start, rows in chunks), []), data, msg="All rows shall be in a chunk")
+        message = import_obj._shift_import_message({'type': 'error', 'message': "Error", 'record': 1,
+                                                    'rows': {'from': 1, 'to': 2}}, 3)
+        self.assertEqual(message['record'], 4, msg="Record index shall be relative to the file")
+        self.assertEqual(message['rows'], {'from': 4, 'to': 5}, msg="Rows shall be relative to the file")
+
+    def test_import_chunks(self):
+        """
+        Check that queued chunks are loaded as the user of the import and report their errors
+        """
+        chunk_obj = self.env['web.progress.import.chunk']
+        code = chunk_obj.queue('res.partner', ['name', 'parent_id'],
+                               [(0, [['Chunk A', ''], ['Chunk B', '']]), (2, [['Chunk C', 'No such partner']])], {})
+        chunks = chunk_obj.search([('code', '=', code)])
+        self.assertEqual(chunks.mapped('state'), ['pending', 'pending'], msg="Chunks shall be queued")
+        self.assertEqual(chunk_obj.get_import_state(code)['state'], 'pending', msg="Import shall be pending")
+        for chunk in chunks:
+            chunk._load()
+        self.assertEqual(chunks.mapped('state'), ['done', 'failed'], msg="Chunk with errors shall fail")
+        state = chunk_obj.get_import_state(code)
+        self.assertEqual(state['state'], 'failed', msg="Import with a failed chunk shall fail")
+        self.assertEqual(state['rows'], {'pending': 0, 'done': 2, 'failed': 1, 'cancel': 0})
+        self.assertEqual(self.partner_obj.browse(state['ids']).mapped('name'), ['Chunk A', 'Chunk B'],
+                         msg="Records of chunks without errors shall be imported")
+        self.assertFalse(self.partner_obj.search([('name', '=', 'Chunk C')]), msg="Failed chunk shall be rolled back")
+        self.assertTrue(all(message['rows']['from'] == 2 for message in state['messages'] if message.get('rows')),
+                        msg="Rows of errors shall be relative to the file")
+
+    def test_import_chunks_loaders(self):
+        """
+        Check that loaders running at the same time never load the same chunk
+        """
+        code = str(uuid.uuid4())
+        with self.registry.cursor() as cr:
+            # chunks seen by the cursors of the loaders
+            env = api.Environment(cr, self.env.uid, {})
+            chunk_ids = env['web.progress.import.chunk'].create([
+                {'code': code, 'user_id': self.env.uid, 'res_model': 'res.partner', 'import_fields': '["name"]',
+                 'import_context': '{}', 'rows': '[["Loader {}"]]'.format(index), 'start': index, 'row_count': 1}
+                for index in range(2)]).ids
+            cr.commit()
+
+        def delete_chunks():
+            with self.registry.cursor() as cr:
+                cr.execute("DELETE FROM web_progress_import_chunk WHERE code = %s", (code,))
+                cr.commit()
+        self.addCleanup(delete_chunks)
+
+        loaded = []
+
+        def load(chunk):
+            loaded.append(chunk.id)
+            chunk.write({'state': 'done'})
+
+        chunk_obj = self.env['web.progress.import.chunk']
+        with mock.patch.object(type(chunk_obj), '_load', autospec=True, side_effect=load):
+            with self.registry.cursor() as cr:
+                # another loader is loading the first chunk
+                cr.execute("SELECT id FROM web_progress_import_chunk WHERE id = %s FOR UPDATE", (chunk_ids[0],))
+                for chunk_id in chunk_ids:
+                    chunk_obj._load_in_new_cursor(chunk_id)
+                self.assertEqual(loaded, chunk_ids[1:], msg="Chunk being loaded shall be skipped")
+                cr.rollback()
+            for chunk_id in chunk_ids:
+                chunk_obj._load_in_new_cursor(chunk_id)
+        self.assertEqual(sorted(loaded), sorted(chunk_ids), msg="Each chunk shall be loaded once")
+
+    def test_web_progress_export_data_iter(self):
+        """
+        Check that streamed export yields the same rows as export_data
+        """
+        progress_code = str(uuid.uuid4())
+        partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        batches = list(partner_ids.web_progress_export_data_iter(['name', 'email']))
+        self.assertEqual(sum(batches, []), self.partner_ids.export_data(['name', 'email'])['datas'],
+                         msg="Streamed rows shall be exported rows")
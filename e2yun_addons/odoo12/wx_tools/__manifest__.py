@@ -12,6 +12,7 @@
         'security/res_groups.xml',
         'security/ir.model.access.csv',
         'data/wx_init_data.xml',
+        'data/wx_message_queue_data.xml',
         'views/parent_menus.xml',
         'views/wx_action_act_article_views.xml',
         'views/wx_action_act_custom_views.xml',
@@ -42,6 +43,7 @@
         'views/wx_para_config.xml',
         'views/wx_trace_log.xml',
         'views/wx_trace_log_type.xml',
+        'views/wx_message_queue_views.xml',
         'views/res_company_views.xml',
         'views/res_config_settings_views.xml',
         'views/sale_coupon_program_views.xml',
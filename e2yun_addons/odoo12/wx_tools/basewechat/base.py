@@ -1,22 +1,55 @@
 # coding=utf-8
 import datetime
 import logging
-from odoo import fields
+from odoo import fields, registry
 
 _logger = logging.getLogger(__name__)
 
 
 class EntryBase(object):
+    # 会话记录表及其用户标志字段: 不在内存中的会话按需从表中读取(last_uuid, last_uuid_time)
+    UUID_TABLE = None
+    UUID_KEY = None
 
     def __init__(self):
         self.UUID_OPENID = {}
         self.OPENID_UUID = {}
         self.OPENID_LAST = {}
+        self.dbname = None
+
+    def load_uuid(self, column, value):
+        """
+        从会话记录表读取一个会话到内存, 由其它进程创建或本进程启动前创建的会话
+        :param column: 查询的字段, UUID_KEY 或 last_uuid
+        :return: 是否找到
+        """
+        if not (self.dbname and self.UUID_TABLE):
+            return False
+        try:
+            with registry(self.dbname).cursor() as cr:
+                cr.execute("""
+                    SELECT {key}, last_uuid, last_uuid_time FROM {table}
+                     WHERE {column} = %s AND last_uuid IS NOT NULL AND last_uuid_time IS NOT NULL
+                  ORDER BY last_uuid_time DESC
+                     LIMIT 1
+                """.format(key=self.UUID_KEY, table=self.UUID_TABLE, column=column), (value,))
+                row = cr.fetchone()
+        except Exception:
+            _logger.exception('load uuid failed')
+            return False
+        if not row:
+            return False
+        self.recover_uuid(*row)
+        return True
 
     def get_uuid_from_openid(self, uid, update=True):
         uuid = None
         record_uuid = None
         _key = '%s' % uid
+        if _key not in self.OPENID_UUID or \
+                fields.datetime.now() - self.OPENID_UUID[_key]['last_time'] > datetime.timedelta(seconds=10 * 60):
+            # 不在内存中或已过期: 可能已由其它进程创建或更新
+            self.load_uuid(self.UUID_KEY, _key)
         if _key in self.OPENID_UUID:
             _data = self.OPENID_UUID[_key]
             _now = fields.datetime.now()
@@ -57,6 +90,8 @@ class EntryBase(object):
                 del self.OPENID_UUID[openid]
 
     def get_openid_from_uuid(self, uuid):
+        if uuid not in self.UUID_OPENID:
+            self.load_uuid('last_uuid', uuid)
         return self.UUID_OPENID.get(uuid, None)
 
     def get_active_uuids(self):
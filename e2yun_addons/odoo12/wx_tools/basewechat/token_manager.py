@@ -0,0 +1,185 @@
+# -*-coding:utf-8-*-
+import logging
+import threading
+import time
+import uuid
+
+from wechatpy.session.memorystorage import MemoryStorage
+from wechatpy.session.redisstorage import RedisStorage
+
+logger = logging.getLogger(__name__)
+
+# 释放锁: 只删除自己持有的锁
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+else
+    return 0
+end
+"""
+
+_lock = threading.Lock()
+# host: redis连接(连接池), 同一进程内共享
+_redis_clients = {}
+# appid: MemoryStorage, 未配置redis时同一进程内共享
+_memory_storages = {}
+
+
+def get_redis(host, port=6379):
+    """
+    获取redis连接, 同一host共用一个连接池
+    """
+    import redis
+    with _lock:
+        if (host, port) not in _redis_clients:
+            pool = redis.ConnectionPool(host=host, port=port)
+            _redis_clients[(host, port)] = redis.Redis(connection_pool=pool)
+        return _redis_clients[(host, port)]
+
+
+def get_session_storage(host, appid):
+    """
+    获取token等的存储: 配置了redis(session_storage)时用redis, 所有进程共享;
+    否则用进程内存, 只在单进程部署时可用
+    """
+    if host:
+        return RedisStorage(get_redis(host), prefix=appid)
+    with _lock:
+        if appid not in _memory_storages:
+            _memory_storages[appid] = MemoryStorage()
+        return _memory_storages[appid]
+
+
+class TokenManager(object):
+    """
+    access_token, jsapi_ticket 等有有效期的凭证的共享缓存:
+        - 凭证保存在session存储中, 所有进程共用
+        - 同一时间只有一个进程获取新凭证(redis锁或进程锁), 其它进程等待获取的结果
+        - 到期前refresh_margin秒内由一个进程提前刷新, 其它进程继续使用当前凭证
+        - 统计命中, 未命中, 刷新, 等待, 失败次数
+    存储的键:
+        <name> - 凭证
+        <name>_expires_at - 到期时间戳
+        <name>_lock - 刷新锁(仅redis)
+    """
+
+    def __init__(self, session, refresh_margin=300, min_validity=60, lock_timeout=10):
+        """
+        :param session: wechatpy的session存储(RedisStorage, MemoryStorage)
+        :param refresh_margin: 到期前多少秒开始提前刷新
+        :param min_validity: 剩余有效期少于多少秒的凭证不再使用
+        :param lock_timeout: 刷新锁的超时秒数, 等待其它进程刷新的最长时间
+        """
+        self.session = session
+        self.refresh_margin = refresh_margin
+        self.min_validity = min_validity
+        self.lock_timeout = lock_timeout
+        self.locks = {}
+        self.metrics = {'hit': 0, 'miss': 0, 'refresh': 0, 'wait': 0, 'error': 0}
+
+    def stats(self):
+        """
+        :return: (dict) 命中, 未命中, 刷新, 等待, 失败次数
+        """
+        return dict(self.metrics)
+
+    def _count(self, metric):
+        with _lock:
+            self.metrics[metric] += 1
+
+    def _read(self, name):
+        return self.session.get(name), self.session.get('%s_expires_at' % name) or 0
+
+    def _acquire(self, name, blocking=True):
+        """
+        获取刷新锁
+        :return: 锁的标识, 未获取到返回None
+        """
+        if isinstance(self.session, RedisStorage):
+            key = self.session.key_name('%s_lock' % name)
+            token = uuid.uuid4().hex
+            deadline = time.time() + self.lock_timeout
+            while True:
+                if self.session.redis.set(key, token, nx=True, px=int(self.lock_timeout * 1000)):
+                    return token
+                if not blocking or time.time() >= deadline:
+                    return None
+                time.sleep(0.05)
+        with _lock:
+            lock = self.locks.setdefault(name, threading.Lock())
+        if lock.acquire(blocking, self.lock_timeout if blocking else -1):
+            return lock
+        return None
+
+    def _release(self, name, token):
+        if isinstance(self.session, RedisStorage):
+            key = self.session.key_name('%s_lock' % name)
+            self.session.redis.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+        else:
+            token.release()
+
+    def _refresh(self, name, fetch, value_key):
+        res = fetch()
+        value = res[value_key]
+        expires_in = int(res['expires_in'])
+        expires_at = int(time.time()) + expires_in
+        self.session.set(name, value, expires_in)
+        self.session.set('%s_expires_at' % name, expires_at, expires_in)
+        self._count('refresh')
+        logger.info('refresh %s, expires in %ss, stats %s' % (name, expires_in, self.metrics))
+        return value, expires_at
+
+    def get(self, name, fetch, value_key):
+        """
+        获取凭证, 失效时获取新的凭证
+        :param name: 存储的键, 如 <appid>_access_token
+        :param fetch: 获取新凭证的函数, 返回微信接口的结果, 包含value_key和expires_in
+        :param value_key: 结果中凭证的键, 如 access_token, ticket
+        :return: (凭证, 到期时间戳)
+        """
+        value, expires_at = self._read(name)
+        remaining = expires_at - time.time()
+        if value and remaining > self.refresh_margin:
+            self._count('hit')
+            return value, expires_at
+        if value and remaining > self.min_validity:
+            # 快到期: 一个进程提前刷新, 其它进程继续使用当前凭证
+            self._count('hit')
+            token = self._acquire(name, blocking=False)
+            if token is None:
+                return value, expires_at
+            try:
+                return self._refresh(name, fetch, value_key)
+            except Exception:
+                self._count('error')
+                logger.exception('refresh %s failed, using the current one' % name)
+                return value, expires_at
+            finally:
+                self._release(name, token)
+        self._count('miss')
+        token = self._acquire(name)
+        if token is None:
+            # 刷新的进程超时, 自己获取
+            self._count('wait')
+            return self._refresh(name, fetch, value_key)
+        try:
+            # 等待锁时可能已由其它进程刷新
+            value, expires_at = self._read(name)
+            if value and expires_at - time.time() > self.min_validity:
+                self._count('wait')
+                return value, expires_at
+            try:
+                return self._refresh(name, fetch, value_key)
+            except Exception:
+                self._count('error')
+                raise
+        finally:
+            self._release(name, token)
+
+    def invalidate(self, name, value):
+        """
+        凭证被微信拒绝(过期, 被其它应用刷新)时删除, 已被其它进程更新的凭证不删除
+        """
+        if self.session.get(name) == value:
+            self.session.delete(name)
+            self.session.delete('%s_expires_at' % name)
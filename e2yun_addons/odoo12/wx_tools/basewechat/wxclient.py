@@ -10,10 +10,18 @@ from werobot.client import check_error
 
 logger = logging.getLogger(__name__)
 
+WX_API_BASE = 'https://api.weixin.qq.com'
+
 
 class WxClient(Client):
+    # 共享的token缓存(TokenManager), 未设置时token只保存在session中
+    token_manager = None
 
     def request(self, method, url, **kwargs):
+        # 可配置API地址(API_BASE), 如本地模拟的微信服务器
+        api_base = self.config.get("API_BASE")
+        if api_base and url.startswith(WX_API_BASE):
+            url = api_base.rstrip('/') + url[len(WX_API_BASE):]
         if "params" not in kwargs:
             kwargs["params"] = {"access_token": self.token}
         if isinstance(kwargs.get("data", ""), dict):
@@ -36,9 +44,11 @@ class WxClient(Client):
                     WeChatErrorCode.INVALID_ACCESS_TOKEN.value,
                     WeChatErrorCode.EXPIRED_ACCESS_TOKEN.value):
                 logger.info('Access token expired, fetch a new one and retry request')
-                self.session.delete(self.access_token_key)
-                self.get_access_token()
-                access_token = self.session.get(self.access_token_key)
+                if self.token_manager:
+                    self.token_manager.invalidate(self.access_token_key, kwargs["params"].get("access_token"))
+                else:
+                    self.session.delete(self.access_token_key)
+                access_token = self.get_access_token()
                 logger.info('get new token %s' % access_token)
                 kwargs["params"] = {"access_token": access_token}
                 return super(WxClient, self).request(method=method, url=url, **kwargs)
@@ -54,6 +64,10 @@ class WxClient(Client):
 
         :return: 返回token
         """
+        if self.token_manager:
+            self._token, self.token_expires_at = self.token_manager.get(
+                self.access_token_key, self.grant_token, 'access_token')
+            return self._token
         self.token_expires_at = self.session.get(self.access_token_key_expires_at)
         self._token = self.session.get(self.access_token_key)
         if self._token and self.token_expires_at:
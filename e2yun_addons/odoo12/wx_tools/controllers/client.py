@@ -2,20 +2,17 @@
 import logging
 import time
 
-import redis
 from wechatpy.client import WeChatClient
 from wechatpy.client.api.jsapi import WeChatJSAPI
 from wechatpy.component import ComponentOAuth
 from wechatpy.oauth import WeChatOAuth
-from wechatpy.session.memorystorage import MemoryStorage
-from wechatpy.session.redisstorage import RedisStorage
 from wechatpy.utils import random_string
 from werobot.client import ClientException
 from werobot.logger import enable_pretty_logging
 
 from odoo import exceptions
-from odoo import fields
 from ..basewechat.base import EntryBase
+from ..basewechat.token_manager import TokenManager, get_session_storage
 from ..basewechat.werobot import WeRoBot
 
 _logger = logging.getLogger(__name__)
@@ -24,6 +21,8 @@ WxEnvDict = {}
 
 
 class WxEntry(EntryBase):
+    UUID_TABLE = 'wx_user'
+    UUID_KEY = 'openid'
 
     def __init__(self):
         robot = WeRoBot()
@@ -31,6 +30,7 @@ class WxEntry(EntryBase):
         robot.config["APP_SECRET"] = ""
         self.wxclient = robot.client
         self.wechatpy_client = None
+        self.token_manager = None
         self.robot = None
         self.subscribe_auto_msg = None
 
@@ -45,6 +45,8 @@ class WxEntry(EntryBase):
         if dbname in WxEnvDict:
             del WxEnvDict[dbname]
         WxEnvDict[dbname] = self
+        # 会话(uuid)在使用时从wx_user读取
+        self.dbname = dbname
 
         try:
             config = env['wx.config'].sudo().get_cur()
@@ -65,17 +67,19 @@ class WxEntry(EntryBase):
         self.wxclient.config["APP_ID"] = self.wx_appid
         self.wxclient.config["APP_SECRET"] = self.wx_AppSecret
         self.wxclient.config["server_url"] = self.server_url
+        self.wxclient.config["API_BASE"] = Param.get_param('wx_api_base') or ''
 
         if not self.session_storage:
-            session_storage = MemoryStorage()
             _logger.info("启用MemoryStorage")
         else:
             _logger.info("启用RedisStorage%s" % self.wx_appid)
-            db = redis.Redis(host=self.session_storage, port=6379)
-            session_storage = RedisStorage(db, prefix=self.wx_appid)
+        # redis连接池及内存存储在进程内共享, 重新init不会丢失token
+        session_storage = get_session_storage(self.session_storage, self.wx_appid)
+        self.token_manager = TokenManager(session_storage)
         try:
             #  获取以前的token是否需要获取新的Token AccessToken
             self.wxclient.session = session_storage
+            self.wxclient.token_manager = self.token_manager
             # self.wxclient._token = session_storage.get(self.access_token_key)
             _ = self.wxclient.token
         except Exception as e:
@@ -94,16 +98,6 @@ class WxEntry(EntryBase):
         except Exception as e:
             print(e)
             _logger.error("加载微信token错误。")
-        try:
-            users = env['wx.user'].sudo().search([('last_uuid', '!=', None)])
-            for obj in users:
-                if obj.last_uuid_time:
-                    self.recover_uuid(obj.openid, obj.last_uuid, fields.Datetime.from_string(obj.last_uuid_time))
-        except:
-            env.cr.rollback()
-            import traceback;
-            traceback.print_exc()
-        print('wx client init: %s %s' % (self.OPENID_UUID, self.UUID_OPENID))
 
     @property
     def access_token_key(self):
@@ -158,10 +152,17 @@ class WxEntry(EntryBase):
             except ClientException as e:
                 raise exceptions.UserError(u'发送voice失败 %s' % e)
 
+    def token_stats(self):
+        """
+        token缓存的命中, 未命中, 刷新, 等待, 失败次数
+        """
+        return self.token_manager and self.token_manager.stats() or {}
+
     def get_jsapi_ticket(self, url):
         us_client = self.wechatpy_client
         jsapi = WeChatJSAPI(us_client)
-        tick = jsapi.get_jsapi_ticket()
+        tick, _ = self.token_manager.get('{0}_jsapi_ticket'.format(self.wx_appid),
+                                         lambda: jsapi.get_ticket('jsapi'), 'ticket')
         noncestr = random_string()
         timestamp = str(int(time.time()))
         signature = jsapi.get_jsapi_signature(noncestr, tick, timestamp, url)
@@ -172,7 +173,7 @@ def wxenv(env):
     return WxEnvDict[env.cr.dbname]
 
 
-def send_template_message(self, user_id, template_id, data, url='', state='', url_type='in'):
+def template_message_url(self, url='', state='', url_type='in'):
     entry = wxenv(self.env)
     wxclient = entry.wxclient
     if url_type == 'USER':  # 用户URL 直接 转到URL
@@ -182,7 +183,13 @@ def send_template_message(self, user_id, template_id, data, url='', state='', ur
                                  redirect_uri=url, scope='snsapi_userinfo', state=state)
         url = wxoauth.authorize_url
         logging.info(wxoauth.authorize_url)
-    return wxclient.send_template_message(user_id, template_id, data, url)
+    return url
+
+
+def send_template_message(self, user_id, template_id, data, url='', state='', url_type='in'):
+    entry = wxenv(self.env)
+    url = template_message_url(self, url, state, url_type)
+    return entry.wxclient.send_template_message(user_id, template_id, data, url)
 
 
 def get_user_info(self, code, state='login'):
@@ -19,6 +19,7 @@ from . import wx_config
 from . import wx_config_model
 from . import wx_confirm_wizard
 from . import wx_media
+from . import wx_message_queue
 from . import wx_par_config
 from . import wx_sale_order
 from . import wx_send_mass
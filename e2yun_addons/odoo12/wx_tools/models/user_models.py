@@ -3,9 +3,13 @@
 import datetime
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 import pytz
+from psycopg2.extras import execute_values
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
@@ -15,6 +19,10 @@ from ..rpc import corp_client
 
 _logger = logging.getLogger(__name__)
 
+# 同步公众号用户: 批量获取用户信息接口每次最多100个openid, 并发请求数
+SYNC_BATCH_SIZE = 100
+SYNC_WORKERS = 4
+
 
 class wx_user(models.Model):
     _name = 'wx.user'
@@ -36,7 +44,7 @@ class wx_user(models.Model):
     subscribe_time = fields.Char(u'关注时间', )
 
     headimg = fields.Html(compute='_get_headimg', string=u'头像')
-    last_uuid = fields.Char('会话ID')
+    last_uuid = fields.Char('会话ID', index=True)
     user_id = fields.Many2one('res.users', '关联本系统用户')
     last_uuid_time = fields.Datetime('会话ID时间')
 
@@ -56,48 +64,101 @@ class wx_user(models.Model):
             })
 
     @api.model
-    def sync(self):
+    def sync(self, resume=True):
+        """
+        同步公众号用户: 按页拉取关注者, 每页的用户信息用批量接口(每次100个openid)并发获取, 然后批量写入。
+        每页处理完提交一次并记录next_openid, 中断后再次同步从记录的位置继续。
+        :param resume: 是否从上次中断的位置继续
+        """
         entry = client.wxenv(self.env)
-        next_openid = 'init'
+        Param = self.env['ir.config_parameter'].sudo()
+        next_openid = resume and Param.get_param('wx_user_sync_next_openid') or None
+        testing = getattr(threading.currentThread(), 'testing', False)
+        self.env.cr.execute("SELECT openid, id FROM wx_user WHERE openid IS NOT NULL")
+        openid_ids = dict(self.env.cr.fetchall())
+        group_list = [str(e.group_id) for e in self.env['wx.user.group'].search([])]
+        g_flag = True
         c_total = 0
         c_flag = 0
-        g_flag = True
-        objs = self.env['wx.user.group'].search([])
-        group_list = [e.group_id for e in objs]
-        while next_openid:
-            if next_openid == 'init': next_openid = None
-            from werobot.client import ClientException
-            try:
-                followers_dict = entry.wxclient.get_followers(next_openid)
-            except ClientException as e:
-                raise ValidationError(u'微信服务请求异常，异常信息: %s' % e)
-            c_total = followers_dict['total']
-            m_count = followers_dict['count']
-            next_openid = followers_dict['next_openid']
-            _logger.info('get %s users' % m_count)
-            if next_openid:
-                m_openids = followers_dict['data']['openid']
-                for openid in m_openids:
-                    c_flag += 1
-                    _logger.info('total %s users, now sync the %srd %s .' % (c_total, c_flag, openid))
-                    rs = self.search([('openid', '=', openid)])
-                    if rs.exists():
-                        info = entry.wxclient.get_user_info(openid)
-                        info['group_id'] = str(info['groupid'])
-                        if g_flag and info['group_id'] not in group_list:
-                            self.env['wx.user.group'].sync()
-                            g_flag = False
-                        rs.write(info)
-                    else:
-                        info = entry.wxclient.get_user_info(openid)
-                        info['group_id'] = str(info['groupid'])
-                        if g_flag and info['group_id'] not in group_list:
-                            self.env['wx.user.group'].sync()
-                            g_flag = False
-                        self.create(info)
-
+        start_time = time.time()
+        from werobot.client import ClientException
+        with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+            while True:
+                try:
+                    followers_dict = entry.wxclient.get_followers(next_openid)
+                except ClientException as e:
+                    raise ValidationError(u'微信服务请求异常，异常信息: %s' % e)
+                c_total = followers_dict['total']
+                m_openids = followers_dict.get('data', {}).get('openid', [])
+                if not m_openids:
+                    break
+                chunks = [m_openids[i:i + SYNC_BATCH_SIZE] for i in range(0, len(m_openids), SYNC_BATCH_SIZE)]
+                try:
+                    infos = []
+                    for res in executor.map(entry.wxclient.get_users_info, chunks):
+                        infos += res.get('user_info_list', [])
+                except ClientException as e:
+                    raise ValidationError(u'微信服务请求异常，异常信息: %s' % e)
+                if g_flag and any(str(info.get('groupid')) not in group_list for info in infos if 'groupid' in info):
+                    self.env['wx.user.group'].sync()
+                    g_flag = False
+                self._upsert_users(infos, openid_ids)
+                c_flag += len(m_openids)
+                next_openid = followers_dict.get('next_openid')
+                Param.set_param('wx_user_sync_next_openid', next_openid or '')
+                if not testing:
+                    self.env.cr.commit()
+                _logger.info('sync users: %s/%s, %.1f users/s' % (
+                    c_flag, c_total, c_flag / max(time.time() - start_time, 0.001)))
+                if not next_openid:
+                    break
+        Param.set_param('wx_user_sync_next_openid', '')
+        self.invalidate_cache()
         _logger.info('sync total: %s' % c_total)
 
+    @api.model
+    def _upsert_users(self, infos, openid_ids):
+        """
+        批量写入用户信息(INSERT ... ON CONFLICT), 按openid新建或更新
+        :param infos: 微信批量接口返回的用户信息
+        :param openid_ids: 已有用户 openid: id, 新建的用户会加入
+        """
+        if not infos:
+            return
+        columns = ['openid', 'subscribe', 'nickname', 'sex', 'city', 'province', 'country', 'headimgurl',
+                   'subscribe_time', 'group_id']
+        now = fields.Datetime.now()
+        rows = []
+        for info in infos:
+            sex = info.get('sex')
+            rows.append((
+                info['openid'],
+                bool(info.get('subscribe')),
+                info.get('nickname'),
+                sex in (1, 2) and sex or None,
+                info.get('city'),
+                info.get('province'),
+                info.get('country'),
+                info.get('headimgurl'),
+                info.get('subscribe_time') and str(info['subscribe_time']) or None,
+                'groupid' in info and str(info['groupid']) or '0',
+                self.env.uid, now, self.env.uid, now,
+            ))
+        query = """
+            INSERT INTO wx_user ({columns}, create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (openid) DO UPDATE SET {updates},
+                write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+            RETURNING openid, id
+        """.format(columns=', '.join(columns),
+                   updates=', '.join('%s = EXCLUDED.%s' % (col, col) for col in columns[1:]))
+        # 一条语句写入整页, 同一页内openid不重复
+        execute_values(self.env.cr._obj, query, rows, page_size=len(rows))
+        result = dict(self.env.cr.fetchall())
+        created = len(set(result) - set(openid_ids))
+        openid_ids.update(result)
+        _logger.info('sync users: %s created, %s updated' % (created, len(result) - created))
+
     @api.model
     def sync_confirm(self):
         new_context = dict(self._context) or {}
@@ -199,24 +260,38 @@ class wx_user(models.Model):
 
     @api.multi
     def send_message(self, partner=None, msg='', user=None, partner_id=None, user_id=None):
-        if partner:
-            if partner.wx_user_id.openid:
-                client.send_text(self, partner.wx_user_id.openid, msg)
-            else:
+        openids = self._get_recipient_openids(partner=partner, user=user, partner_id=partner_id, user_id=user_id)
+        self.env['wx.message.queue'].enqueue([{'openid': openid, 'msg_type': 'text', 'text': msg}
+                                              for openid in openids])
+
+    @api.model
+    def _get_recipient_openids(self, partner=None, user=None, partner_id=None, user_id=None):
+        """
+        消息接收人的openid, partner和user可以是多条记录(关联的微信用户一次读取),
+        只有一个接收人且没有绑定微信时报错, 多个接收人时跳过没有绑定微信的接收人
+        """
+        if partner_id:
+            partner = (partner or self.env['res.partner']) | self.env['res.partner'].sudo().browse(partner_id)
+        if user_id:
+            user = (user or self.env['res.users']) | self.env['res.users'].sudo().browse(user_id)
+        openids = []
+        for recipient in (partner or []):
+            if recipient.wx_user_id.openid:
+                openids.append(recipient.wx_user_id.openid)
+            elif len(partner) == 1:
                 raise UserError(u'发送失败,客户没有绑定微信')
-        if user:
-            if user.wx_user_id.openid:
-                client.send_text(self, user.wx_user_id.openid, msg)
-            elif user.partner_id.wx_user_id.openid:
-                client.send_text(self, user.partner_id.wx_user_id.openid, msg)
             else:
+                _logger.info(u'%s 没有绑定微信, 不发送' % recipient.display_name)
+        for recipient in (user or []):
+            if recipient.wx_user_id.openid:
+                openids.append(recipient.wx_user_id.openid)
+            elif recipient.partner_id.wx_user_id.openid:
+                openids.append(recipient.partner_id.wx_user_id.openid)
+            elif len(user) == 1:
                 raise UserError(u'发送失败,客户没有绑定微信')
-        if partner_id:
-            partner_ = self.env['res.partner'].sudo().browse(partner_id)
-            self.send_message(partner=partner_, msg=msg)
-        if user_id:
-            user_ = self.env['res.users'].sudo().browse(user_id)
-            self.send_message(user=user_, msg=msg)
+            else:
+                _logger.info(u'%s 没有绑定微信, 不发送' % recipient.display_name)
+        return openids
 
     # ------------------------------------------------------
     # 发送微信公众号模板信息
@@ -260,10 +335,6 @@ class wx_user(models.Model):
                               partner_appcode=None):
         if isinstance(data, str):
             data = json.loads(data)
-        if not template_id:
-            configer_para = self.env["wx.paraconfig"].sudo().search([('paraconfig_name', '=', template_name)])
-            if configer_para:
-                template_id = configer_para[0].paraconfig_value
         if url_type == 'in':  # 内部URL需要登验证
             url = client.wxenv(
                 self.env).server_url + '/web/login?usercode='+usercode+'&codetype=wx&redirect=' + url
@@ -272,31 +343,22 @@ class wx_user(models.Model):
         else:   # 其它就用当前的服务器的URL +发送URL
             url = client.wxenv(
                 self.env).server_url + url
+        # 消息写入发送队列, 模板名称在发送时按批查找模板ID
+        message = {'msg_type': 'template', 'template_id': template_id,
+                   'template_name': not template_id and template_name or False,
+                   'data': data, 'url': url, 'url_type': url_type}
+        messages = []
         if openid:
-            client.send_template_message(self, openid, template_id, data, url, url_type=url_type)
-        if partner:
-            if partner.wx_user_id.openid:
-                client.send_template_message(self, partner.wx_user_id.openid, template_id, data, url, url_type=url_type)
-            else:
-                raise UserError(u'发送失败,客户没有绑定微信')
-        if user:
-            if user.wx_user_id.openid:
-                client.send_template_message(self, user.wx_user_id.openid, template_id, data, url, url_type=url_type)
-            elif user.partner_id.wx_user_id.openid:
-                client.send_template_message(self, user.partner_id.wx_user_id.openid, template_id, data, url, url_type=url_type)
-            else:
-                raise UserError(u'发送失败,客户没有绑定微信')
+            messages.append(dict(message, openid=openid))
+        for openid_ in self._get_recipient_openids(partner=partner, user=user, partner_id=partner_id,
+                                                   user_id=user_id):
+            messages.append(dict(message, openid=openid_))
         if partner_appcode:
             partner_ = self.env['res.partner'].sudo().search([('app_code', '=', partner_appcode)])
             if partner_:
-                url = url + "&ss_wx_code=%s" % partner_.wx_user_id.openid
-                client.send_template_message(self, partner_.wx_user_id.openid, template_id, data, url, url_type=url_type)
-        if partner_id:
-            partner_ = self.env['res.partner'].sudo().browse(partner_id)
-            self.send_template_message(data,template_id, url, partner=partner_, url_type=url_type)
-        if user_id:
-            user_ = self.env['res.users'].sudo().browse(user_id)
-            self.send_template_message(data,template_id, url, user=user_, url_type=url_type)
+                messages.append(dict(message, openid=partner_.wx_user_id.openid,
+                                     url=url + "&ss_wx_code=%s" % partner_.wx_user_id.openid))
+        self.env['wx.message.queue'].enqueue(messages)
         return ""
 
     @api.multi
@@ -421,7 +483,7 @@ class wx_corpuser(models.Model):
     extattr = fields.Char('扩展属性', )
 
     avatarimg = fields.Html(compute='_get_avatarimg', string=u'头像')
-    last_uuid = fields.Char('会话ID')
+    last_uuid = fields.Char('会话ID', index=True)
     last_uuid_time = fields.Datetime('会话ID时间')
 
     # department, enable, english_name, hide_mobile, isleader, order, qr_code, telephone
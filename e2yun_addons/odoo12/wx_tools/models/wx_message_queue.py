@@ -0,0 +1,196 @@
+# -*-coding:utf-8-*-
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from odoo import models, fields, api
+from ..controllers import client
+
+_logger = logging.getLogger(__name__)
+
+# 不再重试的微信错误码: 不合法的openid, 用户未关注, 不合法的模板ID, 参数错误, 用户拒收
+PERMANENT_ERRCODES = ('40003', '43004', '40037', '47003', '43101')
+
+
+class TokenBucket(object):
+    """
+    令牌桶限速: 每秒rate个令牌, 最多累积capacity个, 多线程共用
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        取一个令牌, 没有令牌时等待
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class WxMessageQueue(models.Model):
+    _name = 'wx.message.queue'
+    _description = u'微信消息发送队列'
+    _order = 'id desc'
+
+    openid = fields.Char(u'用户标志', required=True, index=True)
+    msg_type = fields.Selection([('template', u'模板消息'), ('text', u'文本消息')], string=u'消息类型',
+                                required=True, default='template')
+    template_id = fields.Char(u'模板ID')
+    template_name = fields.Char(u'模板名称', help=u'未填写模板ID时, 发送时从微信参数配置中查找')
+    data = fields.Text(u'模板数据')
+    url = fields.Char(u'URL')
+    url_type = fields.Char(u'URL类型', default='in')
+    url_state = fields.Char(u'URL参数state')
+    text = fields.Text(u'消息文本')
+    state = fields.Selection([('pending', u'待发送'), ('sent', u'已发送'), ('failed', u'发送失败')],
+                             string=u'状态', required=True, default='pending', index=True)
+    attempts = fields.Integer(u'发送次数', default=0)
+    next_try = fields.Datetime(u'下次发送时间', default=fields.Datetime.now, index=True)
+    sent_time = fields.Datetime(u'发送时间')
+    error = fields.Text(u'错误信息')
+
+    @api.model
+    def enqueue(self, vals_list):
+        """
+        消息加入队列, 由process_queue在事务提交后发送
+        :param vals_list: 消息的值列表, data可以是dict
+        """
+        for vals in vals_list:
+            if isinstance(vals.get('data'), dict):
+                vals['data'] = json.dumps(vals['data'], ensure_ascii=False)
+        return self.sudo().create(vals_list)
+
+    @api.model
+    def process_queue(self, batch_size=200, workers=4, rate=20, max_attempts=5, time_limit=50):
+        """
+        发送队列中的消息: 每批batch_size条, workers个线程并发请求, 每秒最多rate条,
+        失败的消息按指数退避重试, max_attempts次后标记为发送失败。每批发送后提交。
+        微信接口地址可配置(wx_api_base), 可以对本地模拟的微信服务器测试。
+
+        Called from a cron.
+        """
+        bucket = TokenBucket(rate)
+        stop_time = time.time() + time_limit
+        testing = getattr(threading.currentThread(), 'testing', False)
+        entry = client.wxenv(self.env)
+        c_sent = c_failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while time.time() < stop_time:
+                # 锁定本批消息, 同时运行的其它发送跳过这些消息
+                self.env.cr.execute("""
+                    SELECT id FROM wx_message_queue
+                     WHERE state = 'pending' AND (next_try IS NULL OR next_try <= now() at time zone 'UTC')
+                  ORDER BY id
+                     LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                """, (batch_size,))
+                ids = [row[0] for row in self.env.cr.fetchall()]
+                if not ids:
+                    break
+                messages = self.browse(ids)
+                template_ids = messages._resolve_template_ids()
+                payloads = [(message.id, message._prepare_payload(template_ids)) for message in messages]
+
+                def send(payload):
+                    if payload is None:
+                        return u'未找到模板ID'
+                    bucket.acquire()
+                    try:
+                        if payload[0] == 'text':
+                            entry.wxclient.send_text_message(*payload[1:])
+                        else:
+                            entry.wxclient.send_template_message(*payload[1:])
+                    except Exception as e:
+                        return str(e) or e.__class__.__name__
+
+                results = executor.map(send, [payload for message_id, payload in payloads])
+                sent, failed = self._save_results(messages, results, max_attempts)
+                c_sent += sent
+                c_failed += failed
+                if not testing:
+                    self.env.cr.commit()
+                _logger.info('wx message queue: %s sent, %s failed' % (c_sent, c_failed))
+                if len(ids) < batch_size:
+                    break
+        return True
+
+    @api.multi
+    def _resolve_template_ids(self):
+        """
+        一次查询本批消息的模板名称对应的模板ID
+        :return: (dict) 模板名称: 模板ID
+        """
+        names = list(set(self.filtered(lambda m: not m.template_id and m.template_name).mapped('template_name')))
+        if not names:
+            return {}
+        paras = self.env['wx.paraconfig'].sudo().search([('paraconfig_name', 'in', names)], order='id desc')
+        return {para.paraconfig_name: para.paraconfig_value for para in paras}
+
+    @api.multi
+    def _prepare_payload(self, template_ids):
+        """
+        :return: 发送接口的参数: ('text', openid, text) 或 ('template', openid, template_id, data, url),
+            找不到模板ID时返回None
+        """
+        self.ensure_one()
+        if self.msg_type == 'text':
+            return 'text', self.openid, self.text
+        template_id = self.template_id or template_ids.get(self.template_name)
+        if not template_id:
+            return None
+        url = client.template_message_url(self, self.url or '', self.url_state or '', self.url_type)
+        return 'template', self.openid, template_id, json.loads(self.data or '{}'), url
+
+    @api.model
+    def _save_results(self, messages, results, max_attempts):
+        """
+        记录发送结果, 成功的一次写入
+        :param results: 每条消息的错误信息, 成功为None
+        :return: (成功数, 失败数)
+        """
+        now = fields.Datetime.now()
+        sent_ids = []
+        failed = 0
+        for message, error in zip(messages, results):
+            if error is None:
+                sent_ids.append(message.id)
+                continue
+            failed += 1
+            attempts = message.attempts + 1
+            permanent = error.split(':')[0].strip() in PERMANENT_ERRCODES or error == u'未找到模板ID'
+            vals = {'attempts': attempts, 'error': error}
+            if permanent or attempts >= max_attempts:
+                vals['state'] = 'failed'
+            else:
+                # 2, 4, 8... 分钟后重试, 最多1小时
+                vals['next_try'] = now + timedelta(minutes=min(2 ** attempts, 60))
+            message.write(vals)
+        if sent_ids:
+            self.env.cr.execute("""
+                UPDATE wx_message_queue
+                   SET state = 'sent', sent_time = %s, error = NULL, attempts = attempts + 1,
+                       write_uid = %s, write_date = %s
+                 WHERE id IN %s
+            """, (now, self.env.uid, now, tuple(sent_ids)))
+            self.browse(sent_ids).invalidate_cache()
+        return len(sent_ids), failed
+
+    @api.multi
+    def action_retry(self):
+        self.write({'state': 'pending', 'attempts': 0, 'next_try': fields.Datetime.now(), 'error': False})
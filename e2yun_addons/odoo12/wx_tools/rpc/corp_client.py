@@ -4,7 +4,6 @@ import logging
 
 from wechatpy.enterprise import WeChatClient
 
-from odoo import fields
 from ..basewechat.base import EntryBase
 
 _logger = logging.getLogger(__name__)
@@ -13,6 +12,8 @@ _logger = logging.getLogger(__name__)
 CorpEnvDict = {}
 
 class CorpEntry(EntryBase):
+    UUID_TABLE = 'wx_corpuser'
+    UUID_KEY = 'userid'
 
     def __init__(self):
 
@@ -158,6 +159,8 @@ class CorpEntry(EntryBase):
     def init(self, env):
         global CorpEnvDict
         CorpEnvDict[env.cr.dbname] = self
+        # 会话(uuid)在使用时从wx_corpuser读取
+        self.dbname = env.cr.dbname
 
         Param = env['ir.config_parameter'].sudo()
 
@@ -179,16 +182,6 @@ class CorpEntry(EntryBase):
         self.init_txl_client(Corp_Id, Corp_Secret)
         self.current_agent = Corp_Agent
 
-        try:
-            users = env['wx.corpuser'].sudo().search([('last_uuid','!=',None)])
-            for obj in users:
-                if obj.last_uuid_time:
-                    self.recover_uuid(obj.userid, obj.last_uuid, fields.Datetime.from_string(obj.last_uuid_time))
-        except:
-            env.cr.rollback()
-            import traceback;traceback.print_exc()
-
-        print('corp client init: %s %s'%(self.OPENID_UUID, self.UUID_OPENID))
 
 def corpenv(env):
     return CorpEnvDict[env.cr.dbname]
@@ -4,7 +4,6 @@ import logging
 from wechatpy.client import WeChatClient
 from wechatpy.crypto import WeChatCrypto
 
-from odoo import fields
 from ..basewechat.base import EntryBase
 
 _logger = logging.getLogger(__name__)
@@ -16,6 +15,8 @@ class WxEntry(EntryBase):
     '''
     目前仅公众号发送模板消息使用
     '''
+    UUID_TABLE = 'wx_user'
+    UUID_KEY = 'openid'
 
     def __init__(self):
         self.client = None
@@ -49,6 +50,8 @@ class WxEntry(EntryBase):
         if dbname in WxEnvDict:
             del WxEnvDict[dbname]
         WxEnvDict[dbname] = self
+        # 会话(uuid)在使用时从wx_user读取
+        self.dbname = dbname
 
         Param = env['ir.config_parameter'].sudo()
         self.wx_token = Param.get_param('wx_token') or ''
@@ -65,16 +68,6 @@ class WxEntry(EntryBase):
         except:
             _logger.error(u'初始化微信公众号客户端实例失败，请在微信对接配置中填写好相关信息！')
 
-        try:
-            users = env['wx.user'].sudo().search([('last_uuid','!=',None)])
-            for obj in users:
-                if obj.last_uuid_time:
-                    self.recover_uuid(obj.openid, obj.last_uuid, fields.Datetime.from_string(obj.last_uuid_time))
-        except:
-            env.cr.rollback()
-            import traceback;traceback.print_exc()
-
-        print('wx client init: %s %s'%(self.OPENID_UUID, self.UUID_OPENID))
 
 def wxenv(env):
     return WxEnvDict[env.cr.dbname]